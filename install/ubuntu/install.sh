@@ -188,10 +188,15 @@ create_initial_admin() {
 install_systemd_units() {
   install -m 0644 "${APP_ROOT}/install/ubuntu/systemd/trashyneighbors.service" /etc/systemd/system/trashyneighbors.service
   install -m 0644 "${APP_ROOT}/install/ubuntu/systemd/trashyneighbors-admin.service" /etc/systemd/system/trashyneighbors-admin.service
+  install -m 0644 "${APP_ROOT}/install/ubuntu/systemd/trashyneighbors-trending.service" /etc/systemd/system/trashyneighbors-trending.service
+  install -m 0644 "${APP_ROOT}/install/ubuntu/systemd/trashyneighbors-trending.timer" /etc/systemd/system/trashyneighbors-trending.timer
+  install -m 0644 "${APP_ROOT}/install/ubuntu/systemd/trashyneighbors-nsfw.service" /etc/systemd/system/trashyneighbors-nsfw.service
 
   systemctl daemon-reload
   systemctl enable --now trashyneighbors.service
   systemctl enable --now trashyneighbors-admin.service
+  systemctl enable --now trashyneighbors-trending.timer
+  systemctl enable --now trashyneighbors-nsfw.service
 }
 
 install_nginx() {
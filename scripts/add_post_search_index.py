@@ -0,0 +1,35 @@
+from sqlalchemy import inspect, text
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+
+# create_all() only builds ft_post_title_story with a new post table; an
+# existing database needs it added before /api/search can MATCH against it.
+# The first FULLTEXT index on a table rebuilds it, so run this off-peak.
+
+
+def _ensure_index():
+    indexes = {i["name"] for i in inspect(db.engine).get_indexes("post")}
+    if "ft_post_title_story" in indexes:
+        return False
+    db.session.execute(
+        text(
+            "ALTER TABLE post "
+            "ADD FULLTEXT INDEX ft_post_title_story (title, story_text)"
+        )
+    )
+    db.session.commit()
+    return True
+
+
+def main():
+    app = create_app()
+
+    with app.app_context():
+        added = _ensure_index()
+
+    print("Search index added" if added else "Search index already present")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import io
+
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import bindparam, inspect, text, update
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.models import ImageBlob, PostImage
+from trashyneighbors.phash import dhash, to_signed
+
+
+def _ensure_column():
+    columns = {c["name"] for c in inspect(db.engine).get_columns("post_image")}
+    if "phash" not in columns:
+        db.session.execute(text("ALTER TABLE post_image ADD COLUMN phash BIGINT NULL"))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        _ensure_column()
+
+        stmt = (
+            update(PostImage.__table__)
+            .where(PostImage.__table__.c.image_id == bindparam("b_image_id"))
+            .values(phash=bindparam("b_phash"))
+        )
+
+        last_id = 0
+        total = 0
+        while True:
+            ids = [
+                r.image_id
+                for r in db.session.query(PostImage.image_id)
+                .filter(PostImage.image_id > last_id, PostImage.phash.is_(None))
+                .order_by(PostImage.image_id.asc())
+                .limit(args.batch_size)
+                .all()
+            ]
+            if not ids:
+                break
+
+            updates = []
+            for image_id in ids:
+                # The stored full image is already oriented and resized, as
+                # at ingest; one blob in memory at a time.
+                data = (
+                    db.session.query(ImageBlob.image_bytes)
+                    .join(
+                        PostImage,
+                        PostImage.content_sha256 == ImageBlob.content_sha256,
+                    )
+                    .filter(PostImage.image_id == image_id)
+                    .scalar()
+                )
+                try:
+                    with Image.open(io.BytesIO(data)) as img:
+                        value = dhash(img)
+                except (UnidentifiedImageError, OSError) as exc:
+                    print(f"image {image_id}: skipped ({exc})")
+                    continue
+                updates.append({"b_image_id": image_id, "b_phash": to_signed(value)})
+
+            if updates:
+                db.session.execute(stmt, updates)
+            db.session.commit()
+
+            last_id = ids[-1]
+            total += len(updates)
+            print(f"Hashed {total} images (through image_id {last_id})")
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
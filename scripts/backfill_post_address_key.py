@@ -0,0 +1,92 @@
+import argparse
+
+from sqlalchemy import bindparam, inspect, text, update
+
+from trashyneighbors import create_app
+from trashyneighbors.address import address_hash, normalize_address
+from trashyneighbors.extensions import db
+from trashyneighbors.models import Post
+
+COLUMNS = (
+    ("address_key", "VARCHAR(255) NULL"),
+    ("address_hash", "VARCHAR(64) NULL"),
+)
+INDEXES = (
+    ("ix_post_address_hash", "address_hash"),
+    ("idx_post_zip_address", "zip_code, address_key"),
+)
+
+
+def _ensure_columns():
+    inspector = inspect(db.engine)
+    columns = {c["name"] for c in inspector.get_columns("post")}
+    indexes = {i["name"] for i in inspector.get_indexes("post")}
+    missing = [
+        f"ADD COLUMN {name} {ddl}" for name, ddl in COLUMNS if name not in columns
+    ]
+    missing += [
+        f"ADD INDEX {name} ({cols})" for name, cols in INDEXES if name not in indexes
+    ]
+    if missing:
+        db.session.execute(text("ALTER TABLE post " + ", ".join(missing)))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Recompute every row, not only rows missing an address key.",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        _ensure_columns()
+
+        stmt = (
+            update(Post.__table__)
+            .where(Post.__table__.c.post_id == bindparam("b_post_id"))
+            .values(
+                address_key=bindparam("b_address_key"),
+                address_hash=bindparam("b_address_hash"),
+            )
+        )
+
+        last_id = 0
+        total = 0
+        while True:
+            q = db.session.query(Post.post_id, Post.street_address).filter(
+                Post.post_id > last_id
+            )
+            if not args.all:
+                q = q.filter(Post.address_key.is_(None))
+            rows = q.order_by(Post.post_id.asc()).limit(args.batch_size).all()
+            if not rows:
+                break
+
+            params = []
+            for post_id, street_address in rows:
+                key = normalize_address(street_address)
+                params.append(
+                    {
+                        "b_post_id": post_id,
+                        "b_address_key": key,
+                        "b_address_hash": address_hash(key),
+                    }
+                )
+            db.session.execute(stmt, params)
+            db.session.commit()
+
+            last_id = rows[-1].post_id
+            total += len(rows)
+            print(f"Backfilled {total} posts (through post_id {last_id})")
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
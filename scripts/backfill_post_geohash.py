@@ -0,0 +1,81 @@
+import argparse
+
+from sqlalchemy import bindparam, inspect, text, update
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.geo import encode_geohash
+from trashyneighbors.models import Post
+
+
+def _ensure_columns():
+    inspector = inspect(db.engine)
+    columns = {c["name"] for c in inspector.get_columns("post")}
+    if "geohash" not in columns:
+        db.session.execute(text("ALTER TABLE post ADD COLUMN geohash VARCHAR(12) NULL"))
+    indexes = {i["name"] for i in inspector.get_indexes("post")}
+    if "idx_post_geohash" not in indexes:
+        db.session.execute(
+            text(
+                "ALTER TABLE post "
+                "ADD INDEX idx_post_geohash (geohash, latitude, longitude)"
+            )
+        )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        _ensure_columns()
+
+        stmt = (
+            update(Post.__table__)
+            .where(Post.__table__.c.post_id == bindparam("b_post_id"))
+            .values(geohash=bindparam("b_geohash"))
+        )
+
+        last_id = 0
+        total = 0
+        while True:
+            rows = (
+                db.session.query(Post.post_id, Post.latitude, Post.longitude)
+                .filter(
+                    Post.post_id > last_id,
+                    Post.geohash.is_(None),
+                    Post.latitude.isnot(None),
+                    Post.longitude.isnot(None),
+                )
+                .order_by(Post.post_id.asc())
+                .limit(args.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            db.session.execute(
+                stmt,
+                [
+                    {
+                        "b_post_id": post_id,
+                        "b_geohash": encode_geohash(float(lat), float(lon)),
+                    }
+                    for post_id, lat, lon in rows
+                ],
+            )
+            db.session.commit()
+
+            last_id = rows[-1].post_id
+            total += len(rows)
+            print(f"Backfilled {total} posts (through post_id {last_id})")
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
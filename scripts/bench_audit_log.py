@@ -0,0 +1,151 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, delete, func, make_url, select
+from sqlalchemy.orm import Session
+
+from trashyneighbors.audit import AuditWriter, encode_payload
+from trashyneighbors.config import load_site_config
+from trashyneighbors.extensions import db
+from trashyneighbors.models import AuditEventType, AuditLog
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/120.0"
+
+
+def _scratch_engine(args):
+    if args.url:
+        return create_engine(args.url)
+    url = make_url(load_site_config()["SQLALCHEMY_DATABASE_URI"])
+    if url.database == args.database:
+        raise SystemExit("Refusing to benchmark against the live database")
+    return create_engine(url.set(database=args.database), pool_size=args.threads + 2)
+
+
+def _payload(n):
+    return {"old_value": None if n % 3 else -1, "new_value": 1}
+
+
+def _orm_event(session, n):
+    # The previous _audit(): one ORM object per event, flushed by the
+    # request's commit.
+    session.add(
+        AuditLog(
+            event_type=AuditEventType.VOTE.value,
+            ip_address="203.0.113.7",
+            user_agent=USER_AGENT,
+            entity_type="post",
+            entity_id=str(n),
+            event_json=json.dumps(
+                _payload(n), ensure_ascii=False, separators=(",", ":")
+            ),
+            created_at=datetime.utcnow(),
+        )
+    )
+    session.commit()
+
+
+def _row(n):
+    return {
+        "event_type": AuditEventType.VOTE.value,
+        "actor_user_id": None,
+        "ip_address": "203.0.113.7",
+        "user_agent": USER_AGENT,
+        "entity_type": "post",
+        "entity_id": str(n),
+        "event_json": encode_payload(_payload(n)),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _run(engine, args, mode, writer=None):
+    # `threads` request threads each record `events` events; returns
+    # (events/s including the final drain, per-event latency samples).
+    samples = []
+
+    def worker(offset):
+        local = []
+        with Session(engine) as session:
+            for n in range(offset, offset + args.events):
+                t0 = time.perf_counter()
+                if mode == "orm":
+                    _orm_event(session, n)
+                else:
+                    writer.submit([_row(n)])
+                local.append(time.perf_counter() - t0)
+        samples.extend(local)
+
+    threads = [
+        threading.Thread(target=worker, args=(i * args.events,))
+        for i in range(args.threads)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if writer is not None:
+        writer.flush()
+    elapsed = time.perf_counter() - t0
+    samples.sort()
+    return args.threads * args.events / elapsed, samples
+
+
+def _report(name, rate, samples, extra=""):
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    print(
+        f"{name:<28} {rate:10.0f} events/s  request path p50 {p50:8.1f}us "
+        f"p99 {p99:8.1f}us{extra}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--database",
+        help="Scratch database on the configured server; tables are created.",
+    )
+    target.add_argument("--url", help="Scratch database URL instead.")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = _scratch_engine(args)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(delete(AuditLog.__table__))
+
+    print(f"{args.threads} threads x {args.events} events")
+    rate, samples = _run(engine, args, "orm")
+    _report("per-row ORM (previous path)", rate, samples)
+
+    writer = AuditWriter(
+        engine, args.queue_size, args.batch_size, args.flush_ms / 1000.0, 0.25
+    )
+    rate, samples = _run(engine, args, "buffered", writer)
+    _report(
+        "buffered group commit",
+        rate,
+        samples,
+        f"  {writer.written / max(writer.batches, 1):.0f} rows/batch, "
+        f"{writer.fallbacks} fallbacks",
+    )
+    writer.close()
+
+    with engine.connect() as conn:
+        rows = conn.execute(select(func.count()).select_from(AuditLog)).scalar()
+    expected = 2 * args.threads * args.events
+    print(f"Rows written: {rows} of {expected}")
+    if rows != expected:
+        raise SystemExit("Audit rows were lost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+from trashyneighbors.exif import SOI, XMP_HEADER, read_metadata, strip_metadata
+
+XMP_PACKET = (
+    '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF '
+    'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+    '<rdf:Description xmlns:exif="http://ns.adobe.com/exif/1.0/" '
+    'xmlns:xmp="http://ns.adobe.com/xap/1.0/" '
+    'exif:GPSLatitude="40,26.7717N" exif:GPSLongitude="79,58.9333W" '
+    'xmp:CreateDate="2024-05-01T10:20:30+02:00"/></rdf:RDF></x:xmpmeta>'
+)
+
+
+def _make_jpeg(path, width, height, quality):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = "BenchCam"
+    exif[0x8769] = {0x9003: "2024:05:01 10:20:30", 0x9011: "+02:00"}
+    exif[0x8825] = {
+        1: "N",
+        2: (40.0, 26.0, 46.302),
+        3: "W",
+        4: (79.0, 58.0, 56.0),
+    }
+    # Fractal detail plus sensor-like noise, so it compresses like a photo.
+    img = Image.effect_mandelbrot((width, height), (-2.0, -1.2, 1.0, 1.2), 64)
+    noise = Image.effect_noise((width, height), 24)
+    img = Image.merge("RGB", (img, noise, img.rotate(180)))
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality, exif=exif.tobytes())
+    data = out.getvalue()
+
+    payload = XMP_HEADER + XMP_PACKET.encode("utf-8")
+    xmp = b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+    with open(path, "wb") as f:
+        f.write(SOI + xmp + data[2:])
+    return os.path.getsize(path)
+
+
+def _time_runs(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return samples[len(samples) // 2], statistics.fmean(samples)
+
+
+def _report(name, runs, size, fn):
+    p50, mean = _time_runs(fn, runs)
+    print(
+        f"{name:<32} p50={p50 * 1000:9.3f}ms mean={mean * 1000:9.3f}ms "
+        f"{size / mean / 1e6:10.1f} MB/s"
+    )
+
+
+def _peak_kib(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--quality", type=int, default=92)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "src.jpg")
+        dst = os.path.join(tmp, "dst.jpg")
+        size = _make_jpeg(src, args.width, args.height, args.quality)
+        print(f"Source: {args.width}x{args.height} JPEG, {size} bytes")
+
+        def stream_read():
+            with open(src, "rb") as f:
+                return read_metadata(f)
+
+        def pillow_header_read():
+            with Image.open(src) as img:
+                exif = img.getexif()
+                return exif.get(0x0112), exif.get_ifd(0x8825)
+
+        def pillow_decode_read():
+            with Image.open(src) as img:
+                img.load()
+                exif = img.getexif()
+                return exif.get(0x0112), exif.get_ifd(0x8825)
+
+        def stream_strip():
+            with open(src, "rb") as f, open(dst, "wb") as out:
+                strip_metadata(f, out)
+
+        def pillow_reencode():
+            with Image.open(src) as img:
+                img.save(dst, "JPEG", quality=args.quality)
+
+        print(f"Metadata: {stream_read()}")
+        _report("read_metadata (stream)", args.runs, size, stream_read)
+        _report("Pillow getexif (headers)", args.runs, size, pillow_header_read)
+        _report("Pillow decode + getexif", args.runs, size, pillow_decode_read)
+        _report("strip_metadata (stream)", args.runs, size, stream_strip)
+        _report(
+            "Pillow decode + re-encode", max(1, args.runs // 4), size, pillow_reencode
+        )
+
+        stream_strip()
+        with Image.open(src) as a, Image.open(dst) as b:
+            if a.tobytes() != b.tobytes():
+                raise SystemExit("Stripped image decodes differently")
+        with open(dst, "rb") as f:
+            stripped = read_metadata(f)
+        print(f"Stripped: {os.path.getsize(dst)} bytes, metadata {stripped}")
+
+        print(f"Peak Python heap, read_metadata:   {_peak_kib(stream_read):10.1f} KiB")
+        print(f"Peak Python heap, strip_metadata:  {_peak_kib(stream_strip):10.1f} KiB")
+        # Pillow's pixel buffer lives outside the Python heap.
+        print(
+            f"Decoded RGB buffer, Pillow:        "
+            f"{args.width * args.height * 3 / 1024:10.1f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from trashyneighbors.cache import ByteLRUCache
+from trashyneighbors.imagecache import SharedImageCache
+
+# Rough stored sizes of each rendition of a listing photo.
+VARIANT_BYTES = {"thumb": 6000, "card": 22000, "medium": 90000, "full": 260000}
+# Listing pages mostly pull cards and thumbs.
+VARIANT_WEIGHTS = {"thumb": 4, "card": 8, "medium": 2, "full": 1}
+
+
+def _requests(seed, count, images, skew):
+    # Zipf-like image popularity, so a few hundred images take most traffic.
+    rng = random.Random(seed)
+    variants = list(VARIANT_WEIGHTS)
+    weights = list(VARIANT_WEIGHTS.values())
+    for _ in range(count):
+        image_id = min(int(rng.paretovariate(skew)), images)
+        yield image_id, rng.choices(variants, weights)[0]
+
+
+def _image(image_id, variant):
+    size = VARIANT_BYTES[variant] + image_id % 1000
+    return (image_id.to_bytes(8, "big") * (size // 8 + 1))[:size]
+
+
+def _worker(mode, path, cache_bytes, workers, seed, args):
+    if mode == "shared":
+        cache = SharedImageCache(path, cache_bytes, 1 << 20)
+    else:
+        # The per-worker LRU the other caches use, given the same host
+        # budget split between workers, or the whole budget each.
+        size = cache_bytes if mode == "private-full" else cache_bytes // workers
+        cache = ByteLRUCache(size)
+    hits = 0
+    hit_seconds = []
+    t0 = time.perf_counter()
+    for image_id, variant in _requests(seed, args.requests, args.images, args.skew):
+        etag = f"{image_id:x}-{variant}"
+        t1 = time.perf_counter()
+        if mode == "shared":
+            data = cache.get(image_id, variant, etag)
+        else:
+            data = cache.get((image_id, variant))
+        if data is not None:
+            hit_seconds.append(time.perf_counter() - t1)
+            hits += 1
+            continue
+        data = _image(image_id, variant)
+        if mode == "shared":
+            cache.put(image_id, variant, etag, data)
+        else:
+            cache.set((image_id, variant), data, len(data))
+    elapsed = time.perf_counter() - t0
+    hit_seconds.sort()
+    p50 = hit_seconds[len(hit_seconds) // 2] if hit_seconds else 0.0
+    p99 = hit_seconds[int(len(hit_seconds) * 0.99)] if hit_seconds else 0.0
+    return hits, elapsed, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--cache-mb", type=int, default=64)
+    parser.add_argument("--images", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    args = parser.parse_args()
+
+    cache_bytes = args.cache_mb << 20
+    print(
+        f"{args.workers} workers, {args.requests} requests each over "
+        f"{args.images} images, {args.cache_mb} MiB per host"
+    )
+    ctx = multiprocessing.get_context("fork")
+    # tmpfs, as in production.
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=shm) as tmp:
+        path = os.path.join(tmp, "images.cache")
+        for mode, host_bytes in (
+            ("shared", cache_bytes),
+            ("private-split", cache_bytes),
+            ("private-full", cache_bytes * args.workers),
+        ):
+            if mode == "shared":
+                # Created up front, so the workers race on lookups only.
+                SharedImageCache(path, cache_bytes, 1 << 20)
+            with ctx.Pool(args.workers) as pool:
+                results = pool.starmap(
+                    _worker,
+                    [
+                        (mode, path, cache_bytes, args.workers, seed, args)
+                        for seed in range(args.workers)
+                    ],
+                )
+            hits = sum(r[0] for r in results)
+            total = args.requests * args.workers
+            rate = sum(args.requests / r[1] for r in results)
+            p50 = max(r[2] for r in results)
+            p99 = max(r[3] for r in results)
+            print(
+                f"{mode:<14} host RAM {host_bytes >> 20:5d} MiB  "
+                f"hit ratio {hits / total:6.1%}  {rate:9.0f} lookups/s  "
+                f"hit p50 {p50 * 1e6:6.1f}us p99 {p99 * 1e6:6.1f}us"
+            )
+            if mode == "shared":
+                stats = SharedImageCache(path, cache_bytes, 1 << 20).stats()
+                print(
+                    f"{'':<14} {stats['entries']} entries, "
+                    f"{stats['used_bytes'] >> 20} MiB used, "
+                    f"{stats['evictions']} evictions"
+                )
+
+
+if __name__ == "__main__":
+    main()
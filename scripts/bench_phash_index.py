@@ -0,0 +1,93 @@
+import argparse
+import random
+import statistics
+import time
+
+from trashyneighbors.phash import HASH_BITS, MAX_DISTANCE, PhashIndex
+
+
+def _flip(rng, value, bits):
+    for b in rng.sample(range(HASH_BITS), bits):
+        value ^= 1 << b
+    return value
+
+
+def _time_calls(fn, args_list):
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter_ns()
+        fn(*args)
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    return {
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p99_us": samples[int(len(samples) * 0.99)] / 1000,
+        "mean_us": statistics.fmean(samples) / 1000,
+    }
+
+
+def _report(name, stats):
+    print(
+        f"{name:<28} p50={stats['p50_us']:9.2f}us "
+        f"p99={stats['p99_us']:9.2f}us mean={stats['mean_us']:9.2f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=2000000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--scan-queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(args.images)]
+    # Near-duplicate clusters, as re-uploads and re-encodes produce.
+    for i in range(0, args.images - 3, 50):
+        for j in range(1, 4):
+            hashes[i + j] = _flip(rng, hashes[i], rng.randint(1, 8))
+
+    t0 = time.perf_counter()
+    index = PhashIndex(enumerate(hashes, start=1))
+    print(f"Built index over {len(index)} hashes in {time.perf_counter() - t0:.2f}s")
+
+    # Queries near stored hashes, so every one has at least one hit.
+    queries = [
+        _flip(rng, hashes[rng.randrange(args.images)], rng.randint(0, 4))
+        for _ in range(args.queries)
+    ]
+
+    for distance in (0, 3, 4, 6, MAX_DISTANCE):
+        stats = _time_calls(index.query, [(q, distance) for q in queries])
+        _report(f"query d<={distance}", stats)
+
+    def scan(value, max_distance):
+        return sorted(
+            (d, i)
+            for i, h in enumerate(hashes, start=1)
+            if (d := (h ^ value).bit_count()) <= max_distance
+        )
+
+    check = queries[: args.scan_queries]
+    for q in check:
+        if index.query(q, MAX_DISTANCE) != scan(q, MAX_DISTANCE):
+            raise SystemExit(f"Index/scan mismatch for {q:016x}")
+    _report(
+        f"linear scan d<={MAX_DISTANCE}",
+        _time_calls(scan, [(q, MAX_DISTANCE) for q in check]),
+    )
+
+    t0 = time.perf_counter()
+    added = 10000
+    for i in range(added):
+        index.add(args.images + 1 + i, rng.getrandbits(HASH_BITS))
+    print(f"Appended {added} hashes in {(time.perf_counter() - t0) * 1000:.1f}ms")
+    _report(
+        "query d<=6 (with appended)",
+        _time_calls(index.query, [(q, 6) for q in queries]),
+    )
+
+
+if __name__ == "__main__":
+    main()
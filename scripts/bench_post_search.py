@@ -0,0 +1,147 @@
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, make_url
+
+from trashyneighbors.config import load_site_config
+from trashyneighbors.extensions import db
+from trashyneighbors.models import Post, User, UserRole
+from trashyneighbors.search import boolean_query, build_search_statement
+
+VOCABULARY = (
+    "trash garbage junk car cars truck boat couch mattress weeds lawn grass "
+    "overgrown rats raccoons dog dogs barking loud music party fireworks "
+    "smoke burning tires oil leak fence broken window boarded porch roof "
+    "tarp hoarder hoarding debris pile yard driveway blocked parking street "
+    "sidewalk trailer rv camper abandoned appliance fridge washer dryer "
+    "chickens rooster goats noise odor smell sewage standing water mosquito"
+).split()
+
+STATES = ["TX", "CA", "FL", "NY", "OH", "GA", "AZ", "WA", "PA", "IL"]
+
+QUERIES = [
+    "junk cars",
+    "barking dog",
+    "overgrown lawn rats",
+    "abandoned trailer",
+    "loud music party",
+    "mattress",
+    "tarp roof",
+    "burning tires smoke",
+]
+
+
+def _scratch_engine(database):
+    url = make_url(load_site_config()["SQLALCHEMY_DATABASE_URI"])
+    if url.database == database:
+        raise SystemExit("Refusing to benchmark against the live database")
+    return create_engine(url.set(database=database))
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def _populate(engine, count, seed):
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+
+    with engine.begin() as conn:
+        user_id = conn.execute(
+            insert(User.__table__).values(
+                email=f"bench-{seed}@example.invalid",
+                screen_name=f"bench-{seed}",
+                role=UserRole.VERIFIED.value,
+                created_at=base,
+            )
+        ).inserted_primary_key[0]
+
+    batch = []
+    for i in range(count):
+        state = rng.choice(STATES)
+        batch.append(
+            {
+                "author_user_id": user_id,
+                "title": _text(rng, 6),
+                "story_text": _text(rng, 120),
+                "street_address": f"{rng.randint(1, 9999)} Main St",
+                "city": f"City{rng.randint(1, 50)}",
+                "state": state,
+                "zip_code": f"{rng.randint(0, 99999):05d}",
+                "created_at": base + timedelta(seconds=i),
+            }
+        )
+        if len(batch) >= 5000:
+            with engine.begin() as conn:
+                conn.execute(insert(Post.__table__), batch)
+            batch = []
+            print(f"Inserted {i + 1} posts")
+
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(insert(Post.__table__), batch)
+
+
+def _time_query(conn, stmt, runs):
+    samples = []
+    rows = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        rows = conn.execute(stmt).all()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], statistics.fmean(samples), rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--database",
+        required=True,
+        help="Scratch database on the configured server; tables are created.",
+    )
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--skip-populate",
+        action="store_true",
+        help="Reuse posts from an earlier run.",
+    )
+    args = parser.parse_args()
+
+    engine = _scratch_engine(args.database)
+    db.metadata.create_all(engine)
+
+    if not args.skip_populate:
+        t0 = time.perf_counter()
+        _populate(engine, args.posts, args.seed)
+        print(f"Populated {args.posts} posts in {time.perf_counter() - t0:.1f}s")
+
+    with engine.connect() as conn:
+        for text in QUERIES:
+            query = boolean_query(text)
+            for state in (None, "TX"):
+                after = None
+                for page in range(1, args.pages + 1):
+                    stmt = build_search_statement(
+                        query, state=state, limit=args.limit + 1, after=after
+                    )
+                    p50, mean, rows = _time_query(conn, stmt, args.runs)
+                    print(
+                        f"{text!r:<24} state={state or '-':<2} page={page} "
+                        f"rows={len(rows):>3} p50={p50:8.2f}ms mean={mean:8.2f}ms"
+                    )
+                    if len(rows) <= args.limit:
+                        break
+                    last = rows[args.limit - 1]
+                    after = (float(last.relevance), last.post_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import io
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Flask, jsonify, request
+from PIL import Image
+
+from trashyneighbors import uploads
+from trashyneighbors.exif import read_metadata
+from trashyneighbors.images import HASH_CHUNK, _pool_source
+
+# Peak RSS of N concurrent image uploads, each mode in its own process:
+#   buffered   the stock request class, file.read() into bytes, and those
+#              bytes pickled to the image pool (the pipeline before spooling)
+#   streaming  uploads.UploadRequest, hashing and metadata read in chunks,
+#              and only the spooled file's path pickled to the pool
+# Every request waits at a barrier before answering, so all uploads are
+# held at once.
+BOUNDARY = "----tn-bench-boundary"
+
+
+def _write_body(path, size):
+    # A real JPEG header padded with noise: read_metadata stops at the scan.
+    out = io.BytesIO()
+    Image.new("RGB", (16, 16), (120, 90, 60)).save(out, "JPEG")
+    head = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="image"; filename="bench.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode("ascii")
+    with open(path, "wb") as f:
+        f.write(head)
+        f.write(out.getvalue())
+        remaining = size - out.tell()
+        while remaining > 0:
+            f.write(os.urandom(min(remaining, 1 << 20)))
+            remaining -= 1 << 20
+        f.write(f"\r\n--{BOUNDARY}--\r\n".encode("ascii"))
+
+
+def _app(mode, concurrency, tmp_dir):
+    app = Flask(__name__)
+    app.config.update(
+        TRASHYNEIGHBORS_UPLOAD_MAX_FILE_BYTES=1 << 30,
+        TRASHYNEIGHBORS_UPLOAD_MAX_REQUEST_BYTES=1 << 30,
+        TRASHYNEIGHBORS_UPLOAD_MAX_FILES=8,
+        TRASHYNEIGHBORS_UPLOAD_SPOOL_BYTES=1 << 20,
+        TRASHYNEIGHBORS_UPLOAD_TMP_DIR=tmp_dir,
+    )
+    if mode == "streaming":
+        uploads.init_app(app)
+    barrier = threading.Barrier(concurrency)
+
+    @app.post("/upload")
+    def upload():
+        held = []
+        for f in request.files.getlist("image"):
+            if mode == "buffered":
+                data = f.read()
+                sha = hashlib.sha256(data).hexdigest()
+                read_metadata(io.BytesIO(data))
+                held.append(pickle.dumps(data))
+            else:
+                stream = f.stream
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: stream.read(HASH_CHUNK), b""):
+                    digest.update(chunk)
+                sha = digest.hexdigest()
+                stream.seek(0)
+                read_metadata(stream)
+                held.append(pickle.dumps(_pool_source(stream)))
+        barrier.wait()
+        return jsonify({"sha256": sha, "pickled": sum(len(h) for h in held)})
+
+    return app
+
+
+def _peak_mib():
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(args):
+    app = _app(args.mode, args.concurrency, args.tmp_dir)
+    client_errors = []
+    before = _peak_mib()
+
+    def one():
+        with open(args.body, "rb") as body:
+            resp = app.test_client().post(
+                "/upload",
+                input_stream=body,
+                content_type=f"multipart/form-data; boundary={BOUNDARY}",
+                content_length=os.path.getsize(args.body),
+            )
+        if resp.status_code != 200:
+            client_errors.append(resp.status_code)
+
+    threads = [threading.Thread(target=one) for _ in range(args.concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    if client_errors:
+        raise SystemExit(f"Upload failed: {client_errors}")
+    print(f"{before:.1f} {_peak_mib():.1f} {elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file-mb", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=("buffered", "streaming"))
+    parser.add_argument("--body", help=argparse.SUPPRESS)
+    parser.add_argument("--tmp-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        _child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        body = os.path.join(tmp, "body.bin")
+        _write_body(body, args.file_mb << 20)
+        print(
+            f"{args.concurrency} concurrent uploads of {args.file_mb} MiB "
+            f"({os.path.getsize(body)} byte bodies)"
+        )
+        for mode in ("buffered", "streaming"):
+            out = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--mode",
+                    mode,
+                    "--concurrency",
+                    str(args.concurrency),
+                    "--body",
+                    body,
+                    "--tmp-dir",
+                    tmp,
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            before, peak, elapsed = (float(v) for v in out.split())
+            print(
+                f"{mode:<10} baseline={before:7.1f} MiB peak={peak:7.1f} MiB "
+                f"growth={peak - before:7.1f} MiB in {elapsed * 1000:6.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+
+from trashyneighbors.geo import haversine_mi
+from trashyneighbors.zipindex import ZipIndex
+
+_ROW_RE = re.compile(
+    r"\('(\d{5})', (-?[\d.]+|NULL), (-?[\d.]+|NULL), "
+    r"'((?:[^']|'')*)', '(\w\w)', '((?:[^']|'')*)'\)"
+)
+
+
+def _sql_value(raw):
+    return raw.replace("''", "'")
+
+
+def load_zip_rows(sql_path: Path):
+    rows = []
+    for m in _ROW_RE.finditer(sql_path.read_text(encoding="utf-8")):
+        zip_code, lat, lon, city, state, county = m.groups()
+        rows.append(
+            (
+                zip_code,
+                _sql_value(city),
+                state,
+                _sql_value(county),
+                None if lat == "NULL" else float(lat),
+                None if lon == "NULL" else float(lon),
+            )
+        )
+    return rows
+
+
+def _time_calls(fn, args_list):
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter_ns()
+        fn(*args)
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    return {
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p99_us": samples[int(len(samples) * 0.99)] / 1000,
+        "mean_us": statistics.fmean(samples) / 1000,
+    }
+
+
+def _report(name, stats):
+    print(
+        f"{name:<28} p50={stats['p50_us']:9.2f}us "
+        f"p99={stats['p99_us']:9.2f}us mean={stats['mean_us']:9.2f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sql", default="zip_codes_states.sql")
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sql_path = Path(args.sql).expanduser().resolve()
+    if not sql_path.is_file():
+        raise SystemExit(f"Missing SQL file: {sql_path}")
+
+    rows = load_zip_rows(sql_path)
+
+    t0 = time.perf_counter()
+    index = ZipIndex(rows, "bench")
+    print(f"Built index over {len(index)} rows in {time.perf_counter() - t0:.3f}s")
+
+    rng = random.Random(args.seed)
+    sample = [rows[rng.randrange(len(rows))] for _ in range(args.queries)]
+
+    zip_args = [(r[0],) for r in sample]
+    zip_prefix_args = [(r[0][: rng.randint(1, 4)], args.limit) for r in sample]
+    city_args = [
+        (r[1][: rng.randint(1, 4)], args.limit, r[2]) for r in sample
+    ]
+    city_any_args = [(r[1][: rng.randint(2, 4)], args.limit) for r in sample]
+
+    def scan_zip_prefix(partial, limit):
+        out = []
+        for r in rows:
+            if r[0].startswith(partial):
+                out.append(r)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def scan_city_prefix(q, limit, state):
+        q = q.casefold()
+        seen = set()
+        for r in rows:
+            if r[2] == state and r[1].casefold().startswith(q):
+                seen.add(r[1])
+        return sorted(seen)[:limit]
+
+    _report("lookup", _time_calls(index.lookup, zip_args))
+    _report("zip_prefix", _time_calls(index.zip_prefix, zip_prefix_args))
+    _report("city_prefix (state)", _time_calls(index.city_prefix, city_args))
+    _report("city_prefix (any state)", _time_calls(index.city_prefix, city_any_args))
+
+    # Jitter around real centroids so queries land between ZIPs.
+    geo_args = [
+        (r[4] + rng.uniform(-0.1, 0.1), r[5] + rng.uniform(-0.1, 0.1))
+        for r in sample
+        if r[4] is not None and r[5] is not None
+    ]
+    t0 = time.perf_counter()
+    index.nearest(0.0, 0.0)
+    print(f"Built reverse-geocode grid in {time.perf_counter() - t0:.3f}s")
+    _report("nearest (grid)", _time_calls(index.nearest, geo_args))
+
+    points = [(r[4], r[5], r[0]) for r in rows if r[4] is not None and r[5] is not None]
+
+    def scan_nearest(lat, lon):
+        return min(points, key=lambda p: haversine_mi(lat, lon, p[0], p[1]))
+
+    scan_n = max(1, args.queries // 100)
+    for lat, lon in geo_args[:scan_n]:
+        hit = index.nearest(lat, lon)
+        best = scan_nearest(lat, lon)
+        if hit is not None and abs(
+            hit["distance_mi"] - haversine_mi(lat, lon, best[0], best[1])
+        ) > 0.01:
+            raise SystemExit(f"Grid/brute-force mismatch at {lat},{lon}")
+    _report("nearest (haversine scan)", _time_calls(scan_nearest, geo_args[:scan_n]))
+
+    _report(
+        "linear zip_prefix scan",
+        _time_calls(scan_zip_prefix, zip_prefix_args[:scan_n]),
+    )
+    _report(
+        "linear city_prefix scan",
+        _time_calls(scan_city_prefix, city_args[:scan_n]),
+    )
+
+
+if __name__ == "__main__":
+    main()
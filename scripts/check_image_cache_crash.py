@@ -0,0 +1,170 @@
+import os
+import random
+import signal
+import tempfile
+
+from trashyneighbors import imagecache
+from trashyneighbors.imagecache import SharedImageCache
+
+# Kills a worker part way through SharedImageCache.put, at each of its
+# writes in turn, and checks what the next user of the cache finds: every
+# lookup returns the bytes that were stored or misses, and every chunk is
+# on exactly one chain. Each kill is checked from a worker that already had
+# the cache open and from one opening it afterwards.
+CHUNK_BYTES = 1024
+CAPACITY_BYTES = 16 * CHUNK_BYTES
+MAX_ITEM_BYTES = 4 * CHUNK_BYTES
+
+
+def _image(image_id, version, size):
+    data = random.Random(image_id * 1000 + version).randbytes(size)
+    return image_id, "full", f'"{image_id}-{version}"', data
+
+
+# Enough to fill the cache, then a put that must evict, a re-encoded image
+# replacing its old entry, and one more eviction.
+PREFILL = [_image(n, 0, (n % 4 + 1) * CHUNK_BYTES - 100) for n in range(1, 8)]
+PUTS = [
+    _image(20, 0, 4 * CHUNK_BYTES),
+    _image(2, 1, 3 * CHUNK_BYTES - 7),
+    _image(21, 0, 3 * CHUNK_BYTES),
+]
+
+
+def _open(path):
+    return SharedImageCache(path, CAPACITY_BYTES, MAX_ITEM_BYTES, CHUNK_BYTES)
+
+
+def _arm(cache, step):
+    # Sends this process SIGKILL at the step-th point around the cache's
+    # header writes, slot writes and evictions.
+    seen = [0]
+
+    def point():
+        seen[0] += 1
+        if seen[0] == step:
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    def around(method):
+        def wrapped(*args):
+            point()
+            result = method(*args)
+            point()
+            return result
+
+        return wrapped
+
+    for name in ("_evict", "_delete", "_store"):
+        setattr(cache, name, around(getattr(cache, name)))
+
+    header = imagecache._HEADER
+
+    class _Header:
+        size = header.size
+        unpack = staticmethod(header.unpack)
+        unpack_from = staticmethod(header.unpack_from)
+        pack_into = staticmethod(around(header.pack_into))
+
+    imagecache._HEADER = _Header
+
+
+def _structure(cache):
+    # Problems with the slot table, chunk chains and free list.
+    problems = []
+    owner = {}
+    entries = used_bytes = 0
+    with cache._locked():
+        header = imagecache._HEADER.unpack_from(cache._mm, 0)
+        for i in range(cache.n_slots):
+            slot = cache._slot(i)
+            if slot[imagecache._S_STATE] != imagecache._USED:
+                continue
+            entries += 1
+            used_bytes += slot[imagecache._S_SIZE]
+            chunk = slot[imagecache._S_FIRST]
+            for _ in range(cache._chunks(slot[imagecache._S_SIZE])):
+                if not 0 <= chunk < cache.n_chunks or chunk in owner:
+                    problems.append(f"slot {i} reaches chunk {chunk}")
+                    break
+                owner[chunk] = i
+                chunk = cache._next[chunk]
+        chunk = header[imagecache._FREE_HEAD]
+        free = 0
+        while chunk != -1:
+            if not 0 <= chunk < cache.n_chunks or chunk in owner:
+                problems.append(f"free list reaches chunk {chunk}")
+                break
+            owner[chunk] = "free"
+            free += 1
+            chunk = cache._next[chunk]
+    if free != header[imagecache._FREE_COUNT]:
+        problems.append(f"{free} chunks on the free list, header disagrees")
+    if len(owner) != cache.n_chunks:
+        problems.append(f"{cache.n_chunks - len(owner)} chunks leaked")
+    if (entries, used_bytes) != (
+        header[imagecache._ENTRIES],
+        header[imagecache._USED_BYTES],
+    ):
+        problems.append("entry totals disagree with the header")
+    return problems
+
+
+def _check(cache):
+    problems = []
+    for image_id, variant, etag, data in PREFILL + PUTS:
+        got = cache.get(image_id, variant, etag)
+        if got is not None and got != data:
+            problems.append(f"image {image_id} {etag}: wrong bytes")
+    problems += _structure(cache)
+    for image_id, variant, etag, data in PUTS:
+        cached = cache.put(image_id, variant, etag, data)
+        if not cached or cache.get(image_id, variant, etag) != data:
+            problems.append(f"image {image_id} {etag}: not cached afterwards")
+    return problems
+
+
+def main():
+    failures = []
+    kills = 0
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=shm) as tmp:
+        step = 1
+        finished = False
+        while not finished:
+            for reopen in (False, True):
+                path = os.path.join(tmp, f"{step}-{reopen}.cache")
+                cache = _open(path)
+                for image_id, variant, etag, data in PREFILL:
+                    cache.put(image_id, variant, etag, data)
+                # Referenced entries make the eviction sweep rewrite slots.
+                cache.get(*PREFILL[0][:3])
+
+                pid = os.fork()
+                if pid == 0:
+                    # Its own descriptor, as a gunicorn worker has: the
+                    # flock dies with it rather than staying with ours.
+                    worker = _open(path)
+                    _arm(worker, step)
+                    for image_id, variant, etag, data in PUTS:
+                        worker.put(image_id, variant, etag, data)
+                    os._exit(0)
+                _, status = os.waitpid(pid, 0)
+                if os.WIFSIGNALED(status):
+                    kills += 1
+                else:
+                    finished = True
+
+                problems = _check(_open(path) if reopen else cache)
+                who = "reopened" if reopen else "open"
+                failures += [f"kill {step} ({who}): {p}" for p in problems]
+                os.unlink(path)
+            step += 1
+
+    print(f"Killed put {kills} times at {step - 2} points")
+    if failures:
+        raise SystemExit("\n".join(failures))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
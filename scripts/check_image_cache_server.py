@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import http.client
+import io
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+from PIL import Image
+from sqlalchemy import insert, make_url
+
+from trashyneighbors.blueprints.media import bp as media_bp
+from trashyneighbors.config import load_site_config
+from trashyneighbors.extensions import db
+from trashyneighbors.models import ImageBlob, Post, PostImage, User, UserRole
+
+# Serves images through gunicorn, as in production, and checks that cache
+# hits arrive intact: whole, ranged, and from a worker other than the one
+# that filled the cache.
+REQUESTS = 8
+
+
+class _Server(BaseApplication):
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def _scratch_url(args):
+    if args.url:
+        return args.url
+    url = make_url(load_site_config()["SQLALCHEMY_DATABASE_URI"])
+    if url.database == args.database:
+        raise SystemExit("Refusing to check against the live database")
+    return url.set(database=args.database)
+
+
+def _store_image():
+    # One post with one image, written directly: no encoding pool needed.
+    tag = uuid.uuid4().hex[:12]
+    now = datetime.utcnow()
+    out = io.BytesIO()
+    Image.effect_noise((640, 480), 60).convert("RGB").save(out, "JPEG")
+    data = out.getvalue()
+    sha = hashlib.sha256(data).hexdigest()
+
+    conn = db.session.connection()
+    user_id = conn.execute(
+        insert(User.__table__).values(
+            email=f"cache-check-{tag}@example.invalid",
+            screen_name=f"cache-check-{tag}",
+            role=UserRole.VERIFIED.value,
+            created_at=now,
+        )
+    ).inserted_primary_key[0]
+    post_id = conn.execute(
+        insert(Post.__table__).values(
+            author_user_id=user_id,
+            title=f"Cache check {tag}",
+            story_text="Checking the image cache.",
+            street_address="1 Main St",
+            city="Springfield",
+            state="IL",
+            zip_code="62701",
+            created_at=now,
+        )
+    ).inserted_primary_key[0]
+    conn.execute(
+        insert(ImageBlob.__table__).values(
+            content_sha256=sha,
+            content_type="image/jpeg",
+            byte_size=len(data),
+            image_bytes=data,
+            created_at=now,
+        )
+    )
+    image_id = conn.execute(
+        insert(PostImage.__table__).values(
+            post_id=post_id,
+            content_type="image/jpeg",
+            content_sha256=sha,
+            created_at=now,
+        )
+    ).inserted_primary_key[0]
+    db.session.commit()
+    return image_id, data
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("gunicorn did not start")
+
+
+def _fetch(port, path, headers=None):
+    # (status, X-Image-Cache, body), or an error string if the server broke
+    # the response off.
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, resp.getheader("X-Image-Cache"), resp.read()
+    except (http.client.HTTPException, OSError) as exc:
+        return f"{type(exc).__name__}: {exc}", None, b""
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--database",
+        help="Scratch database on the configured server; tables are created.",
+    )
+    target.add_argument("--url", help="Scratch database URL instead.")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=shm) as tmp:
+        app = Flask(__name__)
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI=_scratch_url(args),
+            TRASHYNEIGHBORS_IMAGE_CACHE_PATH=os.path.join(tmp, "images.cache"),
+            TRASHYNEIGHBORS_IMAGE_CACHE_BYTES=8 << 20,
+            TRASHYNEIGHBORS_IMAGE_CACHE_MAX_ITEM_BYTES=1 << 20,
+        )
+        db.init_app(app)
+        app.register_blueprint(media_bp)
+        with app.app_context():
+            db.create_all()
+            image_id, data = _store_image()
+            # Workers must not share the parent's connections.
+            db.engine.dispose()
+
+        port = _free_port()
+        options = {
+            "bind": f"127.0.0.1:{port}",
+            "workers": args.workers,
+            "loglevel": "warning",
+        }
+        server = multiprocessing.get_context("fork").Process(
+            target=lambda: _Server(app, options).run()
+        )
+        server.start()
+        failures = []
+        try:
+            _wait_for(port)
+            path = f"/img/{image_id}"
+            seen = []
+            for n in range(REQUESTS):
+                status, cache, body = _fetch(port, path)
+                seen.append(cache)
+                if status != 200 or body != data:
+                    failures.append(f"GET {path} #{n + 1}: {status}, {len(body)} bytes")
+            if "HIT" not in seen:
+                failures.append(f"No cache hits in {seen}")
+
+            start, stop = 1000, min(len(data), 20000)
+            status, cache, body = _fetch(
+                port, path, {"Range": f"bytes={start}-{stop - 1}"}
+            )
+            if status != 206 or cache != "HIT" or body != data[start:stop]:
+                failures.append(f"Ranged GET: {status} {cache}, {len(body)} bytes")
+            print(
+                f"{REQUESTS} GETs of {len(data)} bytes on {args.workers} gunicorn "
+                f"workers: {seen.count('HIT')} hits, {seen.count('MISS')} misses"
+            )
+        finally:
+            os.kill(server.pid, signal.SIGTERM)
+            server.join(30)
+
+    if failures:
+        raise SystemExit("\n".join(failures))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import uuid
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event, insert, make_url, select
+
+from trashyneighbors.config import load_site_config
+from trashyneighbors.extensions import db
+from trashyneighbors.listings import assemble_listings
+from trashyneighbors.models import (
+    Comment,
+    ImageBlob,
+    Post,
+    PostImage,
+    PostName,
+    User,
+    UserRole,
+)
+
+# assemble_listings() runs one statement each for the posts, their names,
+# their first images and their comment counts, whatever the page size.
+EXPECTED_STATEMENTS = 4
+PAGE_SIZES = (1, 10, 100)
+NAMES_PER_POST = 2
+IMAGES_PER_POST = 2
+COMMENTS_PER_POST = 3
+
+
+def _scratch_url(args):
+    if args.url:
+        return args.url
+    url = make_url(load_site_config()["SQLALCHEMY_DATABASE_URI"])
+    if url.database == args.database:
+        raise SystemExit("Refusing to check against the live database")
+    return url.set(database=args.database)
+
+
+def _populate(count):
+    # count posts, each with names, images sharing one blob, and comments.
+    tag = uuid.uuid4().hex[:12]
+    now = datetime.utcnow()
+    data = b"listing-check"
+    sha = hashlib.sha256(data).hexdigest()
+
+    conn = db.session.connection()
+    user_id = conn.execute(
+        insert(User.__table__).values(
+            email=f"listing-check-{tag}@example.invalid",
+            screen_name=f"listing-check-{tag}",
+            role=UserRole.VERIFIED.value,
+            created_at=now,
+        )
+    ).inserted_primary_key[0]
+    blob = conn.execute(
+        select(ImageBlob.content_sha256).where(ImageBlob.content_sha256 == sha)
+    ).first()
+    if blob is None:
+        conn.execute(
+            insert(ImageBlob.__table__).values(
+                content_sha256=sha,
+                content_type="image/jpeg",
+                byte_size=len(data),
+                image_bytes=data,
+                created_at=now,
+            )
+        )
+
+    post_ids = []
+    for i in range(count):
+        post_id = conn.execute(
+            insert(Post.__table__).values(
+                author_user_id=user_id,
+                title=f"Listing check {tag} {i}",
+                story_text="Checking listing queries.",
+                street_address=f"{i + 1} Main St",
+                city="Springfield",
+                state="IL",
+                zip_code="62701",
+                created_at=now,
+            )
+        ).inserted_primary_key[0]
+        post_ids.append(post_id)
+
+    conn.execute(
+        insert(PostName.__table__),
+        [
+            {"post_id": p, "name_text": f"Name {n}"}
+            for p in post_ids
+            for n in range(NAMES_PER_POST)
+        ],
+    )
+    conn.execute(
+        insert(PostImage.__table__),
+        [
+            {
+                "post_id": p,
+                "content_type": "image/jpeg",
+                "content_sha256": sha,
+                "created_at": now,
+            }
+            for p in post_ids
+            for _ in range(IMAGES_PER_POST)
+        ],
+    )
+    conn.execute(
+        insert(Comment.__table__),
+        [
+            {
+                "post_id": p,
+                "author_user_id": user_id,
+                "body_text": "Checking.",
+                "created_at": now,
+            }
+            for p in post_ids
+            for _ in range(COMMENTS_PER_POST)
+        ],
+    )
+    db.session.commit()
+    return post_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--database",
+        help="Scratch database on the configured server; tables are created.",
+    )
+    target.add_argument("--url", help="Scratch database URL instead.")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = _scratch_url(args)
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        post_ids = _populate(max(PAGE_SIZES))
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        failed = False
+        for size in PAGE_SIZES:
+            db.session.remove()
+            statements.clear()
+            cards = assemble_listings(post_ids[:size])
+            # Touch everything a card or JSON summary shows.
+            complete = len(cards) == size and all(
+                len(card.names) == NAMES_PER_POST
+                and card.image_id is not None
+                and card.comment_count == COMMENTS_PER_POST
+                and card.title
+                for card in cards
+            )
+            issued = len(statements)
+            db.session.rollback()
+            print(f"{size:>3} posts: {issued} statements")
+            if issued != EXPECTED_STATEMENTS or not complete:
+                failed = True
+        event.remove(db.engine, "before_cursor_execute", count)
+
+    if failed:
+        raise SystemExit(
+            f"Expected {EXPECTED_STATEMENTS} statements and complete cards "
+            "for every page size"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,14 @@ def main():
         f"google_oauth_client_id={args.google_client_id}\n"
         f"google_oauth_client_secret={args.google_client_secret}\n"
         "rate_limit_default=200 per hour\n"
+        "zip_index_recheck_seconds=60\n"
+        "reference_cache_max_age=604800\n"
+        "search_cache_ttl_seconds=30\n"
+        "search_cache_entries=2048\n"
+        "fragment_cache_max_bytes=33554432\n"
+        "facet_cache_recheck_seconds=5\n"
+        "trending_half_life_hours=24\n"
+        "trending_view_flush_seconds=30\n"
         "\n"
         "[database]\n"
         f"host={args.db_host}\n"
@@ -35,6 +43,42 @@ def main():
         f"password={args.db_password}\n"
         f"name={args.db_name}\n"
         "\n"
+        "[images]\n"
+        "max_dimension=2048\n"
+        "max_source_pixels=50000000\n"
+        "format=webp\n"
+        "webp_quality=78\n"
+        "avif_quality=55\n"
+        "encode_effort=4\n"
+        "workers=2\n"
+        "timeout_seconds=30\n"
+        "cache_path=/dev/shm/trashyneighbors-images.cache\n"
+        "cache_bytes=67108864\n"
+        "cache_max_item_bytes=1048576\n"
+        "phash_index_recheck_seconds=30\n"
+        "phash_index_rebuild_seconds=3600\n"
+        "\n"
+        "[nsfw]\n"
+        "model=trashyneighbors.nsfw:StubModel\n"
+        "threshold=0.4\n"
+        "batch_size=32\n"
+        "workers=2\n"
+        "poll_seconds=5\n"
+        "\n"
+        "[uploads]\n"
+        "max_file_bytes=16777216\n"
+        "max_request_bytes=67108864\n"
+        "max_files=8\n"
+        "spool_bytes=1048576\n"
+        "tmp_dir=\n"
+        "\n"
+        "[audit]\n"
+        "buffered=true\n"
+        "queue_size=10000\n"
+        "batch_size=500\n"
+        "flush_ms=20\n"
+        "put_timeout_ms=250\n"
+        "\n"
         "[mail]\n"
         f"server={args.mail_server}\n"
         f"port={args.mail_port}\n"
@@ -0,0 +1,124 @@
+import argparse
+
+from sqlalchemy import inspect, text
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.images import store_blob
+
+# post_image/post_image_variant used to carry their own image_bytes (and,
+# briefly, byte_size). This moves every blob into image_blob, deduplicated
+# by SHA-256, and points the rows at it.
+TABLES = (
+    ("post_image", ("image_id",)),
+    ("post_image_variant", ("image_id", "variant")),
+)
+
+
+def _ensure_columns():
+    columns = {c["name"] for c in inspect(db.engine).get_columns("post_image")}
+    if "content_sha256" not in columns:
+        db.session.execute(
+            text("ALTER TABLE post_image ADD COLUMN content_sha256 VARCHAR(64) NULL")
+        )
+    if "source_sha256" not in columns:
+        db.session.execute(
+            text(
+                "ALTER TABLE post_image ADD COLUMN source_sha256 VARCHAR(64) NULL, "
+                "ADD INDEX ix_post_image_source_sha256 (source_sha256)"
+            )
+        )
+    variant_columns = {
+        c["name"] for c in inspect(db.engine).get_columns("post_image_variant")
+    }
+    if "content_sha256" not in variant_columns:
+        db.session.execute(
+            text(
+                "ALTER TABLE post_image_variant "
+                "ADD COLUMN content_sha256 VARCHAR(64) NULL"
+            )
+        )
+    db.session.commit()
+
+
+def _has_legacy_blobs(table):
+    columns = {c["name"] for c in inspect(db.engine).get_columns(table)}
+    return "image_bytes" in columns
+
+
+def _migrate(table, key_columns, batch_size):
+    keys = ", ".join(key_columns)
+    match = " AND ".join(f"{c} = :{c}" for c in key_columns)
+    pending = text(
+        f"SELECT {keys} FROM {table} t WHERE NOT EXISTS ("
+        "SELECT 1 FROM image_blob b WHERE b.content_sha256 = t.content_sha256"
+        f") ORDER BY {keys} LIMIT :limit"
+    )
+    load = text(f"SELECT content_type, image_bytes FROM {table} WHERE {match}")
+    point = text(f"UPDATE {table} SET content_sha256 = :sha WHERE {match}")
+
+    total = 0
+    while True:
+        rows = db.session.execute(pending, {"limit": batch_size}).all()
+        if not rows:
+            break
+        for row in rows:
+            key = dict(zip(key_columns, row))
+            # One blob in memory at a time.
+            content_type, image_bytes = db.session.execute(load, key).one()
+            sha = store_blob(content_type, image_bytes)
+            db.session.execute(point, {**key, "sha": sha})
+        db.session.commit()
+        total += len(rows)
+        print(f"Moved {total} {table} blobs")
+    return total
+
+
+def _drop_legacy(table):
+    columns = {c["name"] for c in inspect(db.engine).get_columns(table)}
+    drops = [f"DROP COLUMN {c}" for c in ("image_bytes", "byte_size") if c in columns]
+    db.session.execute(
+        text(
+            f"ALTER TABLE {table} "
+            + ", ".join(
+                drops
+                + [
+                    "MODIFY content_sha256 VARCHAR(64) NOT NULL",
+                    f"ADD CONSTRAINT fk_{table}_blob FOREIGN KEY (content_sha256) "
+                    "REFERENCES image_blob (content_sha256)",
+                ]
+            )
+        )
+    )
+    db.session.commit()
+    print(f"Dropped legacy blob columns from {table}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--drop-legacy",
+        action="store_true",
+        help="After moving, drop the old blob columns and add the foreign keys.",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        _ensure_columns()
+        for table, key_columns in TABLES:
+            if not _has_legacy_blobs(table):
+                print(f"{table}: already migrated")
+                continue
+            _migrate(table, key_columns, args.batch_size)
+            if args.drop_legacy:
+                _drop_legacy(table)
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from sqlalchemy import exists, insert, literal, select
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.models import ImageReview, PostImage, ReviewStatus
+from trashyneighbors.nsfw import allocate_block, classify_pending, model_class
+
+_stopping = False
+
+
+def _stop(signum, frame):
+    global _stopping
+    _stopping = True
+
+
+def _make_pool(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+def _enqueue_existing():
+    # Images stored before the review queue existed.
+    missing = select(
+        PostImage.image_id,
+        literal(ReviewStatus.PENDING.name),
+        literal(datetime.utcnow()),
+    ).where(~exists().where(ImageReview.image_id == PostImage.image_id))
+    result = db.session.execute(
+        insert(ImageReview.__table__).from_select(
+            ["image_id", "status", "enqueued_at"], missing
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Classify what is pending now, then exit.",
+    )
+    parser.add_argument(
+        "--enqueue-existing",
+        action="store_true",
+        help="First queue every stored image that has no review row.",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    with app.app_context():
+        config = app.config
+        workers = config["TRASHYNEIGHBORS_NSFW_WORKERS"]
+        batch_size = config["TRASHYNEIGHBORS_NSFW_BATCH_SIZE"]
+        poll = config["TRASHYNEIGHBORS_NSFW_POLL_SECONDS"]
+        model = model_class(config["TRASHYNEIGHBORS_NSFW_MODEL"])
+
+        if args.enqueue_existing:
+            print(f"Queued {_enqueue_existing()} existing images")
+
+        pool = _make_pool(workers)
+        block = allocate_block(batch_size, model.input_size)
+        print(f"Classifying with {model.name} on {workers} workers")
+        total = 0
+        try:
+            while not _stopping:
+                t0 = time.perf_counter()
+                try:
+                    done = classify_pending(pool, block, workers, batch_size)
+                except BrokenProcessPool:
+                    # The batch is stored, its unscored images flagged.
+                    print("Image pool died; flagged the rest of the batch, restarting")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = _make_pool(workers)
+                    continue
+                if done:
+                    total += done
+                    elapsed = time.perf_counter() - t0
+                    print(
+                        f"Classified {done} images in {elapsed * 1000:.0f}ms "
+                        f"({elapsed * 1000 / done:.1f}ms each, {total} total)"
+                    )
+                    continue
+                # Release the idle transaction so new uploads are visible.
+                db.session.rollback()
+                if args.once:
+                    break
+                time.sleep(poll)
+        finally:
+            pool.shutdown()
+            block.close()
+            block.unlink()
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+from sqlalchemy import func, insert, select
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.facets import FACET_CACHE_NAME, bump_version
+from trashyneighbors.models import Post, PostFacetCount
+
+
+def main():
+    app = create_app()
+
+    with app.app_context():
+        db.session.query(PostFacetCount).delete(synchronize_session=False)
+        db.session.execute(
+            insert(PostFacetCount.__table__).from_select(
+                ["state", "city", "zip_code", "post_count"],
+                select(Post.state, Post.city, Post.zip_code, func.count()).group_by(
+                    Post.state, Post.city, Post.zip_code
+                ),
+            )
+        )
+        bump_version(db.session.connection(), FACET_CACHE_NAME)
+        db.session.commit()
+
+        total = db.session.query(func.sum(PostFacetCount.post_count)).scalar()
+        print(f"Rebuilt facet counts for {total or 0} posts")
+
+
+if __name__ == "__main__":
+    main()
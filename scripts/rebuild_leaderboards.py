@@ -0,0 +1,28 @@
+import argparse
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.leaderboard import LEADERBOARD_SIZE, rebuild_statements
+from trashyneighbors.models import LeaderboardEntry
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=LEADERBOARD_SIZE)
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        # One transaction: readers keep seeing the old boards until commit.
+        db.session.query(LeaderboardEntry).delete(synchronize_session=False)
+        for stmt in rebuild_statements(args.size):
+            db.session.execute(stmt)
+        db.session.commit()
+
+        total = db.session.query(LeaderboardEntry).count()
+        print(f"Rebuilt leaderboards with {total} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+
+from sqlalchemy import and_, bindparam, exists, or_, update
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.images import (
+    CONTENT_TYPES,
+    VARIANT_WIDTHS,
+    ImageRejected,
+    encode_options,
+    process_image,
+    prune_orphan_blobs,
+    store_blob,
+    variant_rows,
+)
+from trashyneighbors.models import ImageBlob, PostImage, PostImageVariant
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help=(
+            "Re-encode every image, not only those not yet WebP/AVIF or "
+            "missing their variants."
+        ),
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        options = encode_options()
+        table = PostImage.__table__
+        stmt = (
+            update(table)
+            .where(table.c.image_id == bindparam("b_image_id"))
+            .values(
+                content_type=bindparam("b_content_type"),
+                width=bindparam("b_width"),
+                height=bindparam("b_height"),
+                content_sha256=bindparam("b_content_sha256"),
+                phash=bindparam("b_phash"),
+            )
+        )
+
+        has_variants = exists().where(PostImageVariant.image_id == PostImage.image_id)
+        needs_variants = and_(
+            ~has_variants,
+            or_(PostImage.width.is_(None), PostImage.width > VARIANT_WIDTHS[-1][1]),
+        )
+
+        last_id = 0
+        done = 0
+        saved = 0
+        while True:
+            q = db.session.query(PostImage.image_id).filter(
+                PostImage.image_id > last_id
+            )
+            if not args.all:
+                q = q.filter(
+                    or_(
+                        PostImage.content_type.notin_(CONTENT_TYPES.values()),
+                        needs_variants,
+                    )
+                )
+            ids = [
+                r.image_id
+                for r in q.order_by(PostImage.image_id.asc())
+                .limit(args.batch_size)
+                .all()
+            ]
+            if not ids:
+                break
+
+            updates = []
+            variants_out = []
+            for image_id in ids:
+                # One blob in memory at a time.
+                data = (
+                    db.session.query(ImageBlob.image_bytes)
+                    .join(
+                        PostImage,
+                        PostImage.content_sha256 == ImageBlob.content_sha256,
+                    )
+                    .filter(PostImage.image_id == image_id)
+                    .scalar()
+                )
+                try:
+                    phash, variants = process_image(data, options)
+                except ImageRejected as exc:
+                    print(f"image {image_id}: skipped ({exc})")
+                    continue
+                _, content_type, image_bytes, width, height = variants[0]
+                saved += len(data) - len(image_bytes)
+                updates.append(
+                    {
+                        "b_image_id": image_id,
+                        "b_content_type": content_type,
+                        "b_width": width,
+                        "b_height": height,
+                        "b_content_sha256": store_blob(content_type, image_bytes),
+                        "b_phash": phash,
+                    }
+                )
+                variants_out.extend(variant_rows(image_id, variants))
+
+            if updates:
+                db.session.execute(stmt, updates)
+                db.session.query(PostImageVariant).filter(
+                    PostImageVariant.image_id.in_([u["b_image_id"] for u in updates])
+                ).delete(synchronize_session=False)
+                db.session.add_all(variants_out)
+            db.session.commit()
+
+            last_id = ids[-1]
+            done += len(updates)
+            print(f"Recompressed {done} images, saved {saved} bytes so far")
+
+        pruned = prune_orphan_blobs(args.batch_size)
+
+    print(
+        f"Done. Recompressed {done} images, saved {saved} bytes, "
+        f"pruned {pruned} unreferenced blobs"
+    )
+
+
+if __name__ == "__main__":
+    main()
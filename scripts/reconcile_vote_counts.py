@@ -0,0 +1,149 @@
+import argparse
+
+from sqlalchemy import bindparam, case, func, inspect, text, update
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.leaderboard import update_leaderboards
+from trashyneighbors.models import Post, PostVote, VoteValue
+
+# Added to post with post_vote; zero until --fix counts the votes in.
+COLUMNS = (
+    ("like_count", "INT NOT NULL DEFAULT 0"),
+    ("dislike_count", "INT NOT NULL DEFAULT 0"),
+    ("score", "INT NOT NULL DEFAULT 0"),
+)
+INDEXES = (("idx_post_popular", "score, post_id"),)
+
+
+def _ensure_columns():
+    inspector = inspect(db.engine)
+    columns = {c["name"] for c in inspector.get_columns("post")}
+    indexes = {i["name"] for i in inspector.get_indexes("post")}
+    missing = [
+        f"ADD COLUMN {name} {ddl}" for name, ddl in COLUMNS if name not in columns
+    ]
+    missing += [
+        f"ADD INDEX {name} ({cols})" for name, cols in INDEXES if name not in indexes
+    ]
+    if missing:
+        db.session.execute(text("ALTER TABLE post " + ", ".join(missing)))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--fix",
+        action="store_true",
+        help="Rewrite drifted counters (default is report only).",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        _ensure_columns()
+
+        likes = func.coalesce(
+            func.sum(case((PostVote.vote_value == VoteValue.LIKE.value, 1), else_=0)),
+            0,
+        )
+        dislikes = func.coalesce(
+            func.sum(
+                case((PostVote.vote_value == VoteValue.DISLIKE.value, 1), else_=0)
+            ),
+            0,
+        )
+        fix_stmt = (
+            update(Post.__table__)
+            .where(Post.__table__.c.post_id == bindparam("b_post_id"))
+            .values(
+                like_count=bindparam("b_like_count"),
+                dislike_count=bindparam("b_dislike_count"),
+                score=bindparam("b_score"),
+            )
+        )
+
+        last_id = 0
+        checked = 0
+        drifted = 0
+        while True:
+            batch = (
+                db.session.query(Post.post_id)
+                .filter(Post.post_id > last_id)
+                .order_by(Post.post_id.asc())
+                .limit(args.batch_size)
+            )
+            if args.fix:
+                # Locked before the votes are counted, as the first statement
+                # of the transaction: a vote either committed its counter
+                # change before the lock (and the count's snapshot, taken
+                # after it, includes the vote) or waits and applies its
+                # change on top of the rewritten counters.
+                batch = batch.with_for_update()
+            ids = [r.post_id for r in batch.all()]
+            if not ids:
+                break
+
+            rows = (
+                db.session.query(
+                    Post.post_id,
+                    Post.like_count,
+                    Post.dislike_count,
+                    Post.score,
+                    likes.label("actual_likes"),
+                    dislikes.label("actual_dislikes"),
+                )
+                .outerjoin(PostVote, PostVote.post_id == Post.post_id)
+                .filter(Post.post_id.in_(ids))
+                .group_by(Post.post_id)
+                .order_by(Post.post_id.asc())
+                .all()
+            )
+
+            fixes = []
+            for r in rows:
+                actual_likes = int(r.actual_likes)
+                actual_dislikes = int(r.actual_dislikes)
+                actual_score = actual_likes - actual_dislikes
+                if (r.like_count, r.dislike_count, r.score) == (
+                    actual_likes,
+                    actual_dislikes,
+                    actual_score,
+                ):
+                    continue
+                print(
+                    f"post {r.post_id}: stored "
+                    f"{r.like_count}/{r.dislike_count}/{r.score} "
+                    f"actual {actual_likes}/{actual_dislikes}/{actual_score}"
+                )
+                fixes.append(
+                    {
+                        "b_post_id": r.post_id,
+                        "b_like_count": actual_likes,
+                        "b_dislike_count": actual_dislikes,
+                        "b_score": actual_score,
+                    }
+                )
+
+            if fixes and args.fix:
+                db.session.execute(fix_stmt, fixes)
+                # Boards are refreshed once this commits, as after a vote.
+                for fix in fixes:
+                    update_leaderboards(fix["b_post_id"])
+                db.session.commit()
+            else:
+                db.session.rollback()
+
+            last_id = ids[-1]
+            checked += len(ids)
+            drifted += len(fixes)
+
+    action = "fixed" if args.fix else "found"
+    print(f"Checked {checked} posts, {action} {drifted} with drifted counters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import io
+
+from sqlalchemy import inspect, text
+
+from trashyneighbors import create_app
+from trashyneighbors.exif import MetadataError, read_metadata, strip_metadata
+from trashyneighbors.extensions import db
+from trashyneighbors.images import prune_orphan_blobs, store_blob
+from trashyneighbors.models import ImageBlob, PostImage
+
+# Images stored before the transcoding pipeline are the uploaded JPEGs,
+# metadata and all. This records their GPS position and capture time on
+# post_image and swaps each blob for a losslessly stripped copy, without
+# the cost (or quality loss) of recompress_post_images.py.
+COLUMNS = (
+    ("gps_latitude", "DECIMAL(9, 6) NULL"),
+    ("gps_longitude", "DECIMAL(9, 6) NULL"),
+    ("taken_at", "DATETIME NULL"),
+)
+
+
+def _ensure_columns():
+    columns = {c["name"] for c in inspect(db.engine).get_columns("post_image")}
+    missing = [
+        f"ADD COLUMN {name} {ddl}" for name, ddl in COLUMNS if name not in columns
+    ]
+    if missing:
+        db.session.execute(text("ALTER TABLE post_image " + ", ".join(missing)))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        _ensure_columns()
+
+        last_sha = ""
+        done = 0
+        saved = 0
+        while True:
+            # By blob, so every row sharing one moves together.
+            shas = [
+                r.content_sha256
+                for r in db.session.query(PostImage.content_sha256)
+                .filter(
+                    PostImage.content_type == "image/jpeg",
+                    PostImage.content_sha256 > last_sha,
+                )
+                .distinct()
+                .order_by(PostImage.content_sha256.asc())
+                .limit(args.batch_size)
+                .all()
+            ]
+            if not shas:
+                break
+
+            for sha in shas:
+                # One blob in memory at a time.
+                data = (
+                    db.session.query(ImageBlob.image_bytes)
+                    .filter(ImageBlob.content_sha256 == sha)
+                    .scalar()
+                )
+                out = io.BytesIO()
+                try:
+                    meta = read_metadata(io.BytesIO(data))
+                    strip_metadata(io.BytesIO(data), out)
+                except MetadataError as exc:
+                    print(f"blob {sha}: skipped ({exc})")
+                    continue
+
+                values = {}
+                if out.tell() < len(data):
+                    values["content_sha256"] = store_blob("image/jpeg", out.getvalue())
+                    saved += len(data) - out.tell()
+                if meta["latitude"] is not None:
+                    values["gps_latitude"] = meta["latitude"]
+                    values["gps_longitude"] = meta["longitude"]
+                if meta["taken_at"] is not None:
+                    values["taken_at"] = meta["taken_at"]
+                if values:
+                    db.session.query(PostImage).filter(
+                        PostImage.content_sha256 == sha
+                    ).update(values, synchronize_session=False)
+                    done += 1
+            db.session.commit()
+
+            last_sha = shas[-1]
+            print(f"Stripped {done} blobs, saved {saved} bytes so far")
+
+        pruned = prune_orphan_blobs(args.batch_size)
+
+    print(f"Done. Stripped {done} blobs, saved {saved} bytes, pruned {pruned} blobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import math
+from datetime import datetime, timedelta
+
+from trashyneighbors import create_app
+from trashyneighbors.extensions import db
+from trashyneighbors.models import Comment, PostTrending, PostVote, VoteValue
+from trashyneighbors.trending import (
+    EVENT_WEIGHTS,
+    _half_life_seconds,
+    _upsert_statement,
+    current_floor,
+    flush_views,
+    log_weight,
+)
+
+
+def _log_add(a, b):
+    if a is None:
+        return b
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+def _prune(min_weight, batch_size):
+    # Rows whose whole decayed history now weighs less than one event of
+    # min_weight can never outrank fresh activity; dropping them keeps the
+    # table (and every index range read) bounded by recent activity.
+    floor = current_floor(min_weight)
+    deleted = 0
+    while True:
+        ids = [
+            r.post_id
+            for r in db.session.query(PostTrending.post_id)
+            .filter(PostTrending.log_score < floor)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        db.session.query(PostTrending).filter(PostTrending.post_id.in_(ids)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        deleted += len(ids)
+    return deleted
+
+
+def _rebuild(days, batch_size):
+    # Recompute every score from vote and comment history, discarding
+    # accumulated drift (double-counted flips, rounding). Views are not
+    # stored anywhere else, so they restart from zero.
+    since = datetime.utcnow() - timedelta(days=days)
+    half_life = _half_life_seconds()
+    scores = {}
+
+    for post_id, vote_value, created_at in db.session.query(
+        PostVote.post_id, PostVote.vote_value, PostVote.created_at
+    ).filter(PostVote.created_at >= since):
+        kind = "like" if vote_value == VoteValue.LIKE.value else "dislike"
+        w = log_weight(EVENT_WEIGHTS[kind], created_at, half_life)
+        scores[post_id] = _log_add(scores.get(post_id), w)
+
+    for post_id, created_at in db.session.query(
+        Comment.post_id, Comment.created_at
+    ).filter(Comment.created_at >= since):
+        w = log_weight(EVENT_WEIGHTS["comment"], created_at, half_life)
+        scores[post_id] = _log_add(scores.get(post_id), w)
+
+    db.session.query(PostTrending).delete(synchronize_session=False)
+    now = datetime.utcnow()
+    post_ids = sorted(scores)
+    for i in range(0, len(post_ids), batch_size):
+        chunk = post_ids[i : i + batch_size]
+        db.session.execute(_upsert_statement({p: scores[p] for p in chunk}, now))
+    db.session.commit()
+    return len(post_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--min-weight",
+        type=float,
+        default=0.01,
+        help="Prune rows now worth less than this many likes.",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recompute all scores from vote and comment history first.",
+    )
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        flush_views(force=True)
+        if args.rebuild:
+            rebuilt = _rebuild(args.days, args.batch_size)
+            print(f"Rebuilt trending scores for {rebuilt} posts")
+        pruned = _prune(args.min_weight, args.batch_size)
+        print(f"Pruned {pruned} cold trending rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import argparse
 import csv
+import hashlib
 from pathlib import Path
 
 
@@ -15,14 +16,36 @@ def _sql_quote(value):
     return f"'{s}'"
 
 
+def _row_literal(row):
+    return "(" + ", ".join(_sql_quote(v) for v in row) + ")"
+
+
 def _write_insert(out, table, columns, rows):
     out.write(f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n")
+    out.write(",\n".join(_row_literal(row) for row in rows))
+    out.write(";\n\n")
+
+
+def _write_dataset_version(out, dataset_name, version_hash, row_count):
+    # Consumed by the app as the ZIP index version and HTTP ETag.
     out.write(
-        ",\n".join(
-            "(" + ", ".join(_sql_quote(v) for v in row) + ")" for row in rows
-        )
+        "CREATE TABLE IF NOT EXISTS reference_dataset (\n"
+        "  dataset_name VARCHAR(64) NOT NULL,\n"
+        "  version_hash VARCHAR(64) NOT NULL,\n"
+        "  row_count INT NOT NULL,\n"
+        "  imported_at DATETIME NOT NULL,\n"
+        "  PRIMARY KEY (dataset_name)\n"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 "
+        "COLLATE=utf8mb4_unicode_ci;\n\n"
+    )
+    out.write(
+        "INSERT INTO reference_dataset "
+        "(dataset_name, version_hash, row_count, imported_at) VALUES\n"
+        f"({_sql_quote(dataset_name)}, {_sql_quote(version_hash)}, "
+        f"{row_count}, UTC_TIMESTAMP())\n"
+        "ON DUPLICATE KEY UPDATE version_hash = VALUES(version_hash), "
+        "row_count = VALUES(row_count), imported_at = VALUES(imported_at);\n\n"
     )
-    out.write(";\n\n")
 
 
 def main():
@@ -115,6 +138,7 @@ def main():
 
         batch = []
         total = 0
+        version = hashlib.sha256()
 
         for row in reader:
             zip_code = (row.get("zip_code") or "").strip().strip('"')
@@ -147,7 +171,9 @@ def main():
             if county == "":
                 county = "UNKNOWN"
 
-            batch.append((zip_code, latitude, longitude, city, state, county))
+            values = (zip_code, latitude, longitude, city, state, county)
+            version.update(_row_literal(values).encode("utf-8") + b"\n")
+            batch.append(values)
             total += 1
 
             if len(batch) >= args.batch_size:
@@ -177,6 +203,8 @@ def main():
             ]
             _write_insert(out, args.table, columns, batch)
 
+        _write_dataset_version(out, args.table, version.hexdigest(), total)
+
         out.write("COMMIT;\n")
         out.write("SET FOREIGN_KEY_CHECKS=1;\n")
 
@@ -40,6 +40,107 @@ function tnBindZipAutofill() {
   });
 }
 
+async function tnFetchJson(url) {
+  const res = await fetch(url);
+  if (!res.ok) {
+    return null;
+  }
+  return await res.json();
+}
+
+function tnFillDatalist(listEl, values) {
+  listEl.replaceChildren(...values.map(v => {
+    const opt = document.createElement('option');
+    opt.value = v;
+    return opt;
+  }));
+}
+
+function tnBindSuggest(inputEl, listEl, buildUrl, toValues) {
+  let timer = null;
+  let last = '';
+  inputEl.addEventListener('input', () => {
+    clearTimeout(timer);
+    timer = setTimeout(async () => {
+      const url = buildUrl((inputEl.value || '').trim());
+      if (!url || url === last) {
+        return;
+      }
+      last = url;
+
+      const data = await tnFetchJson(url);
+      if (!data || !Array.isArray(data.results)) {
+        return;
+      }
+      tnFillDatalist(listEl, [...new Set(toValues(data.results))]);
+    }, 120);
+  });
+}
+
+function tnBindPrefixAutocomplete() {
+  const zipEl = document.getElementById('zipInput');
+  const cityEl = document.getElementById('cityInput');
+  const stateEl = document.getElementById('stateInput');
+  const zipList = document.getElementById('zipSuggestions');
+  const cityList = document.getElementById('citySuggestions');
+  const stateList = document.getElementById('stateSuggestions');
+  if (!zipEl || !cityEl || !stateEl || !zipList || !cityList || !stateList) {
+    return;
+  }
+
+  tnBindSuggest(
+    zipEl,
+    zipList,
+    q => (q.length >= 2 && q.length < 5 ? `/api/zip/prefix/${encodeURIComponent(q)}` : null),
+    results => results.map(r => r.zip_code),
+  );
+
+  tnBindSuggest(
+    cityEl,
+    cityList,
+    q => {
+      if (q.length < 2) {
+        return null;
+      }
+      const state = (stateEl.value || '').trim();
+      return `/api/city/prefix?q=${encodeURIComponent(q)}&state=${encodeURIComponent(state)}`;
+    },
+    results => results.map(r => r.city),
+  );
+
+  tnBindSuggest(
+    stateEl,
+    stateList,
+    q => (q.length >= 1 ? `/api/state/prefix?q=${encodeURIComponent(q)}` : null),
+    results => results,
+  );
+}
+
+function tnBindVoting() {
+  document.querySelectorAll('[data-tn-vote]').forEach(box => {
+    const postId = box.dataset.tnVote;
+    box.querySelectorAll('[data-tn-vote-value]').forEach(btn => {
+      btn.addEventListener('click', async () => {
+        const res = await fetch(`/api/posts/${encodeURIComponent(postId)}/vote`, {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({value: btn.dataset.tnVoteValue}),
+        });
+        const data = await res.json().catch(() => null);
+        if (!res.ok || !data) {
+          alert((data && data.error) || 'Vote failed.');
+          return;
+        }
+        box.querySelectorAll('[data-tn-count]').forEach(el => {
+          el.textContent = data[el.dataset.tnCount];
+        });
+      });
+    });
+  });
+}
+
 document.addEventListener('DOMContentLoaded', () => {
   tnBindZipAutofill();
+  tnBindPrefixAutocomplete();
+  tnBindVoting();
 });
@@ -2,6 +2,7 @@ from pathlib import Path
 from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from . import uploads
 from .config import load_site_config
 from .extensions import db, limiter, login_manager, mail, migrate
 from .models import User
@@ -35,14 +36,17 @@ def create_app(admin_mode=False):
     login_manager.init_app(app)
     mail.init_app(app)
     limiter.init_app(app)
+    uploads.init_app(app)
 
     from .blueprints.auth import bp as auth_bp
     from .blueprints.main import bp as main_bp
     from .blueprints.api import bp as api_bp
+    from .blueprints.media import bp as media_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(media_bp)
 
     if admin_mode:
         from .blueprints.adminpanel import bp as admin_bp
@@ -0,0 +1,131 @@
+import hashlib
+import re
+
+# USPS Publication 28 street suffix, directional and secondary unit
+# abbreviations (common subset).
+STREET_SUFFIXES = {
+    "ALLEY": "ALY",
+    "AVENUE": "AVE",
+    "AV": "AVE",
+    "AVEN": "AVE",
+    "BEND": "BND",
+    "BOULEVARD": "BLVD",
+    "BOUL": "BLVD",
+    "BRIDGE": "BRG",
+    "BYPASS": "BYP",
+    "CIRCLE": "CIR",
+    "CIRC": "CIR",
+    "CIRCL": "CIR",
+    "COURT": "CT",
+    "COVE": "CV",
+    "CREEK": "CRK",
+    "CRESCENT": "CRES",
+    "CROSSING": "XING",
+    "DRIVE": "DR",
+    "DRV": "DR",
+    "EXPRESSWAY": "EXPY",
+    "EXTENSION": "EXT",
+    "FREEWAY": "FWY",
+    "GARDENS": "GDNS",
+    "GROVE": "GRV",
+    "HARBOR": "HBR",
+    "HEIGHTS": "HTS",
+    "HIGHWAY": "HWY",
+    "HIWAY": "HWY",
+    "HILL": "HL",
+    "HOLLOW": "HOLW",
+    "JUNCTION": "JCT",
+    "LAKE": "LK",
+    "LANDING": "LNDG",
+    "LANE": "LN",
+    "LOOP": "LOOP",
+    "MANOR": "MNR",
+    "MEADOWS": "MDWS",
+    "MOUNTAIN": "MTN",
+    "PARKWAY": "PKWY",
+    "PKY": "PKWY",
+    "PASSAGE": "PSGE",
+    "PATH": "PATH",
+    "PIKE": "PIKE",
+    "PLACE": "PL",
+    "PLAZA": "PLZ",
+    "POINT": "PT",
+    "RIDGE": "RDG",
+    "ROAD": "RD",
+    "ROUTE": "RTE",
+    "RUN": "RUN",
+    "SPRINGS": "SPGS",
+    "SQUARE": "SQ",
+    "STREET": "ST",
+    "STR": "ST",
+    "STRT": "ST",
+    "TERRACE": "TER",
+    "TRACE": "TRCE",
+    "TRAIL": "TRL",
+    "TURNPIKE": "TPKE",
+    "VALLEY": "VLY",
+    "VIEW": "VW",
+    "VILLAGE": "VLG",
+    "WALK": "WALK",
+    "WAY": "WAY",
+}
+
+DIRECTIONALS = {
+    "NORTH": "N",
+    "SOUTH": "S",
+    "EAST": "E",
+    "WEST": "W",
+    "NORTHEAST": "NE",
+    "NORTHWEST": "NW",
+    "SOUTHEAST": "SE",
+    "SOUTHWEST": "SW",
+}
+
+UNIT_DESIGNATORS = {
+    "APARTMENT": "APT",
+    "#": "APT",
+    "NO": "APT",
+    "NUMBER": "APT",
+    "BUILDING": "BLDG",
+    "DEPARTMENT": "DEPT",
+    "FLOOR": "FL",
+    "LOT": "LOT",
+    "ROOM": "RM",
+    "SPACE": "SPC",
+    "SUITE": "STE",
+    "TRAILER": "TRLR",
+    "UNIT": "UNIT",
+}
+
+_UNIT_ABBREVIATIONS = set(UNIT_DESIGNATORS.values())
+
+_PUNCT_RE = re.compile(r"[^\w\s#-]")
+
+
+def normalize_address(street_address):
+    text = (street_address or "").upper().replace("#", " # ")
+    text = _PUNCT_RE.sub(" ", text)
+
+    tokens = []
+    for raw in text.split():
+        token = raw.strip("-")
+        if not token:
+            continue
+
+        unit = UNIT_DESIGNATORS.get(token)
+        if unit is not None:
+            # "APT # 4" and "# 4" both become "APT 4".
+            if tokens and tokens[-1] in _UNIT_ABBREVIATIONS:
+                continue
+            tokens.append(unit)
+            continue
+
+        token = DIRECTIONALS.get(token, token)
+        token = STREET_SUFFIXES.get(token, token)
+        tokens.append(token)
+
+    return " ".join(tokens)[:255]
+
+
+def address_hash(address_key):
+    return hashlib.sha256(address_key.encode("utf-8")).hexdigest()
@@ -0,0 +1,227 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# json.dumps() builds a new encoder per call when given options.
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+_PENDING = "audit_pending"
+_STOP = object()
+# A batch the database keeps refusing is retried, this far apart at most.
+RETRY_MAX_SECONDS = 5.0
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def encode_payload(payload):
+    return _encoder.encode(payload) if payload else "{}"
+
+
+def write_rows(engine, rows):
+    # One transaction. As an executemany the statement stays compiled once,
+    # and PyMySQL sends the rows as multi-row INSERTs of up to ~1 MB each,
+    # where .values(rows) would recompile a statement for every batch.
+    with engine.begin() as conn:
+        conn.execute(insert(AuditLog.__table__), rows)
+
+
+class AuditWriter:
+    # One per worker process. Rows wait in a bounded queue; a thread takes
+    # whatever has gathered, up to batch_size rows or flush_seconds after
+    # the first, and writes it as one INSERT and one commit. A full queue
+    # makes callers wait up to put_timeout and then write their rows
+    # themselves, so events are delayed under load but never dropped.
+    def __init__(self, engine, queue_size, batch_size, flush_seconds, put_timeout):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.put_timeout = put_timeout
+        self.written = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.rejected = 0
+        self._stopping = False
+        self._writing = []
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name="audit-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, rows):
+        for n, row in enumerate(rows):
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                # Raises if the database is down too; the request fails
+                # instead of losing its events.
+                self.fallbacks += len(rows) - n
+                write_rows(self.engine, rows[n:])
+                return
+
+    def flush(self):
+        # Blocks until everything submitted so far is written.
+        self._queue.join()
+
+    def close(self, timeout=10.0):
+        # Lets the thread write what is queued and stop. If it is still
+        # stuck retrying when timeout runs out, the queued rows are written
+        # here instead, and whatever is left is logged: the process is about
+        # to exit and take it along.
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        else:
+            self._thread.join(max(deadline - time.monotonic(), 0))
+        if not self._thread.is_alive():
+            return
+
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if row is not _STOP:
+                rows.append(row)
+        unwritten = len(self._writing)
+        if rows:
+            try:
+                write_rows(self.engine, rows)
+            except Exception:
+                logger.exception("Writing %d queued audit rows failed", len(rows))
+                unwritten += len(rows)
+        if unwritten:
+            logger.error("Audit writer closed with %d events unwritten", unwritten)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def _batch(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                row = self._queue.get()
+                deadline = time.monotonic() + self.flush_seconds
+            else:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if row is _STOP:
+                self._queue.task_done()
+                self._stopping = True
+                break
+            batch.append(row)
+        return batch
+
+    def _write(self, rows):
+        delay = 0.05
+        while True:
+            try:
+                write_rows(self.engine, rows)
+            except (DataError, IntegrityError) as exc:
+                # The rows are refused, not the connection: retrying cannot
+                # help and would hold up every event queued behind them.
+                # Halved until each refused row is on its own and dropped.
+                if len(rows) == 1:
+                    self.rejected += 1
+                    logger.error("Audit row rejected: %r", rows[0], exc_info=exc)
+                    return
+                half = len(rows) // 2
+                self._write(rows[:half])
+                self._write(rows[half:])
+                return
+            except Exception:
+                # Kept and retried: the queue backs up behind it, and
+                # callers fall back to writing, and failing, themselves.
+                self.failures += 1
+                logger.exception("Audit batch of %d rows failed", len(rows))
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+            else:
+                self.written += len(rows)
+                return
+
+    def _run(self):
+        while not self._stopping:
+            batch = self._batch()
+            if not batch:
+                continue
+            self._writing = batch
+            self._write(batch)
+            self._writing = []
+            self.batches += 1
+            for _ in batch:
+                self._queue.task_done()
+
+
+def get_audit_writer():
+    # Started on first use in each worker process, after gunicorn forks.
+    # None when [audit] buffered is off.
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer_pid != pid:
+        with _writer_lock:
+            if _writer_pid != pid:
+                config = current_app.config
+                _writer = None
+                if config["TRASHYNEIGHBORS_AUDIT_BUFFERED"]:
+                    _writer = AuditWriter(
+                        db.engine,
+                        config["TRASHYNEIGHBORS_AUDIT_QUEUE_SIZE"],
+                        config["TRASHYNEIGHBORS_AUDIT_BATCH_SIZE"],
+                        config["TRASHYNEIGHBORS_AUDIT_FLUSH_MS"] / 1000.0,
+                        config["TRASHYNEIGHBORS_AUDIT_PUT_TIMEOUT_MS"] / 1000.0,
+                    )
+                _writer_pid = pid
+    return _writer
+
+
+def record(row, durable=False):
+    # row holds AuditLog column values. Durable events, and every event
+    # when buffering is off, are inserted in the caller's transaction as
+    # before. The rest are held on the session and handed to the writer
+    # only once that transaction commits.
+    if durable or get_audit_writer() is None:
+        db.session.execute(insert(AuditLog.__table__), [row])
+        return
+    db.session.info.setdefault(_PENDING, []).append(row)
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    rows = session.info.pop(_PENDING, None)
+    if rows:
+        get_audit_writer().submit(rows)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _session_transaction_ended(session, transaction):
+    # Still here after a rollback or close: the events describe changes
+    # that never happened.
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
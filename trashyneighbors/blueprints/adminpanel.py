@@ -1,19 +1,203 @@
-from flask import Blueprint, abort, render_template
+from datetime import datetime
+
+from flask import (
+    Blueprint,
+    abort,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from flask_login import current_user
+from sqlalchemy import func
 
-from ..models import UserRole
+from ..extensions import db
+from ..imagecache import get_image_cache
+from ..models import (
+    AuditEventType,
+    ImageReview,
+    Post,
+    PostImage,
+    ReviewStatus,
+    UserRole,
+)
+from ..phash import MAX_DISTANCE, find_similar, from_signed
+from .auth import _audit
 
 bp = Blueprint("adminpanel", __name__)
 
+SIMILAR_DEFAULT_DISTANCE = 6
+SIMILAR_MAX_LIMIT = 200
+REVIEW_PAGE_SIZE = 50
+REVIEW_DECISIONS = {"approve": ReviewStatus.APPROVED, "block": ReviewStatus.BLOCKED}
 
-@bp.get("/")
-def admin_index():
-    if not current_user.is_authenticated:
-        abort(403)
-    if current_user.role not in (
+
+def _is_staff():
+    return current_user.is_authenticated and current_user.role in (
         UserRole.MODERATOR,
         UserRole.ADMINISTRATOR,
         UserRole.SUPER_ADMINISTRATOR,
-    ):
+    )
+
+
+@bp.get("/")
+def admin_index():
+    if not _is_staff():
         abort(403)
     return render_template("admin/index.html")
+
+
+@bp.get("/images/review")
+def image_review():
+    # The NSFW queue: FLAGGED by default, oldest first.
+    if not _is_staff():
+        abort(403)
+    try:
+        status = ReviewStatus(request.args.get("status", ReviewStatus.FLAGGED.value))
+    except ValueError:
+        abort(400)
+    after = request.args.get("after", 0, type=int)
+
+    counts = dict(
+        db.session.query(ImageReview.status, func.count()).group_by(ImageReview.status)
+    )
+    rows = (
+        db.session.query(ImageReview, PostImage.post_id, Post.title)
+        .join(PostImage, PostImage.image_id == ImageReview.image_id)
+        .join(Post, Post.post_id == PostImage.post_id)
+        .filter(ImageReview.status == status, ImageReview.image_id > after)
+        .order_by(ImageReview.image_id.asc())
+        .limit(REVIEW_PAGE_SIZE + 1)
+        .all()
+    )
+    next_after = None
+    if len(rows) > REVIEW_PAGE_SIZE:
+        rows = rows[:REVIEW_PAGE_SIZE]
+        next_after = rows[-1][0].image_id
+
+    return render_template(
+        "admin/image_review.html",
+        status=status,
+        statuses=list(ReviewStatus),
+        counts={s: counts.get(s, 0) for s in ReviewStatus},
+        rows=rows,
+        next_after=next_after,
+    )
+
+
+@bp.post("/images/<int:image_id>/review")
+def review_image(image_id):
+    if not _is_staff():
+        abort(403)
+    decision = REVIEW_DECISIONS.get(request.form.get("decision", ""))
+    if decision is None:
+        abort(400)
+    review = db.session.get(ImageReview, image_id)
+    if review is None:
+        abort(404)
+
+    previous = review.status
+    review.status = decision
+    review.reviewed_by_user_id = current_user.user_id
+    review.reviewed_at = datetime.utcnow()
+    _audit(
+        AuditEventType.REVIEW_IMAGE.value,
+        entity_type="post_image",
+        entity_id=image_id,
+        payload={
+            "from": previous.value,
+            "to": decision.value,
+            "score": review.score,
+            "model": review.model_name,
+        },
+        durable=True,
+    )
+    db.session.commit()
+
+    flash(f"Image {image_id} marked {decision.value.lower()}.")
+    return redirect(
+        url_for(".image_review", status=request.form.get("status", previous.value))
+    )
+
+
+@bp.get("/api/images/cache")
+def image_cache_stats():
+    # The host-wide cache is shared with the main site's workers, so these
+    # are its numbers too.
+    if not _is_staff():
+        return jsonify({"error": "Forbidden"}), 403
+    cache = get_image_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
+
+
+@bp.get("/api/images/similar")
+@bp.get("/api/images/<int:image_id>/similar")
+def similar_images(image_id=None):
+    # Near-duplicates by perceptual hash, of a stored image or of a raw
+    # 16-hex-digit ?phash= value.
+    if not _is_staff():
+        return jsonify({"error": "Forbidden"}), 403
+
+    max_distance = request.args.get(
+        "max_distance", SIMILAR_DEFAULT_DISTANCE, type=int
+    )
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        return (
+            jsonify({"error": f"max_distance must be between 0 and {MAX_DISTANCE}"}),
+            400,
+        )
+    limit = max(1, min(request.args.get("limit", 50, type=int), SIMILAR_MAX_LIMIT))
+
+    if image_id is not None:
+        stored = (
+            db.session.query(PostImage.phash)
+            .filter(PostImage.image_id == image_id)
+            .first()
+        )
+        if stored is None:
+            return jsonify({"error": "Image not found"}), 404
+        if stored.phash is None:
+            return jsonify({"error": "Image has not been hashed yet"}), 409
+        value = from_signed(stored.phash)
+    else:
+        try:
+            value = int(request.args.get("phash", ""), 16)
+        except ValueError:
+            return jsonify({"error": "phash must be 16 hex digits"}), 400
+        if not 0 <= value < 1 << 64:
+            return jsonify({"error": "phash must be 16 hex digits"}), 400
+
+    # One extra so dropping the image itself still leaves `limit` matches.
+    hits = [
+        (d, i) for d, i in find_similar(value, max_distance, limit + 1) if i != image_id
+    ][:limit]
+
+    # Index rows can outlive deleted images; the join drops them.
+    rows = {
+        r.image_id: r
+        for r in db.session.query(PostImage.image_id, PostImage.post_id, Post.title)
+        .join(Post, Post.post_id == PostImage.post_id)
+        .filter(PostImage.image_id.in_([i for _, i in hits]))
+    }
+    matches = [
+        {
+            "image_id": i,
+            "post_id": rows[i].post_id,
+            "post_title": rows[i].title,
+            "distance": d,
+        }
+        for d, i in hits
+        if i in rows
+    ]
+    return jsonify(
+        {
+            "image_id": image_id,
+            "phash": f"{value:016x}",
+            "max_distance": max_distance,
+            "matches": matches,
+        }
+    )
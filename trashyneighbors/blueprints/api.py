@@ -1,38 +1,441 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from ..extensions import db
-from ..models import ZipCodeLocation
+from ..extensions import db, limiter
+from ..facets import get_facet_tree
+from ..feed import decode_after, encode_after, recent_post_ids
+from ..fragments import bump_content_version
+from ..images import ImagePipelineBusy, ImageRejected, store_post_image
+from ..leaderboard import LEADERBOARD_SIZE, popular_post_ids
+from ..listings import assemble_listings
+from ..models import AuditEventType, Post, UserRole, VoteValue
+from ..nearby import find_posts_near
+from ..pagination import decode_cursor, decode_ranked_after, encode_cursor
+from ..search import search_posts
+from ..trending import trending_post_ids
+from ..votes import cast_vote
+from ..zipindex import get_zip_index, normalize_zip
+from .auth import _audit
 
 bp = Blueprint("api", __name__)
 
+PREFIX_LIMIT_DEFAULT = 10
+PREFIX_LIMIT_MAX = 50
+ZIP_BATCH_MAX = 5000
+NEARBY_RADIUS_DEFAULT_MI = 5.0
+NEARBY_RADIUS_MAX_MI = 50.0
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 100
+
+VOTE_VALUES = {"like": VoteValue.LIKE, "dislike": VoteValue.DISLIKE}
+
+STAFF_ROLES = (
+    UserRole.MODERATOR,
+    UserRole.ADMINISTRATOR,
+    UserRole.SUPER_ADMINISTRATOR,
+)
+
+
+def _prefix_limit():
+    limit = request.args.get("limit", PREFIX_LIMIT_DEFAULT, type=int)
+    return max(1, min(limit or PREFIX_LIMIT_DEFAULT, PREFIX_LIMIT_MAX))
+
+
+def _page_size():
+    limit = request.args.get("limit", PAGE_SIZE_DEFAULT, type=int)
+    return max(1, min(limit or PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX))
+
+
+def _post_summary(card):
+    return {
+        "post_id": card.post_id,
+        "title": card.title,
+        "street_address": card.street_address,
+        "city": card.city,
+        "state": card.state,
+        "zip_code": card.zip_code,
+        "names": card.names,
+        "image_id": card.image_id,
+        "like_count": card.like_count,
+        "dislike_count": card.dislike_count,
+        "score": card.score,
+        "comment_count": card.comment_count,
+        "created_at": card.created_at.isoformat(),
+    }
+
+
+def _posts_by_id(post_ids):
+    return {p.post_id: p for p in assemble_listings(post_ids)}
+
+
+def _geo_filters():
+    state = (request.args.get("state") or "").strip().upper()[:2] or None
+    city = (request.args.get("city") or "").strip() or None
+    zip_code = request.args.get("zip")
+    zip_code = normalize_zip(zip_code) if zip_code else None
+    return state, city, zip_code
+
+
+def _reference_response(build_payload):
+    # Reference data only changes on re-import, so the dataset version is a
+    # strong validator for every URL served from it.
+    index = get_zip_index()
+
+    if request.if_none_match.contains(index.version):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = jsonify(build_payload(index))
+
+    resp.set_etag(index.version)
+    if index.imported_at is not None:
+        resp.last_modified = index.imported_at
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config[
+        "TRASHYNEIGHBORS_REFERENCE_CACHE_MAX_AGE"
+    ]
+    return resp.make_conditional(request)
+
 
 @bp.get("/api/zip/<zip_code>")
 def zip_lookup(zip_code):
-    zip_code = (zip_code or "").strip().zfill(5)[:5]
+    zip_code = normalize_zip(zip_code)
 
-    rows = (
-        db.session.query(ZipCodeLocation)
-        .filter(ZipCodeLocation.zip_code == zip_code)
-        .order_by(ZipCodeLocation.state.asc(), ZipCodeLocation.city.asc())
-        .all()
+    return _reference_response(
+        lambda index: {
+            "zip_code": zip_code,
+            "results": index.lookup(zip_code),
+        }
     )
 
-    return jsonify(
+
+@bp.post("/api/zip/batch")
+def zip_batch():
+    data = request.get_json(silent=True) or {}
+    zip_codes = data.get("zip_codes")
+    if not isinstance(zip_codes, list):
+        return jsonify({"error": "zip_codes must be a list"}), 400
+    if len(zip_codes) > ZIP_BATCH_MAX:
+        return (
+            jsonify({"error": f"At most {ZIP_BATCH_MAX} zip_codes per request"}),
+            400,
+        )
+
+    index = get_zip_index()
+    results = {}
+    missing = []
+    seen = set()
+    for raw in zip_codes:
+        zip_code = normalize_zip(str(raw))
+        if zip_code in seen:
+            continue
+        seen.add(zip_code)
+        rows = index.lookup(zip_code)
+        if rows:
+            results[zip_code] = rows
+        else:
+            missing.append(zip_code)
+
+    return jsonify({"results": results, "missing": missing})
+
+
+@bp.get("/api/zip/prefix/<partial>")
+def zip_prefix(partial):
+    partial = "".join(ch for ch in partial if ch.isdigit())[:5]
+    limit = _prefix_limit()
+
+    return _reference_response(
+        lambda index: {
+            "q": partial,
+            "results": index.zip_prefix(partial, limit) if partial else [],
+        }
+    )
+
+
+@bp.get("/api/city/prefix")
+def city_prefix():
+    q = (request.args.get("q") or "").strip()
+    state = (request.args.get("state") or "").strip().upper()[:2]
+    limit = _prefix_limit()
+
+    return _reference_response(
+        lambda index: {
+            "q": q,
+            "state": state,
+            "results": (
+                index.city_prefix(q, limit, state=state or None) if q else []
+            ),
+        }
+    )
+
+
+@bp.get("/api/geo/reverse")
+def geo_reverse():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        return jsonify({"error": "lat and lon are required"}), 400
+
+    return _reference_response(
+        lambda index: {
+            "latitude": lat,
+            "longitude": lon,
+            "result": index.nearest(lat, lon),
+        }
+    )
+
+
+@bp.get("/api/state/prefix")
+def state_prefix():
+    q = (request.args.get("q") or "").strip()[:2]
+    limit = _prefix_limit()
+
+    return _reference_response(
+        lambda index: {"q": q, "results": index.state_prefix(q, limit)}
+    )
+
+
+@bp.get("/api/facets")
+def facets():
+    state, city, _ = _geo_filters()
+    tree = get_facet_tree()
+    trail, field, options = tree.drilldown(state, city)
+    resp = jsonify(
         {
-            "zip_code": zip_code,
-            "results": [
-                {
-                    "city": r.city,
-                    "state": r.state,
-                    "county": r.county,
-                    "latitude": (
-                        float(r.latitude) if r.latitude is not None else None
-                    ),
-                    "longitude": (
-                        float(r.longitude) if r.longitude is not None else None
-                    ),
-                }
-                for r in rows
+            "trail": [
+                {"field": f, "value": value, "count": count}
+                for f, value, count in trail
             ],
+            "field": field,
+            "options": [{"value": value, "count": count} for value, count in options],
+        }
+    )
+    resp.set_etag(f"facets-{tree.version}")
+    return resp.make_conditional(request)
+
+
+@bp.get("/api/posts/nearby")
+def posts_nearby():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    zip_code = request.args.get("zip")
+    if (lat is None or lon is None) and zip_code:
+        for row in get_zip_index().lookup(normalize_zip(zip_code)):
+            if row["latitude"] is not None and row["longitude"] is not None:
+                lat, lon = row["latitude"], row["longitude"]
+                break
+    if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        return jsonify({"error": "lat and lon (or a known zip) are required"}), 400
+
+    radius = request.args.get("radius_mi", NEARBY_RADIUS_DEFAULT_MI, type=float)
+    radius = max(0.01, min(radius or NEARBY_RADIUS_DEFAULT_MI, NEARBY_RADIUS_MAX_MI))
+
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, 2)
+        after = decode_ranked_after(values) if values is not None else None
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    limit = _page_size()
+    hits = find_posts_near(lat, lon, radius, limit + 1, after=after)
+    page = hits[:limit]
+
+    posts = _posts_by_id([post_id for _, post_id in page])
+
+    results = []
+    for distance, post_id in page:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        item = _post_summary(post)
+        item["distance_mi"] = round(distance, 3)
+        results.append(item)
+
+    return jsonify(
+        {
+            "latitude": lat,
+            "longitude": lon,
+            "radius_mi": radius,
+            "results": results,
+            "next_cursor": encode_cursor(*page[-1]) if len(hits) > limit else None,
+        }
+    )
+
+
+@bp.get("/api/search")
+def post_search():
+    q = (request.args.get("q") or "").strip()
+    state, city, zip_code = _geo_filters()
+
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, 2)
+        after = decode_ranked_after(values) if values is not None else None
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    page, next_after = search_posts(
+        q, state=state, city=city, zip_code=zip_code, limit=_page_size(), after=after
+    )
+    posts = _posts_by_id([post_id for post_id, _ in page])
+
+    results = []
+    for post_id, relevance in page:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        item = _post_summary(post)
+        item["relevance"] = relevance
+        results.append(item)
+
+    return jsonify(
+        {
+            "q": q,
+            "results": results,
+            "next_cursor": encode_cursor(*next_after) if next_after else None,
         }
     )
+
+
+@bp.get("/api/posts/recent")
+def posts_recent():
+    state, city, zip_code = _geo_filters()
+
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, 2)
+        after = decode_after(values) if values is not None else None
+        if after is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    post_ids, next_after = recent_post_ids(
+        state=state, city=city, zip_code=zip_code, limit=_page_size(), after=after
+    )
+
+    return jsonify(
+        {
+            "results": [_post_summary(p) for p in assemble_listings(post_ids)],
+            "next_cursor": (
+                encode_cursor(*encode_after(next_after)) if next_after else None
+            ),
+        }
+    )
+
+
+@bp.get("/api/posts/popular")
+def posts_popular():
+    state, city, zip_code = _geo_filters()
+    post_ids = popular_post_ids(
+        state=state,
+        city=city,
+        zip_code=zip_code,
+        limit=min(_page_size(), LEADERBOARD_SIZE),
+    )
+    return jsonify({"results": [_post_summary(p) for p in assemble_listings(post_ids)]})
+
+
+@bp.get("/api/posts/trending")
+def posts_trending():
+    state, city, zip_code = _geo_filters()
+    post_ids = trending_post_ids(
+        state=state, city=city, zip_code=zip_code, limit=_page_size()
+    )
+    return jsonify({"results": [_post_summary(p) for p in assemble_listings(post_ids)]})
+
+
+@bp.post("/api/posts/<int:post_id>/vote")
+@limiter.limit("300 per hour")
+def post_vote(post_id):
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Login required"}), 401
+    if current_user.role in (UserRole.GUEST, UserRole.UNVERIFIED):
+        return jsonify({"error": "Verify your email to vote"}), 403
+
+    data = request.get_json(silent=True) or {}
+    value = VOTE_VALUES.get(str(data.get("value", "")).lower())
+    if value is None:
+        return jsonify({"error": "value must be 'like' or 'dislike'"}), 400
+
+    if db.session.get(Post, post_id) is None:
+        return jsonify({"error": "Post not found"}), 404
+
+    old_value, new_value = cast_vote(post_id, current_user.user_id, value)
+    if old_value != new_value:
+        _audit(
+            AuditEventType.VOTE.value,
+            entity_type="post",
+            entity_id=post_id,
+            payload={
+                "old_value": old_value.value if old_value is not None else None,
+                "new_value": new_value.value,
+            },
+        )
+    db.session.commit()
+
+    counts = (
+        db.session.query(Post.like_count, Post.dislike_count, Post.score)
+        .filter(Post.post_id == post_id)
+        .one()
+    )
+    return jsonify(
+        {
+            "post_id": post_id,
+            "vote": new_value.name.lower(),
+            "like_count": counts.like_count,
+            "dislike_count": counts.dislike_count,
+            "score": counts.score,
+        }
+    )
+
+
+@bp.post("/api/posts/<int:post_id>/images")
+@limiter.limit("60 per hour")
+def post_images(post_id):
+    # multipart/form-data with one or more "image" file parts. Checks run
+    # before the body is read; the body is then streamed into spooled
+    # files under the [uploads] caps (see uploads.py).
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Login required"}), 401
+    if current_user.role in (UserRole.GUEST, UserRole.UNVERIFIED):
+        return jsonify({"error": "Verify your email to add images"}), 403
+
+    post = db.session.get(Post, post_id)
+    if post is None:
+        return jsonify({"error": "Post not found"}), 404
+    if (
+        post.author_user_id != current_user.user_id
+        and current_user.role not in STAFF_ROLES
+    ):
+        return jsonify({"error": "Only the author can add images"}), 403
+
+    try:
+        files = request.files.getlist("image")
+    except RequestEntityTooLarge as exc:
+        return jsonify({"error": exc.description}), 413
+    if not files:
+        return jsonify({"error": "Attach one or more files as 'image'"}), 400
+
+    image_ids = []
+    try:
+        for upload in files:
+            image_ids.append(store_post_image(post_id, upload.stream).image_id)
+    except ImageRejected as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), 400
+    except ImagePipelineBusy as exc:
+        db.session.rollback()
+        return jsonify({"error": str(exc)}), 503
+
+    bump_content_version(post_id)
+    _audit(
+        AuditEventType.UPLOAD_IMAGE.value,
+        entity_type="post",
+        entity_id=post_id,
+        payload={"image_ids": image_ids},
+    )
+    db.session.commit()
+    return jsonify({"post_id": post_id, "image_ids": image_ids}), 201
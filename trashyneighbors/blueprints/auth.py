@@ -1,4 +1,3 @@
-import json
 from datetime import datetime
 
 from authlib.integrations.flask_client import OAuth
@@ -8,6 +7,7 @@ from flask_mail import Message
 from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from .. import audit
 from ..extensions import db, limiter, mail
 from ..models import AuditEventType, AuditLog, User, UserRole
 
@@ -20,19 +20,36 @@ def _serializer():
     return URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
 
 
-def _audit(event_type, entity_type=None, entity_id=None, payload=None):
-    payload = payload or {}
-    log = AuditLog(
-        event_type=event_type,
-        actor_user_id=(current_user.user_id if current_user.is_authenticated else None),
-        ip_address=request.headers.get("X-Forwarded-For", request.remote_addr),
-        user_agent=request.headers.get("User-Agent"),
-        entity_type=entity_type,
-        entity_id=str(entity_id) if entity_id is not None else None,
-        event_json=json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
-        created_at=datetime.utcnow(),
+def _clip(name, value):
+    # A value longer than its audit_log column would get the whole event
+    # rejected, and User-Agent and X-Forwarded-For are whatever the client
+    # sent.
+    if value is None:
+        return None
+    return value[: AuditLog.__table__.c[name].type.length]
+
+
+def _audit(event_type, entity_type=None, entity_id=None, payload=None, durable=False):
+    # Written once the request's transaction commits; durable=True writes it
+    # inside that transaction instead (see audit.record).
+    ip_address = request.headers.get("X-Forwarded-For", request.remote_addr)
+    audit.record(
+        {
+            "event_type": _clip("event_type", event_type),
+            "actor_user_id": (
+                current_user.user_id if current_user.is_authenticated else None
+            ),
+            "ip_address": _clip("ip_address", ip_address),
+            "user_agent": _clip("user_agent", request.headers.get("User-Agent")),
+            "entity_type": _clip("entity_type", entity_type),
+            "entity_id": _clip(
+                "entity_id", str(entity_id) if entity_id is not None else None
+            ),
+            "event_json": audit.encode_payload(payload),
+            "created_at": datetime.utcnow(),
+        },
+        durable=durable,
     )
-    db.session.add(log)
 
 
 def _send_verification_email(user: User):
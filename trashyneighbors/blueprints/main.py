@@ -1,8 +1,193 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, abort, render_template, request
+
+from ..address import address_hash, normalize_address
+from ..extensions import db
+from ..facets import get_facet_tree
+from ..fragments import render_post_body, render_post_card
+from ..feed import decode_after, encode_after, recent_post_ids
+from ..leaderboard import popular_post_ids
+from ..listings import assemble_listings
+from ..models import Post, PostImage, PostName
+from ..pagination import decode_cursor, decode_ranked_after, encode_cursor
+from ..search import search_posts
+from ..trending import flush_views, record_view, trending_post_ids
+from ..zipindex import normalize_zip
 
 bp = Blueprint("main", __name__)
+bp.add_app_template_global(render_post_card, "post_card")
+
+SEARCH_RESULT_LIMIT = 50
+RECENT_PAGE_SIZE = 20
+INDEX_RECENT_COUNT = 10
+INDEX_TRENDING_COUNT = 5
+POPULAR_PAGE_SIZE = 50
+
+
+def _search_args():
+    return {
+        "q": (request.args.get("q") or "").strip(),
+        "street": (request.args.get("street") or "").strip(),
+        "zip": (request.args.get("zip") or "").strip(),
+        "city": (request.args.get("city") or "").strip(),
+        "state": (request.args.get("state") or "").strip().upper()[:2],
+    }
+
+
+def _facets(args):
+    return get_facet_tree().drilldown(args["state"] or None, args["city"] or None)
 
 
 @bp.get("/")
 def index():
-    return render_template("main/index.html")
+    post_ids, _ = recent_post_ids(limit=INDEX_RECENT_COUNT)
+    return render_template(
+        "main/index.html",
+        search=_search_args(),
+        recent_posts=assemble_listings(post_ids),
+        trending_posts=assemble_listings(trending_post_ids(limit=INDEX_TRENDING_COUNT)),
+    )
+
+
+@bp.get("/recent")
+def recent():
+    args = _search_args()
+    zip_code = normalize_zip(args["zip"]) if args["zip"] else None
+
+    values = decode_cursor(request.args.get("cursor"), 2)
+    after = decode_after(values) if values else None
+
+    post_ids, next_after = recent_post_ids(
+        state=args["state"] or None,
+        city=args["city"] or None,
+        zip_code=zip_code,
+        limit=RECENT_PAGE_SIZE,
+        after=after,
+    )
+    return render_template(
+        "main/recent.html",
+        search=args,
+        facets=_facets(args),
+        posts=assemble_listings(post_ids),
+        next_cursor=(
+            encode_cursor(*encode_after(next_after)) if next_after else None
+        ),
+    )
+
+
+@bp.get("/popular")
+def popular():
+    args = _search_args()
+    zip_code = normalize_zip(args["zip"]) if args["zip"] else None
+
+    post_ids = popular_post_ids(
+        state=args["state"] or None,
+        city=args["city"] or None,
+        zip_code=zip_code,
+        limit=POPULAR_PAGE_SIZE,
+    )
+    return render_template(
+        "main/popular.html",
+        search=args,
+        facets=_facets(args),
+        posts=assemble_listings(post_ids),
+    )
+
+
+@bp.get("/post/<int:post_id>")
+def post_detail(post_id):
+    counts = (
+        db.session.query(
+            Post.post_id,
+            Post.title,
+            Post.content_version,
+            Post.like_count,
+            Post.dislike_count,
+        )
+        .filter(Post.post_id == post_id)
+        .first()
+    )
+    if counts is None:
+        abort(404)
+
+    def load():
+        names = (
+            db.session.query(PostName.name_text)
+            .filter(PostName.post_id == post_id)
+            .order_by(PostName.post_name_id.asc())
+            .all()
+        )
+        images = (
+            db.session.query(PostImage.image_id)
+            .filter(PostImage.post_id == post_id)
+            .order_by(PostImage.image_id.asc())
+            .all()
+        )
+        return (
+            db.session.get(Post, post_id),
+            [n.name_text for n in names],
+            [i.image_id for i in images],
+        )
+
+    body = render_post_body(counts, load)
+    record_view(post_id)
+    flush_views()
+    return render_template("main/post.html", post=counts, body=body)
+
+
+@bp.get("/search")
+def search():
+    args = _search_args()
+    zip_code = normalize_zip(args["zip"]) if args["zip"] else ""
+
+    if args["q"]:
+        return _keyword_search(args, zip_code)
+
+    q = db.session.query(Post.post_id)
+    if args["street"]:
+        key = normalize_address(args["street"])
+        if zip_code:
+            # Single seek on idx_post_zip_address.
+            q = q.filter(Post.zip_code == zip_code, Post.address_key == key)
+        else:
+            q = q.filter(Post.address_hash == address_hash(key))
+    elif zip_code:
+        q = q.filter(Post.zip_code == zip_code)
+    elif not args["city"] and not args["state"]:
+        return render_template("main/search.html", search=args, posts=None)
+
+    if args["state"]:
+        q = q.filter(Post.state == args["state"])
+    if args["city"]:
+        q = q.filter(Post.city == args["city"])
+
+    rows = (
+        q.order_by(Post.created_at.desc(), Post.post_id.desc())
+        .limit(SEARCH_RESULT_LIMIT)
+        .all()
+    )
+    return render_template(
+        "main/search.html",
+        search=args,
+        posts=assemble_listings([r.post_id for r in rows]),
+    )
+
+
+def _keyword_search(args, zip_code):
+    values = decode_cursor(request.args.get("cursor"), 2)
+    after = decode_ranked_after(values) if values else None
+
+    page, next_after = search_posts(
+        args["q"],
+        state=args["state"] or None,
+        city=args["city"] or None,
+        zip_code=zip_code or None,
+        limit=SEARCH_RESULT_LIMIT,
+        after=after,
+    )
+
+    return render_template(
+        "main/search.html",
+        search=args,
+        posts=assemble_listings([post_id for post_id, _ in page]),
+        next_cursor=encode_cursor(*next_after) if next_after else None,
+    )
@@ -0,0 +1,156 @@
+from flask import Blueprint, abort, current_app, request, url_for
+from sqlalchemy import case, exists, func, select
+from werkzeug.datastructures import ContentRange
+
+from ..extensions import db
+from ..imagecache import get_image_cache
+from ..images import VARIANT_WIDTHS, VARIANTS
+from ..models import ImageBlob, ImageReview, PostImage, PostImageVariant, ReviewStatus
+
+bp = Blueprint("media", __name__)
+
+# Images never change once stored.
+IMAGE_MAX_AGE = 31536000
+
+
+def image_srcset(image_id):
+    # Nominal widths; an image narrower than a variant is served its next
+    # wider rendition, which is never wider than the descriptor says.
+    return ", ".join(
+        f"{url_for('media.image_variant', image_id=image_id, variant=name)} {width}w"
+        for name, width in reversed(VARIANT_WIDTHS)
+    )
+
+
+bp.add_app_template_global(image_srcset, "image_srcset")
+
+
+def _not_blocked(image_id):
+    return ~exists().where(
+        ImageReview.image_id == image_id, ImageReview.status == ReviewStatus.BLOCKED
+    )
+
+
+def _source(image_id, variant):
+    # Picks the rendition to serve: the requested variant, else the next
+    # wider one, else the original. Returns its (content_type,
+    # content_sha256, byte_size) row or None, without reading any blob.
+    # Images a moderator blocked are not served at all.
+    wider = VARIANTS[: VARIANTS.index(variant) + 1][::-1]
+    derived = [v for v in wider if v != "full"]
+    if derived:
+        preference = case(
+            {v: i for i, v in enumerate(derived)}, value=PostImageVariant.variant
+        )
+        meta = db.session.execute(
+            select(
+                PostImageVariant.content_type,
+                PostImageVariant.content_sha256,
+                ImageBlob.byte_size,
+            )
+            .join(
+                ImageBlob, ImageBlob.content_sha256 == PostImageVariant.content_sha256
+            )
+            .where(
+                PostImageVariant.image_id == image_id,
+                PostImageVariant.variant.in_(derived),
+                _not_blocked(image_id),
+            )
+            .order_by(preference)
+            .limit(1)
+        ).first()
+        if meta is not None:
+            return meta
+
+    return db.session.execute(
+        select(PostImage.content_type, PostImage.content_sha256, ImageBlob.byte_size)
+        .join(ImageBlob, ImageBlob.content_sha256 == PostImage.content_sha256)
+        .where(PostImage.image_id == image_id, _not_blocked(image_id))
+    ).first()
+
+
+def _finish(resp, etag, bytes_read):
+    resp.set_etag(etag)
+    resp.accept_ranges = "bytes"
+    resp.cache_control.public = True
+    resp.cache_control.max_age = IMAGE_MAX_AGE
+    resp.cache_control.immutable = True
+    # Per-request metric: blob bytes transferred from MariaDB.
+    resp.headers["X-DB-Bytes-Read"] = str(bytes_read)
+    return resp
+
+
+def _requested_range(etag, length):
+    # (start, stop) for a single satisfiable range, "unsatisfiable", or None
+    # to send the whole image.
+    if request.range is None or len(request.range.ranges) != 1:
+        return None
+    if_range = request.if_range
+    if (if_range.etag or if_range.date) and if_range.etag != etag:
+        return None
+    rng = request.range.range_for_length(length)
+    return rng if rng is not None else "unsatisfiable"
+
+
+def _send_image(image_id, variant):
+    meta = _source(image_id, variant)
+    if meta is None:
+        abort(404)
+    response_class = current_app.response_class
+
+    # Blobs are content-addressed, so the key is also a strong validator.
+    etag = meta.content_sha256
+    if request.if_none_match.contains(etag):
+        return _finish(response_class(status=304), etag, 0)
+
+    length = meta.byte_size
+    rng = _requested_range(etag, length)
+    if rng == "unsatisfiable":
+        resp = response_class(status=416)
+        resp.content_range = ContentRange("bytes", None, None, length)
+        return _finish(resp, etag, 0)
+
+    # Hot images come from the host-wide cache.
+    cache = get_image_cache()
+    if cache is not None:
+        start, stop = rng or (0, length)
+        data = cache.get(image_id, variant, etag, start, stop)
+        if data is not None:
+            resp = response_class(data, mimetype=meta.content_type)
+            if rng is not None:
+                resp.status_code = 206
+                resp.content_range = ContentRange("bytes", start, stop, length)
+            resp.headers["X-Image-Cache"] = "HIT"
+            return _finish(resp, etag, 0)
+
+    blob = ImageBlob.content_sha256 == etag
+    if rng is None:
+        stmt = select(ImageBlob.image_bytes).where(blob)
+        data = db.session.execute(stmt).scalar_one()
+        resp = response_class(data, mimetype=meta.content_type)
+        if cache is not None:
+            cache.put(image_id, variant, etag, data)
+            resp.headers["X-Image-Cache"] = "MISS"
+        return _finish(resp, etag, len(data))
+
+    # Only the requested slice leaves the database.
+    start, stop = rng
+    piece = func.substring(ImageBlob.image_bytes, start + 1, stop - start)
+    data = db.session.execute(select(piece).where(blob)).scalar_one()
+    resp = response_class(data, status=206, mimetype=meta.content_type)
+    resp.content_range = ContentRange("bytes", start, stop, length)
+    if cache is not None:
+        resp.headers["X-Image-Cache"] = "MISS"
+    return _finish(resp, etag, len(data))
+
+
+@bp.get("/img/<int:image_id>")
+def image(image_id):
+    return _send_image(image_id, "full")
+
+
+@bp.get("/img/<int:image_id>/<variant>")
+def image_variant(image_id, variant):
+    if variant not in VARIANTS:
+        abort(404)
+    return _send_image(image_id, variant)
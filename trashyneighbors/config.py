@@ -43,6 +43,10 @@ def load_site_config():
     )
 
     mail_cfg = parser["mail"] if "mail" in parser else {}
+    images_cfg = parser["images"] if "images" in parser else {}
+    nsfw_cfg = parser["nsfw"] if "nsfw" in parser else {}
+    uploads_cfg = parser["uploads"] if "uploads" in parser else {}
+    audit_cfg = parser["audit"] if "audit" in parser else {}
 
     cfg = {
         "SECRET_KEY": secret_key,
@@ -67,6 +71,94 @@ def load_site_config():
         "TRASHYNEIGHBORS_GOOGLE_OAUTH_CLIENT_SECRET": app_cfg.get(
             "google_oauth_client_secret", ""
         ),
+        "TRASHYNEIGHBORS_ZIP_INDEX_RECHECK_SECONDS": int(
+            app_cfg.get("zip_index_recheck_seconds", "60")
+        ),
+        "TRASHYNEIGHBORS_REFERENCE_CACHE_MAX_AGE": int(
+            app_cfg.get("reference_cache_max_age", "604800")
+        ),
+        "TRASHYNEIGHBORS_SEARCH_CACHE_TTL_SECONDS": int(
+            app_cfg.get("search_cache_ttl_seconds", "30")
+        ),
+        "TRASHYNEIGHBORS_SEARCH_CACHE_ENTRIES": int(
+            app_cfg.get("search_cache_entries", "2048")
+        ),
+        "TRASHYNEIGHBORS_FRAGMENT_CACHE_MAX_BYTES": int(
+            app_cfg.get("fragment_cache_max_bytes", "33554432")
+        ),
+        "TRASHYNEIGHBORS_FACET_CACHE_RECHECK_SECONDS": int(
+            app_cfg.get("facet_cache_recheck_seconds", "5")
+        ),
+        "TRASHYNEIGHBORS_TRENDING_HALF_LIFE_HOURS": float(
+            app_cfg.get("trending_half_life_hours", "24")
+        ),
+        "TRASHYNEIGHBORS_TRENDING_VIEW_FLUSH_SECONDS": int(
+            app_cfg.get("trending_view_flush_seconds", "30")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_MAX_DIMENSION": int(
+            images_cfg.get("max_dimension", "2048")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_MAX_PIXELS": int(
+            images_cfg.get("max_source_pixels", "50000000")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_FORMAT": images_cfg.get("format", "webp").lower(),
+        "TRASHYNEIGHBORS_IMAGE_WEBP_QUALITY": int(
+            images_cfg.get("webp_quality", "78")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_AVIF_QUALITY": int(
+            images_cfg.get("avif_quality", "55")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_ENCODE_EFFORT": int(
+            images_cfg.get("encode_effort", "4")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_WORKERS": int(images_cfg.get("workers", "2")),
+        "TRASHYNEIGHBORS_IMAGE_TIMEOUT_SECONDS": int(
+            images_cfg.get("timeout_seconds", "30")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_CACHE_PATH": images_cfg.get(
+            "cache_path", "/dev/shm/trashyneighbors-images.cache"
+        ),
+        "TRASHYNEIGHBORS_IMAGE_CACHE_BYTES": int(
+            images_cfg.get("cache_bytes", "67108864")
+        ),
+        "TRASHYNEIGHBORS_IMAGE_CACHE_MAX_ITEM_BYTES": int(
+            images_cfg.get("cache_max_item_bytes", "1048576")
+        ),
+        "TRASHYNEIGHBORS_PHASH_INDEX_RECHECK_SECONDS": int(
+            images_cfg.get("phash_index_recheck_seconds", "30")
+        ),
+        "TRASHYNEIGHBORS_PHASH_INDEX_REBUILD_SECONDS": int(
+            images_cfg.get("phash_index_rebuild_seconds", "3600")
+        ),
+        "TRASHYNEIGHBORS_NSFW_MODEL": nsfw_cfg.get(
+            "model", "trashyneighbors.nsfw:StubModel"
+        ),
+        "TRASHYNEIGHBORS_NSFW_THRESHOLD": float(nsfw_cfg.get("threshold", "0.4")),
+        "TRASHYNEIGHBORS_NSFW_BATCH_SIZE": int(nsfw_cfg.get("batch_size", "32")),
+        "TRASHYNEIGHBORS_NSFW_WORKERS": int(nsfw_cfg.get("workers", "2")),
+        "TRASHYNEIGHBORS_NSFW_POLL_SECONDS": float(
+            nsfw_cfg.get("poll_seconds", "5")
+        ),
+        "TRASHYNEIGHBORS_UPLOAD_MAX_FILE_BYTES": int(
+            uploads_cfg.get("max_file_bytes", "16777216")
+        ),
+        "TRASHYNEIGHBORS_UPLOAD_MAX_REQUEST_BYTES": int(
+            uploads_cfg.get("max_request_bytes", "67108864")
+        ),
+        "TRASHYNEIGHBORS_UPLOAD_MAX_FILES": int(uploads_cfg.get("max_files", "8")),
+        "TRASHYNEIGHBORS_UPLOAD_SPOOL_BYTES": int(
+            uploads_cfg.get("spool_bytes", "1048576")
+        ),
+        "TRASHYNEIGHBORS_UPLOAD_TMP_DIR": uploads_cfg.get("tmp_dir", ""),
+        "TRASHYNEIGHBORS_AUDIT_BUFFERED": (
+            audit_cfg.get("buffered", "true").lower() in ("1", "true", "yes", "on")
+        ),
+        "TRASHYNEIGHBORS_AUDIT_QUEUE_SIZE": int(audit_cfg.get("queue_size", "10000")),
+        "TRASHYNEIGHBORS_AUDIT_BATCH_SIZE": int(audit_cfg.get("batch_size", "500")),
+        "TRASHYNEIGHBORS_AUDIT_FLUSH_MS": int(audit_cfg.get("flush_ms", "20")),
+        "TRASHYNEIGHBORS_AUDIT_PUT_TIMEOUT_MS": int(
+            audit_cfg.get("put_timeout_ms", "250")
+        ),
     }
 
     return cfg
@@ -0,0 +1,368 @@
+import re
+import struct
+from datetime import datetime, timedelta, timezone
+
+SOI = b"\xff\xd8"
+_APP0 = 0xE0
+_APP1 = 0xE1
+_APP2 = 0xE2
+_APP14 = 0xEE
+_APP15 = 0xEF
+_SOS = 0xDA
+_EOI = 0xD9
+_COM = 0xFE
+# TEM and RSTn carry no length field.
+_STANDALONE = frozenset([0x01, *range(0xD0, 0xD8)])
+
+EXIF_HEADER = b"Exif\x00\x00"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+# Application segments the decoder needs: JFIF/JFXX, the colour profile and
+# Adobe's colour-transform flag. Everything else in APPn is metadata.
+_KEEP_APP = (
+    (_APP0, b"JFIF\x00"),
+    (_APP0, b"JFXX\x00"),
+    (_APP2, b"ICC_PROFILE\x00"),
+)
+
+COPY_CHUNK = 65536
+
+_TAG_ORIENTATION = 0x0112
+_TAG_DATETIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+_TAG_GPS_LAT_REF = 1
+_TAG_GPS_LAT = 2
+_TAG_GPS_LON_REF = 3
+_TAG_GPS_LON = 4
+
+# TIFF field type -> (struct code, size)
+_TYPES = {1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8)}
+
+
+class MetadataError(ValueError):
+    pass
+
+
+def _read_exact(stream, n):
+    data = stream.read(n)
+    if len(data) != n:
+        raise MetadataError("Truncated JPEG")
+    return data
+
+
+def _skip(stream, n):
+    if stream.seekable():
+        stream.seek(n, 1)
+        return
+    while n:
+        chunk = stream.read(min(n, COPY_CHUNK))
+        if not chunk:
+            raise MetadataError("Truncated JPEG")
+        n -= len(chunk)
+
+
+def _segments(stream):
+    # Yields (marker, payload_length) for each segment up to and including
+    # SOS. The caller consumes exactly payload_length bytes from the stream
+    # before asking for the next one. Only the current segment is ever
+    # buffered, and segments are at most 64 KiB.
+    while True:
+        byte = _read_exact(stream, 1)
+        if byte != b"\xff":
+            raise MetadataError("Expected a JPEG marker")
+        while byte == b"\xff":
+            byte = _read_exact(stream, 1)
+        marker = byte[0]
+        if marker == _EOI:
+            return
+        if marker in _STANDALONE:
+            yield marker, 0
+            continue
+        (length,) = struct.unpack(">H", _read_exact(stream, 2))
+        if length < 2:
+            raise MetadataError("Invalid JPEG segment length")
+        yield marker, length - 2
+        if marker == _SOS:
+            return
+
+
+def _ifd(tiff, order, offset):
+    # {tag: (type, count, value_or_offset_bytes)} for one IFD.
+    (count,) = struct.unpack_from(order + "H", tiff, offset)
+    entries = {}
+    for i in range(count):
+        tag, typ, n, raw = struct.unpack_from(
+            order + "HHI4s", tiff, offset + 2 + i * 12
+        )
+        entries[tag] = (typ, n, raw)
+    return entries
+
+
+def _value(tiff, order, entry):
+    typ, n, raw = entry
+    if typ not in _TYPES:
+        return None
+    code, size = _TYPES[typ]
+    if not 0 < n * size <= len(tiff):
+        return None
+    data = raw
+    if n * size > 4:
+        (offset,) = struct.unpack(order + "I", raw)
+        data = tiff[offset : offset + n * size]
+        if len(data) != n * size:
+            return None
+    if typ == 2:
+        return data[:n].split(b"\x00", 1)[0].decode("ascii", "replace").strip()
+    values = struct.unpack_from(order + code * n, data)
+    if typ == 5:
+        return [
+            values[i] / values[i + 1] if values[i + 1] else None
+            for i in range(0, len(values), 2)
+        ]
+    return values[0] if n == 1 else list(values)
+
+
+def _pointer(tiff, order, entries, tag):
+    entry = entries.get(tag)
+    if entry is None or entry[0] != 4:
+        return None
+    return struct.unpack(order + "I", entry[2])[0]
+
+
+def _degrees(parts, ref, negative_ref):
+    if not isinstance(parts, list) or len(parts) != 3 or None in parts:
+        return None
+    value = parts[0] + parts[1] / 60 + parts[2] / 3600
+    return -value if ref == negative_ref else value
+
+
+def _timestamp(text, offset=None):
+    try:
+        taken = datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+    if offset:
+        # "+HH:MM"; stored naive UTC like every other timestamp.
+        m = re.fullmatch(r"([+-])(\d\d):(\d\d)", offset)
+        if m:
+            delta = timedelta(hours=int(m.group(2)), minutes=int(m.group(3)))
+            taken = taken - delta if m.group(1) == "+" else taken + delta
+    return taken
+
+
+def _parse_exif(tiff, meta):
+    if tiff[:2] == b"II":
+        order = "<"
+    elif tiff[:2] == b"MM":
+        order = ">"
+    else:
+        return
+    (ifd0_offset,) = struct.unpack_from(order + "I", tiff, 4)
+    ifd0 = _ifd(tiff, order, ifd0_offset)
+
+    if _TAG_ORIENTATION in ifd0:
+        orientation = _value(tiff, order, ifd0[_TAG_ORIENTATION])
+        if orientation in range(1, 9):
+            meta["orientation"] = orientation
+
+    taken = None
+    offset = _pointer(tiff, order, ifd0, _TAG_EXIF_IFD)
+    if offset is not None:
+        exif_ifd = _ifd(tiff, order, offset)
+        if _TAG_DATETIME_ORIGINAL in exif_ifd:
+            tz = exif_ifd.get(_TAG_OFFSET_TIME_ORIGINAL)
+            taken = _timestamp(
+                _value(tiff, order, exif_ifd[_TAG_DATETIME_ORIGINAL]),
+                _value(tiff, order, tz) if tz else None,
+            )
+    if taken is None and _TAG_DATETIME in ifd0:
+        taken = _timestamp(_value(tiff, order, ifd0[_TAG_DATETIME]))
+    meta["taken_at"] = taken
+
+    offset = _pointer(tiff, order, ifd0, _TAG_GPS_IFD)
+    if offset is not None:
+        gps = _ifd(tiff, order, offset)
+        if _TAG_GPS_LAT in gps and _TAG_GPS_LON in gps:
+            lat_ref = gps.get(_TAG_GPS_LAT_REF)
+            lon_ref = gps.get(_TAG_GPS_LON_REF)
+            lat = _degrees(
+                _value(tiff, order, gps[_TAG_GPS_LAT]),
+                _value(tiff, order, lat_ref) if lat_ref else "N",
+                "S",
+            )
+            lon = _degrees(
+                _value(tiff, order, gps[_TAG_GPS_LON]),
+                _value(tiff, order, lon_ref) if lon_ref else "E",
+                "W",
+            )
+            if lat is not None and lon is not None and abs(lat) <= 90:
+                if abs(lon) <= 180:
+                    meta["latitude"] = lat
+                    meta["longitude"] = lon
+
+
+def _xmp_field(xmp, name):
+    # Attribute form (exif:GPSLatitude="...") or element form.
+    m = re.search(
+        rb"\b" + name + rb'\s*=\s*"([^"]*)"|<' + name + rb">([^<]*)</" + name + rb">",
+        xmp,
+    )
+    if m is None:
+        return None
+    return (m.group(1) or m.group(2) or b"").decode("utf-8", "replace").strip()
+
+
+def _xmp_degrees(text, positive, negative):
+    # "DDD,MM,SSk" or "DDD,MM.mmk" with k the hemisphere letter.
+    m = re.fullmatch(r"(\d+),(\d+(?:\.\d+)?)(?:,(\d+(?:\.\d+)?))?([NSEW])", text or "")
+    if m is None or m.group(4) not in (positive, negative):
+        return None
+    value = int(m.group(1)) + float(m.group(2)) / 60 + float(m.group(3) or 0) / 3600
+    return -value if m.group(4) == negative else value
+
+
+def _xmp_timestamp(text):
+    try:
+        taken = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    if taken.tzinfo is not None:
+        taken = taken.astimezone(timezone.utc).replace(tzinfo=None)
+    return taken
+
+
+def _parse_xmp(xmp, meta):
+    # Fills only what the Exif segment did not provide.
+    if meta["orientation"] is None:
+        value = _xmp_field(xmp, rb"tiff:Orientation")
+        if value and value.isdigit() and 1 <= int(value) <= 8:
+            meta["orientation"] = int(value)
+    if meta["taken_at"] is None:
+        for name in (rb"exif:DateTimeOriginal", rb"xmp:CreateDate"):
+            taken = _xmp_timestamp(_xmp_field(xmp, name))
+            if taken is not None:
+                meta["taken_at"] = taken
+                break
+    if meta["latitude"] is None:
+        lat = _xmp_degrees(_xmp_field(xmp, rb"exif:GPSLatitude"), "N", "S")
+        lon = _xmp_degrees(_xmp_field(xmp, rb"exif:GPSLongitude"), "E", "W")
+        if lat is not None and lon is not None and abs(lat) <= 90:
+            if abs(lon) <= 180:
+                meta["latitude"] = lat
+                meta["longitude"] = lon
+
+
+def read_metadata(stream):
+    # Reads GPS position, orientation and capture time from a JPEG stream
+    # without decoding it: only the APP1 segments are read, everything
+    # before the scan data is skipped over. Non-JPEG input gives an empty
+    # result; a truncated header raises MetadataError. Malformed Exif or
+    # XMP is ignored.
+    meta = {
+        "latitude": None,
+        "longitude": None,
+        "orientation": None,
+        "taken_at": None,
+    }
+    if stream.read(2) != SOI:
+        return meta
+
+    exif = xmp = None
+    for marker, length in _segments(stream):
+        if marker == _SOS:
+            break
+        if marker != _APP1 or (exif is not None and xmp is not None):
+            _skip(stream, length)
+            continue
+        payload = _read_exact(stream, length)
+        if exif is None and payload.startswith(EXIF_HEADER):
+            exif = payload[len(EXIF_HEADER) :]
+        elif xmp is None and payload.startswith(XMP_HEADER):
+            xmp = payload[len(XMP_HEADER) :]
+
+    if exif is not None:
+        try:
+            _parse_exif(exif, meta)
+        except (struct.error, ValueError):
+            pass
+    if xmp is not None:
+        _parse_xmp(xmp, meta)
+    return meta
+
+
+def _orientation_segment(orientation):
+    # A one-entry big-endian Exif IFD0 carrying only the orientation.
+    tiff = b"MM\x00\x2a" + struct.pack(
+        ">IHHHIHHI", 8, 1, _TAG_ORIENTATION, 3, 1, orientation, 0, 0
+    )
+    payload = EXIF_HEADER + tiff
+    return b"\xff" + bytes([_APP1]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _keep_segment(marker, payload_head):
+    if marker == _COM:
+        return False
+    if _APP0 <= marker <= _APP15:
+        if marker == _APP14:
+            return payload_head.startswith(b"Adobe")
+        return any(marker == m and payload_head.startswith(p) for m, p in _KEEP_APP)
+    return True
+
+
+def strip_metadata(src, dst, chunk_size=COPY_CHUNK):
+    # Copies a JPEG from src to dst without Exif, XMP, comments or other
+    # metadata segments. Tables, frame headers and the compressed scan data
+    # are copied byte for byte, so nothing is re-encoded. A non-default
+    # orientation survives as a minimal Exif segment so the image still
+    # displays upright. Returns the number of bytes written.
+    if src.read(2) != SOI:
+        raise MetadataError("Not a JPEG")
+    dst.write(SOI)
+    written = 2
+
+    for marker, length in _segments(src):
+        header = b"\xff" + bytes([marker])
+        if marker in _STANDALONE:
+            dst.write(header)
+            written += 2
+            continue
+
+        head = b""
+        if _APP0 <= marker <= _APP15 or marker == _COM:
+            head = _read_exact(src, min(length, len(XMP_HEADER)))
+        keep = _keep_segment(marker, head)
+
+        if marker == _APP1 and head.startswith(EXIF_HEADER):
+            payload = head + _read_exact(src, length - len(head))
+            meta = {"orientation": None, "taken_at": None, "latitude": None}
+            try:
+                _parse_exif(payload[len(EXIF_HEADER) :], meta)
+            except (struct.error, ValueError):
+                pass
+            if meta["orientation"] not in (None, 1):
+                segment = _orientation_segment(meta["orientation"])
+                dst.write(segment)
+                written += len(segment)
+            continue
+
+        if not keep:
+            _skip(src, length - len(head))
+            continue
+
+        dst.write(header + struct.pack(">H", length + 2) + head)
+        dst.write(_read_exact(src, length - len(head)))
+        written += 4 + length
+
+        if marker == _SOS:
+            # Entropy-coded data, restart markers and EOI: copied verbatim.
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                written += len(chunk)
+            break
+
+    return written
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.dialects.mysql import insert
+
+from .extensions import db
+from .models import CacheVersion, Post, PostFacetCount
+
+FACET_CACHE_NAME = "post_facets"
+
+_lock = threading.Lock()
+_tree = None
+_checked_at = 0.0
+
+
+def bump_version(connection, name):
+    table = CacheVersion.__table__
+    stmt = insert(table).values(name=name, version=1)
+    connection.execute(stmt.on_duplicate_key_update(version=table.c.version + 1))
+
+
+@event.listens_for(Post, "after_insert")
+def _post_inserted(mapper, connection, target):
+    table = PostFacetCount.__table__
+    stmt = insert(table).values(
+        state=target.state, city=target.city, zip_code=target.zip_code, post_count=1
+    )
+    connection.execute(
+        stmt.on_duplicate_key_update(post_count=table.c.post_count + 1)
+    )
+    bump_version(connection, FACET_CACHE_NAME)
+
+
+class FacetTree:
+    # State -> city -> ZIP post counts. States are alphabetical, cities and
+    # ZIPs busiest first.
+    __slots__ = ("version", "states", "state_counts", "cities", "city_counts", "zips")
+
+    def __init__(self, rows, version):
+        # rows: (state, city, zip_code, post_count)
+        self.version = version
+        self.state_counts = {}
+        self.city_counts = {}
+        zips = {}
+        for state, city, zip_code, count in rows:
+            self.state_counts[state] = self.state_counts.get(state, 0) + count
+            key = (state, city)
+            self.city_counts[key] = self.city_counts.get(key, 0) + count
+            zips.setdefault(key, []).append((zip_code, count))
+
+        self.states = sorted(self.state_counts.items())
+        self.cities = {}
+        for (state, city), count in self.city_counts.items():
+            self.cities.setdefault(state, []).append((city, count))
+        for options in self.cities.values():
+            options.sort(key=lambda o: (-o[1], o[0]))
+        self.zips = {
+            key: sorted(options, key=lambda o: (-o[1], o[0]))
+            for key, options in zips.items()
+        }
+
+    def drilldown(self, state=None, city=None):
+        # Returns (trail, field, options): trail is the selected
+        # [(field, value, count)], options the next level's [(value, count)].
+        if not state:
+            return [], "state", self.states
+
+        trail = [("state", state, self.state_counts.get(state, 0))]
+        if not city:
+            return trail, "city", self.cities.get(state, [])
+
+        trail.append(("city", city, self.city_counts.get((state, city), 0)))
+        return trail, "zip", self.zips.get((state, city), [])
+
+
+def _current_version():
+    version = (
+        db.session.query(CacheVersion.version)
+        .filter(CacheVersion.name == FACET_CACHE_NAME)
+        .scalar()
+    )
+    return version or 0
+
+
+def _load_tree(version):
+    rows = db.session.query(
+        PostFacetCount.state,
+        PostFacetCount.city,
+        PostFacetCount.zip_code,
+        PostFacetCount.post_count,
+    ).filter(PostFacetCount.post_count > 0)
+    return FacetTree(rows, version)
+
+
+def get_facet_tree():
+    global _tree, _checked_at
+
+    recheck = current_app.config["TRASHYNEIGHBORS_FACET_CACHE_RECHECK_SECONDS"]
+
+    tree = _tree
+    if tree is not None and time.monotonic() - _checked_at < recheck:
+        return tree
+
+    with _lock:
+        if _tree is not None and time.monotonic() - _checked_at < recheck:
+            return _tree
+
+        version = _current_version()
+        if _tree is None or _tree.version != version:
+            _tree = _load_tree(version)
+        _checked_at = time.monotonic()
+        return _tree
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from .extensions import db
+from .models import Post
+
+
+def recent_post_ids(state=None, city=None, zip_code=None, limit=20, after=None):
+    # Newest first on (created_at, post_id). Each filter combination has a
+    # matching (filter..., created_at, post_id) index, so every page is a
+    # single index range read no matter how deep. `after` is the
+    # (created_at, post_id) of the last row of the previous page.
+    q = db.session.query(Post.post_id, Post.created_at)
+    if zip_code:
+        q = q.filter(Post.zip_code == zip_code)
+    if state:
+        q = q.filter(Post.state == state)
+    if city:
+        q = q.filter(Post.city == city)
+    if after is not None:
+        created_at, post_id = after
+        q = q.filter(
+            or_(
+                Post.created_at < created_at,
+                and_(Post.created_at == created_at, Post.post_id < post_id),
+            )
+        )
+
+    rows = (
+        q.order_by(Post.created_at.desc(), Post.post_id.desc()).limit(limit + 1).all()
+    )
+    page = rows[:limit]
+    next_after = (page[-1].created_at, page[-1].post_id) if len(rows) > limit else None
+    return [r.post_id for r in page], next_after
+
+
+def encode_after(after):
+    created_at, post_id = after
+    return created_at.isoformat(), post_id
+
+
+def decode_after(values):
+    # Inverse of encode_after for decoded cursor values; None if invalid.
+    try:
+        return datetime.fromisoformat(values[0]), int(values[1])
+    except (TypeError, ValueError):
+        return None
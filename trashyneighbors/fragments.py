@@ -0,0 +1,103 @@
+import re
+import secrets
+
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import update
+
+from .cache import ByteLRUCache
+from .extensions import db
+from .models import Post
+
+# Counters change on every vote and comment, so fragments are rendered with
+# a marker in their place and the current values are spliced in per request.
+# The per-process token keeps user text from forging a marker.
+COUNTER_FIELDS = ("like_count", "dislike_count", "comment_count")
+
+_TOKEN = secrets.token_hex(8)
+_MARKER = "\x00" + _TOKEN + ":{}\x00"
+_MARKER_RE = re.compile(
+    "\x00" + _TOKEN + ":({})\x00".format("|".join(COUNTER_FIELDS))
+)
+
+_cache = None
+
+
+def _counter_marker(field):
+    return Markup(_MARKER.format(field))
+
+
+class Fragment:
+    # Rendered HTML split around its counters: parts[0], fields[0], parts[1],
+    # fields[1], ..., parts[-1].
+    __slots__ = ("parts", "fields", "size")
+
+    def __init__(self, html):
+        pieces = _MARKER_RE.split(html)
+        self.parts = tuple(pieces[0::2])
+        self.fields = tuple(pieces[1::2])
+        self.size = sum(len(p.encode("utf-8")) for p in self.parts)
+
+    def render(self, values):
+        out = [self.parts[0]]
+        for field, part in zip(self.fields, self.parts[1:]):
+            out.append(str(int(getattr(values, field))))
+            out.append(part)
+        return Markup("".join(out))
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ByteLRUCache(
+            current_app.config["TRASHYNEIGHBORS_FRAGMENT_CACHE_MAX_BYTES"]
+        )
+    return _cache
+
+
+def _fragment(kind, post_id, content_version, render):
+    cache = _get_cache()
+    key = (kind, post_id, content_version)
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = Fragment(render())
+        cache.set(key, fragment, fragment.size)
+    return fragment
+
+
+def render_post_card(card):
+    # card: a listings.ListingCard.
+    template = current_app.jinja_env.get_template("main/_post_card.html")
+    fragment = _fragment(
+        "card",
+        card.post_id,
+        card.content_version,
+        lambda: template.render(post=card, counter=_counter_marker),
+    )
+    return fragment.render(card)
+
+
+def render_post_body(counts, load):
+    # counts: a row with post_id, content_version and the counters; load()
+    # returns (post, names, image_ids) and only runs on a cache miss.
+    template = current_app.jinja_env.get_template("main/_post_body.html")
+
+    def render():
+        post, names, image_ids = load()
+        return template.render(
+            post=post, names=names, image_ids=image_ids, counter=_counter_marker
+        )
+
+    fragment = _fragment("body", counts.post_id, counts.content_version, render)
+    return fragment.render(counts)
+
+
+def bump_content_version(post_id):
+    # For the edit-request approval path: call in the transaction that
+    # applies the approved edit. Every worker's cached fragments for the
+    # post stop matching and age out of their LRU.
+    db.session.execute(
+        update(Post)
+        .where(Post.post_id == post_id)
+        .values(content_version=Post.content_version + 1)
+    )
@@ -0,0 +1,194 @@
+import math
+from array import array
+
+EARTH_RADIUS_MI = 3958.7613
+MI_PER_DEG_LAT = 69.055
+
+
+def haversine_mi(lat1, lon1, lat2, lon2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MI * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat, lon, cell_deg):
+    return (math.floor(lat / cell_deg), math.floor(lon / cell_deg))
+
+
+def _ring_cells(ci, cj, ring):
+    if ring == 0:
+        yield (ci, cj)
+        return
+    for dj in range(-ring, ring + 1):
+        yield (ci - ring, cj + dj)
+        yield (ci + ring, cj + dj)
+    for di in range(-ring + 1, ring):
+        yield (ci + di, cj - ring)
+        yield (ci + di, cj + ring)
+
+
+def _ring_min_mi(lat, ring, cell_deg, within_mi):
+    # Lower bound on the distance to any point within `within_mi` that sits
+    # in a cell `ring` steps away. Longitude degrees shrink towards the
+    # poles, but only as far as such a point's latitude can reach.
+    if ring <= 1:
+        return 0.0
+    reach = min(ring + 1, within_mi / (MI_PER_DEG_LAT * cell_deg) + 1)
+    far_lat = min(89.9, abs(lat) + reach * cell_deg)
+    span = (ring - 1) * cell_deg * MI_PER_DEG_LAT
+    # 1% slack: a great circle is slightly shorter than the parallel arc.
+    return 0.99 * span * math.cos(math.radians(far_lat))
+
+
+class GeoGrid:
+    # Two uniform lat/lon bucket grids. nearest() walks square rings of fine
+    # cells outwards (dense metros) and, if that has not settled after a few
+    # rings, finishes on the coarse grid (rural areas, open water).
+    __slots__ = (
+        "fine_deg",
+        "coarse_deg",
+        "fine_rings",
+        "fine",
+        "coarse",
+        "latitudes",
+        "longitudes",
+        "refs",
+    )
+
+    def __init__(self, points, fine_deg=0.05, coarse_deg=0.5, fine_rings=4):
+        # points: (latitude, longitude, ref)
+        self.fine_deg = fine_deg
+        self.coarse_deg = coarse_deg
+        self.fine_rings = fine_rings
+        self.fine = {}
+        self.coarse = {}
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.refs = []
+
+        for lat, lon, ref in points:
+            i = len(self.refs)
+            self.latitudes.append(lat)
+            self.longitudes.append(lon)
+            self.refs.append(ref)
+            self.fine.setdefault(_cell(lat, lon, fine_deg), []).append(i)
+            self.coarse.setdefault(_cell(lat, lon, coarse_deg), []).append(i)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def _walk(self, cells, cell_deg, lat, lon, best_i, best_d, max_ring):
+        ci, cj = _cell(lat, lon, cell_deg)
+        ring = 0
+        while _ring_min_mi(lat, ring, cell_deg, best_d) <= best_d:
+            if max_ring is not None and ring > max_ring:
+                return best_i, best_d, False
+            for cell in _ring_cells(ci, cj, ring):
+                for i in cells.get(cell, ()):
+                    d = haversine_mi(lat, lon, self.latitudes[i], self.longitudes[i])
+                    if d <= best_d:
+                        best_i, best_d = i, d
+            ring += 1
+        return best_i, best_d, True
+
+    def nearest(self, lat, lon, max_mi=100.0):
+        if not self.refs:
+            return None
+
+        best_i, best_d, done = self._walk(
+            self.fine, self.fine_deg, lat, lon, None, max_mi, self.fine_rings
+        )
+        if not done:
+            best_i, best_d, _ = self._walk(
+                self.coarse, self.coarse_deg, lat, lon, best_i, best_d, None
+            )
+
+        if best_i is None:
+            return None
+        return self.refs[best_i], best_d
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    out = []
+    bits = 0
+    ch = 0
+    even = True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = (ch << 1) | 1
+                lon_lo = mid
+            else:
+                ch <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(GEOHASH_ALPHABET[ch])
+            bits = 0
+            ch = 0
+    return "".join(out)
+
+
+def geohash_cell_deg(precision):
+    # (height, width) in degrees of one geohash cell.
+    total = 5 * precision
+    lon_bits = (total + 1) // 2
+    lat_bits = total // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _far_cos(lat, radius_mi):
+    # cos() of the most poleward latitude within radius_mi of lat.
+    far_lat = min(89.0, abs(lat) + radius_mi / MI_PER_DEG_LAT)
+    return max(0.01, math.cos(math.radians(far_lat)))
+
+
+def geohash_cover(lat, lon, radius_mi):
+    # Prefixes of the 3x3 block of geohash cells around (lat, lon) at the
+    # finest precision whose cells are still at least radius_mi across, so
+    # the block covers every point within radius_mi.
+    cos_lat = _far_cos(lat, radius_mi)
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_deg(p)
+        if (
+            height * MI_PER_DEG_LAT >= radius_mi
+            and width * MI_PER_DEG_LAT * cos_lat >= radius_mi
+        ):
+            precision = p
+            break
+
+    height, width = geohash_cell_deg(precision)
+    prefixes = set()
+    for dlat in (-height, 0.0, height):
+        for dlon in (-width, 0.0, width):
+            plat = max(-89.999999, min(89.999999, lat + dlat))
+            plon = (lon + dlon + 180.0) % 360.0 - 180.0
+            prefixes.add(encode_geohash(plat, plon, precision))
+    return sorted(prefixes)
+
+
+def bounding_box(lat, lon, radius_mi):
+    dlat = radius_mi / MI_PER_DEG_LAT
+    cos_lat = _far_cos(lat, radius_mi)
+    dlon = radius_mi / (MI_PER_DEG_LAT * cos_lat)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
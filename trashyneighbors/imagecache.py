@@ -0,0 +1,324 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from contextlib import contextmanager
+
+from flask import current_app
+
+MAGIC = b"TNIMGC03"
+HEADER_BYTES = 4096
+CHUNK_BYTES = 8192
+
+# magic, chunk_bytes, n_chunks, n_slots, then the mutable fields below.
+_HEADER = struct.Struct("<8sIIIIIiIIqqqqq")
+_HAND, _ENTRIES, _FREE_HEAD, _FREE_COUNT, _DIRTY = 4, 5, 6, 7, 8
+_USED_BYTES, _HITS, _MISSES, _INSERTS, _EVICTIONS = 9, 10, 11, 12, 13
+
+# image_id, state, referenced, size, first chunk, variant, etag
+_SLOT = struct.Struct("<qBBIi8s64s")
+_S_IMAGE_ID, _S_STATE, _S_REF, _S_SIZE, _S_FIRST, _S_VARIANT, _S_ETAG = range(7)
+_EMPTY, _USED = 0, 1
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+class SharedImageCache:
+    # Image bytes shared by every worker on the host through one
+    # memory-mapped file: a slot table (linear probing on image id and
+    # variant), an arena of fixed-size chunks chained per entry with a free
+    # list, and a CLOCK hand over the slots for eviction. Entries carry the
+    # blob's ETag and a lookup only hits while it still matches, so an image
+    # that was re-encoded since is never served stale.
+    def __init__(self, path, max_bytes, max_item_bytes, chunk_bytes=CHUNK_BYTES):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.max_item_bytes = max_item_bytes
+        self.n_chunks = max(1, max_bytes // chunk_bytes)
+        # At least twice as many slots as chunks keeps probe runs short.
+        self.n_slots = 1 << max(4, (2 * self.n_chunks - 1).bit_length())
+        self._mask = self.n_slots - 1
+        self._shift = 64 - self.n_slots.bit_length() + 1
+        self._lock = threading.Lock()
+
+        next_at = HEADER_BYTES + self.n_slots * _SLOT.size
+        data_at = -(-(next_at + self.n_chunks * 4) // HEADER_BYTES) * HEADER_BYTES
+        size = data_at + self.n_chunks * chunk_bytes
+        self._fd = self._open(size)
+        try:
+            self._mm = mmap.mmap(self._fd, size)
+            view = memoryview(self._mm)
+            self._next = view[next_at : next_at + self.n_chunks * 4].cast("i")
+            self._data = view[data_at:]
+            header = _HEADER.unpack_from(self._mm, 0)
+            if header[0] != MAGIC or header[_DIRTY]:
+                self._format()
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _open(self, size):
+        # Returns the file's descriptor, locked, reusing the file if its
+        # format and geometry match and replacing it otherwise. Workers still mapping
+        # a replaced file keep using it privately until they restart,
+        # rather than faulting on a truncated mapping.
+        expected = (MAGIC, self.chunk_bytes, self.n_chunks, self.n_slots)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            st = os.fstat(fd)
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != st.st_ino:
+                # Replaced while we waited for the lock.
+                os.close(fd)
+                continue
+            if st.st_size == 0:
+                os.ftruncate(fd, size)
+                return fd
+            header = os.pread(fd, _HEADER.size, 0)
+            if st.st_size == size and _HEADER.unpack(header)[:4] == expected:
+                return fd
+            os.unlink(self.path)
+            os.close(fd)
+
+    def _format(self):
+        # Empties the cache: every slot cleared, every chunk free.
+        table = self.n_slots * _SLOT.size
+        self._mm[HEADER_BYTES : HEADER_BYTES + table] = bytes(table)
+        self._next[:-1] = array("i", range(1, self.n_chunks))
+        self._next[-1] = -1
+        _HEADER.pack_into(
+            self._mm,
+            0,
+            MAGIC,
+            self.chunk_bytes,
+            self.n_chunks,
+            self.n_slots,
+            0,
+            0,
+            0,
+            self.n_chunks,
+            0,
+            0,
+            0,
+            0,
+            0,
+            0,
+        )
+
+    @contextmanager
+    def _locked(self):
+        # flock excludes other workers, the threading lock other threads of
+        # this one (they share the descriptor, so flock alone would not).
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if _HEADER.unpack_from(self._mm, 0)[_DIRTY]:
+                    # The last writer was killed part way through a change
+                    # to the slots or chunk chains, which are no longer
+                    # trustworthy.
+                    self._format()
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _home(self, image_id, variant):
+        mixed = (image_id << 32 ^ zlib.crc32(variant)) * 0x9E3779B97F4A7C15
+        return (mixed & 0xFFFFFFFFFFFFFFFF) >> self._shift
+
+    def _slot(self, i):
+        return list(_SLOT.unpack_from(self._mm, HEADER_BYTES + i * _SLOT.size))
+
+    def _store(self, i, slot):
+        _SLOT.pack_into(self._mm, HEADER_BYTES + i * _SLOT.size, *slot)
+
+    def _find(self, image_id, variant):
+        # (slot index, slot) for the key, or (first empty index, None).
+        i = self._home(image_id, variant)
+        while True:
+            slot = self._slot(i)
+            if slot[_S_STATE] == _EMPTY:
+                return i, None
+            if slot[_S_IMAGE_ID] == image_id and slot[_S_VARIANT] == variant:
+                return i, slot
+            i = (i + 1) & self._mask
+
+    def _delete(self, i):
+        # Backward-shift deletion: later entries of the probe run move up
+        # so lookups never need tombstones.
+        mask = self._mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            slot = self._slot(j)
+            if slot[_S_STATE] == _EMPTY:
+                break
+            home = self._home(slot[_S_IMAGE_ID], slot[_S_VARIANT])
+            if (j - home) & mask >= (j - i) & mask:
+                self._store(i, slot)
+                i = j
+        at = HEADER_BYTES + i * _SLOT.size
+        self._mm[at : at + _SLOT.size] = bytes(_SLOT.size)
+
+    def _chunks(self, size):
+        return max(1, -(-size // self.chunk_bytes))
+
+    def _evict(self, i, slot, header):
+        # Returns the entry's chunk chain to the free list, whole.
+        count = self._chunks(slot[_S_SIZE])
+        last = slot[_S_FIRST]
+        for _ in range(count - 1):
+            last = self._next[last]
+        self._next[last] = header[_FREE_HEAD]
+        header[_FREE_HEAD] = slot[_S_FIRST]
+        header[_FREE_COUNT] += count
+        header[_ENTRIES] -= 1
+        header[_USED_BYTES] -= slot[_S_SIZE]
+        self._delete(i)
+
+    def _reclaim(self, need, header):
+        # CLOCK: sweep the slots from the hand, clearing reference bits and
+        # evicting unreferenced entries until `need` chunks are free. Two
+        # turns clear every bit, so this always succeeds when need fits.
+        for _ in range(3 * self.n_slots):
+            if header[_FREE_COUNT] >= need:
+                return
+            i = header[_HAND]
+            header[_HAND] = (i + 1) & self._mask
+            slot = self._slot(i)
+            if slot[_S_STATE] != _USED:
+                continue
+            if slot[_S_REF]:
+                slot[_S_REF] = 0
+                self._store(i, slot)
+                continue
+            self._evict(i, slot, header)
+            header[_EVICTIONS] += 1
+            # The shift may have moved a later entry into this slot.
+            header[_HAND] = i
+
+    def get(self, image_id, variant, etag, start=0, stop=None):
+        # Bytes [start, stop) of the cached image, or None on a miss. Copied
+        # out under the lock: once it is released another worker may reuse
+        # the chunks, and WSGI servers want bytes, not views of the arena.
+        variant = variant.encode("ascii").ljust(8, b"\0")
+        etag = etag.encode("ascii")
+        with self._locked():
+            header = list(_HEADER.unpack_from(self._mm, 0))
+            i, slot = self._find(image_id, variant)
+            if slot is None or slot[_S_ETAG].rstrip(b"\0") != etag:
+                header[_MISSES] += 1
+                _HEADER.pack_into(self._mm, 0, *header)
+                return None
+            header[_HITS] += 1
+            _HEADER.pack_into(self._mm, 0, *header)
+            if not slot[_S_REF]:
+                slot[_S_REF] = 1
+                self._store(i, slot)
+
+            stop = slot[_S_SIZE] if stop is None else min(stop, slot[_S_SIZE])
+            cb = self.chunk_bytes
+            pieces = []
+            chunk = slot[_S_FIRST]
+            for n in range(-(-stop // cb)):
+                lo = max(start - n * cb, 0)
+                hi = min(stop - n * cb, cb)
+                if lo < hi:
+                    pieces.append(self._data[chunk * cb + lo : chunk * cb + hi])
+                chunk = self._next[chunk]
+            return b"".join(pieces)
+
+    def put(self, image_id, variant, etag, data):
+        # Stores the image unless it is too large. Returns whether it is
+        # cached now.
+        size = len(data)
+        need = self._chunks(size)
+        if size > self.max_item_bytes or need > self.n_chunks:
+            return False
+        variant = variant.encode("ascii").ljust(8, b"\0")
+        etag = etag.encode("ascii")
+        cb = self.chunk_bytes
+        with self._locked():
+            header = list(_HEADER.unpack_from(self._mm, 0))
+            i, slot = self._find(image_id, variant)
+            if slot is not None and slot[_S_ETAG].rstrip(b"\0") == etag:
+                return True
+
+            # Dirty until the last header write below: if this worker is
+            # killed in between, the next one to take the lock reformats
+            # the cache rather than trusting half-relinked chains.
+            header[_DIRTY] = 1
+            _HEADER.pack_into(self._mm, 0, *header)
+            if slot is not None:
+                self._evict(i, slot, header)
+            if header[_FREE_COUNT] < need:
+                self._reclaim(need, header)
+            if header[_FREE_COUNT] < need:
+                header[_DIRTY] = 0
+                _HEADER.pack_into(self._mm, 0, *header)
+                return False
+
+            # Data, then the allocation, then the slot that publishes it.
+            first = chunk = header[_FREE_HEAD]
+            for n in range(need):
+                piece = data[n * cb : (n + 1) * cb]
+                self._data[chunk * cb : chunk * cb + len(piece)] = piece
+                last = chunk
+                chunk = self._next[chunk]
+            self._next[last] = -1
+            header[_FREE_HEAD] = chunk
+            header[_FREE_COUNT] -= need
+            header[_ENTRIES] += 1
+            header[_USED_BYTES] += size
+            header[_INSERTS] += 1
+            _HEADER.pack_into(self._mm, 0, *header)
+
+            i, _ = self._find(image_id, variant)
+            self._store(i, [image_id, _USED, 0, size, first, variant, etag])
+            header[_DIRTY] = 0
+            _HEADER.pack_into(self._mm, 0, *header)
+            return True
+
+    def stats(self):
+        with self._locked():
+            header = _HEADER.unpack_from(self._mm, 0)
+        lookups = header[_HITS] + header[_MISSES]
+        return {
+            "capacity_bytes": self.n_chunks * self.chunk_bytes,
+            "used_bytes": header[_USED_BYTES],
+            "free_bytes": header[_FREE_COUNT] * self.chunk_bytes,
+            "entries": header[_ENTRIES],
+            "hits": header[_HITS],
+            "misses": header[_MISSES],
+            "hit_ratio": header[_HITS] / lookups if lookups else None,
+            "inserts": header[_INSERTS],
+            "evictions": header[_EVICTIONS],
+        }
+
+
+def get_image_cache():
+    # One mapping per worker process, opened on first use, which is after
+    # gunicorn forks. None when [images] cache_bytes is 0.
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache_pid != pid:
+        with _cache_lock:
+            if _cache_pid != pid:
+                config = current_app.config
+                max_bytes = config["TRASHYNEIGHBORS_IMAGE_CACHE_BYTES"]
+                _cache = None
+                if max_bytes > 0:
+                    _cache = SharedImageCache(
+                        config["TRASHYNEIGHBORS_IMAGE_CACHE_PATH"],
+                        max_bytes,
+                        config["TRASHYNEIGHBORS_IMAGE_CACHE_MAX_ITEM_BYTES"],
+                    )
+                _cache_pid = pid
+    return _cache
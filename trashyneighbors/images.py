@@ -0,0 +1,366 @@
+import hashlib
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from flask import current_app
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import exists, or_
+from sqlalchemy.dialects.mysql import insert
+
+from .exif import MetadataError, read_metadata
+from .extensions import db
+from .models import ImageBlob, ImageReview, PostImage, PostImageVariant, ReviewStatus
+from .phash import dhash, to_signed
+
+try:
+    # Registers an AVIF encoder on Pillow releases without a native one.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+# Derived sizes, widest first; each is resized from the one before it. An
+# image no wider than a variant simply has no row for it.
+VARIANT_WIDTHS = (("medium", 800), ("card", 320), ("thumb", 160))
+VARIANTS = ("full",) + tuple(name for name, _ in VARIANT_WIDTHS)
+
+HASH_CHUNK = 65536
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+class ImagePipelineBusy(RuntimeError):
+    pass
+
+
+_pool_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+def avif_available():
+    return "AVIF" in Image.SAVE
+
+
+def encode_options():
+    config = current_app.config
+    fmt = config["TRASHYNEIGHBORS_IMAGE_FORMAT"]
+    if fmt == "avif" and not avif_available():
+        fmt = "webp"
+    return {
+        "format": fmt,
+        "max_dimension": config["TRASHYNEIGHBORS_IMAGE_MAX_DIMENSION"],
+        "max_pixels": config["TRASHYNEIGHBORS_IMAGE_MAX_PIXELS"],
+        "quality": config[f"TRASHYNEIGHBORS_IMAGE_{fmt.upper()}_QUALITY"],
+        "effort": config["TRASHYNEIGHBORS_IMAGE_ENCODE_EFFORT"],
+    }
+
+
+def _save(img, options, out):
+    if options["format"] == "avif":
+        # AVIF speed runs the other way: 0 is slowest and smallest.
+        speed = max(0, 10 - options["effort"])
+        img.save(out, "AVIF", quality=options["quality"], speed=speed)
+    else:
+        img.save(out, "WEBP", quality=options["quality"], method=options["effort"])
+
+
+def transcode(source, options):
+    # Runs in a pool process; source is the image bytes or the path of a
+    # spooled upload. Decodes, applies the EXIF orientation, fits
+    # the image inside max_dimension and re-encodes it without metadata,
+    # then derives each narrower variant from the previous one. Returns
+    # (phash, [(variant, content_type, bytes, width, height), ...]) with
+    # "full" first.
+    max_dim = options["max_dimension"]
+    content_type = CONTENT_TYPES[options["format"]]
+    try:
+        with Image.open(
+            io.BytesIO(source) if isinstance(source, bytes) else source
+        ) as src:
+            if src.width * src.height > options["max_pixels"]:
+                raise ImageRejected("Image dimensions are too large")
+            # JPEG only: decode at the smallest 1/2^n scale still >= max_dim.
+            src.draft("RGB", (max_dim, max_dim))
+            img = ImageOps.exif_transpose(src)
+            img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+            phash = to_signed(dhash(img))
+
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or (
+                img.mode == "P" and "transparency" in img.info
+            )
+            img = img.convert("RGBA" if has_alpha else "RGB")
+
+            results = []
+            for variant, width in (("full", None),) + VARIANT_WIDTHS:
+                if width is not None:
+                    if img.width <= width:
+                        continue
+                    height = max(1, round(img.height * width / img.width))
+                    img = img.resize((width, height), Image.Resampling.LANCZOS)
+                out = io.BytesIO()
+                _save(img, options, out)
+                results.append(
+                    (variant, content_type, out.getvalue(), img.width, img.height)
+                )
+    except ImageRejected:
+        raise
+    except (
+        UnidentifiedImageError,
+        Image.DecompressionBombError,
+        OSError,
+        SyntaxError,
+        ValueError,
+    ) as exc:
+        raise ImageRejected("Unsupported or invalid image") from exc
+
+    return phash, results
+
+
+def _get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = current_app.config["TRASHYNEIGHBORS_IMAGE_WORKERS"]
+            # forkserver: children never inherit the worker's DB sockets or
+            # threads.
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+            # Bounds queued work too, not just running work.
+            _slots = threading.BoundedSemaphore(workers * 2)
+        return _pool, _slots
+
+
+def _discard_pool(pool):
+    # A pool child died (the OOM killer, a decoder crash) and the pool now
+    # fails every job; the next request builds a new one. Requests still
+    # holding the old pool find it already replaced.
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _slots = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_image(source, options=None):
+    options = options or encode_options()
+    timeout = current_app.config["TRASHYNEIGHBORS_IMAGE_TIMEOUT_SECONDS"]
+    pool, slots = _get_pool()
+
+    if not slots.acquire(timeout=timeout):
+        raise ImagePipelineBusy("Image processing is busy")
+    try:
+        future = pool.submit(transcode, source, options)
+    except RuntimeError as exc:
+        # Broken, or shut down by a request that found it broken.
+        slots.release()
+        _discard_pool(pool)
+        raise ImagePipelineBusy("Image processing is restarting") from exc
+    except BaseException:
+        slots.release()
+        raise
+    # Freed when the job ends, not when this request gives up on it: a job
+    # that timed out keeps its pool worker busy until it finishes.
+    future.add_done_callback(lambda f: slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout as exc:
+        future.cancel()
+        raise ImagePipelineBusy("Image processing timed out") from exc
+    except BrokenProcessPool as exc:
+        _discard_pool(pool)
+        raise ImagePipelineBusy("Image processing is restarting") from exc
+
+
+def store_blob(content_type, data):
+    # Returns the SHA-256 key of data, inserting it into image_blob unless
+    # it is already there (one primary-key lookup). A concurrent insert of
+    # the same bytes is absorbed by the no-op duplicate-key update.
+    sha = hashlib.sha256(data).hexdigest()
+    query = db.session.query(ImageBlob.content_sha256).filter(
+        ImageBlob.content_sha256 == sha
+    )
+    found = query.first()
+    if found is not None:
+        # Share-locked until the caller commits the row pointing at it, so
+        # prune_orphan_blobs cannot delete it in between. Locked only once
+        # seen: locking a missing key takes a gap lock, and two uploads of
+        # the same new bytes would deadlock on each other's.
+        found = query.with_for_update(read=True).first()
+    if found is None:
+        stmt = insert(ImageBlob.__table__).values(
+            content_sha256=sha,
+            content_type=content_type,
+            byte_size=len(data),
+            image_bytes=data,
+            created_at=datetime.utcnow(),
+        )
+        db.session.execute(
+            stmt.on_duplicate_key_update(content_sha256=stmt.inserted.content_sha256)
+        )
+    return sha
+
+
+def variant_rows(image_id, variants):
+    # Stores the derived entries of a transcode() variant list and returns
+    # their PostImageVariant rows.
+    return [
+        PostImageVariant(
+            image_id=image_id,
+            variant=variant,
+            content_type=content_type,
+            width=width,
+            height=height,
+            content_sha256=store_blob(content_type, image_bytes),
+        )
+        for variant, content_type, image_bytes, width, height in variants
+        if variant != "full"
+    ]
+
+
+def _review_row(image_id, previous_id=None):
+    # Queues the image for scripts/nsfw_worker.py; the upload never waits
+    # for a verdict. Repeat bytes inherit any verdict already reached.
+    prior = None
+    if previous_id is not None:
+        prior = db.session.get(ImageReview, previous_id)
+    if prior is None or prior.status == ReviewStatus.PENDING:
+        return ImageReview(image_id=image_id, status=ReviewStatus.PENDING)
+    return ImageReview(
+        image_id=image_id,
+        status=prior.status,
+        score=prior.score,
+        model_name=prior.model_name,
+        classified_at=prior.classified_at,
+        reviewed_by_user_id=prior.reviewed_by_user_id,
+        reviewed_at=prior.reviewed_at,
+    )
+
+
+def _pool_source(stream):
+    # What to hand transcode(): the path of an upload spooled to disk, so
+    # its bytes are never copied into this process, else the bytes.
+    path = getattr(stream, "path", None)
+    if path is not None:
+        stream.flush()
+        return path
+    stream.seek(0)
+    return stream.read()
+
+
+def store_post_image(post_id, source):
+    # source is the image as bytes or as a seekable binary file, such as an
+    # uploads.SpooledUpload, which is read in chunks. Adds the processed
+    # image, its variants and its review queue entry to the session; the
+    # caller commits. Bytes already uploaded before reuse that image's
+    # blobs and skip the pool entirely.
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK), b""):
+        digest.update(chunk)
+    source_sha = digest.hexdigest()
+    try:
+        stream.seek(0)
+        meta = read_metadata(stream)
+    except MetadataError:
+        # Truncated headers; transcode() decides whether the image decodes.
+        meta = {"latitude": None, "longitude": None, "taken_at": None}
+    located = {
+        "gps_latitude": meta["latitude"],
+        "gps_longitude": meta["longitude"],
+        "taken_at": meta["taken_at"],
+    }
+
+    previous = (
+        db.session.query(PostImage)
+        .filter(PostImage.source_sha256 == source_sha)
+        .order_by(PostImage.image_id.asc())
+        .first()
+    )
+
+    if previous is not None:
+        image = PostImage(
+            post_id=post_id,
+            content_type=previous.content_type,
+            width=previous.width,
+            height=previous.height,
+            content_sha256=previous.content_sha256,
+            source_sha256=source_sha,
+            phash=previous.phash,
+            **located,
+        )
+        db.session.add(image)
+        db.session.flush()
+        db.session.add_all(
+            PostImageVariant(
+                image_id=image.image_id,
+                variant=v.variant,
+                content_type=v.content_type,
+                width=v.width,
+                height=v.height,
+                content_sha256=v.content_sha256,
+            )
+            for v in db.session.query(PostImageVariant).filter(
+                PostImageVariant.image_id == previous.image_id
+            )
+        )
+        db.session.add(_review_row(image.image_id, previous.image_id))
+        return image
+
+    phash, variants = process_image(_pool_source(stream))
+    _, content_type, image_bytes, width, height = variants[0]
+    image = PostImage(
+        post_id=post_id,
+        content_type=content_type,
+        width=width,
+        height=height,
+        content_sha256=store_blob(content_type, image_bytes),
+        source_sha256=source_sha,
+        phash=phash,
+        **located,
+    )
+    db.session.add(image)
+    db.session.flush()
+    db.session.add_all(variant_rows(image.image_id, variants))
+    db.session.add(_review_row(image.image_id))
+    return image
+
+
+def prune_orphan_blobs(batch_size=500):
+    # Blobs left behind by re-encoding or stripping; nothing else ever
+    # unreferences one. Commits after each batch.
+    referenced = or_(
+        exists().where(PostImage.content_sha256 == ImageBlob.content_sha256),
+        exists().where(PostImageVariant.content_sha256 == ImageBlob.content_sha256),
+    )
+    total = 0
+    while True:
+        shas = [
+            r.content_sha256
+            for r in db.session.query(ImageBlob.content_sha256)
+            .filter(~referenced)
+            .limit(batch_size)
+            .all()
+        ]
+        if not shas:
+            return total
+        # Checked again by the DELETE, which reads the current rows: a blob
+        # store_blob() picked up since the SELECT above is left alone.
+        total += (
+            db.session.query(ImageBlob)
+            .filter(ImageBlob.content_sha256.in_(shas), ~referenced)
+            .delete(synchronize_session=False)
+        )
+        db.session.commit()
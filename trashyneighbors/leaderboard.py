@@ -0,0 +1,209 @@
+import logging
+
+from sqlalchemy import case, delete, event, func, literal, select
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import LeaderboardEntry, Post
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SIZE = 100
+
+_PENDING = "leaderboard_pending"
+
+GEO_LEVELS = ("all", "state", "city", "zip")
+
+
+def city_key(state, city):
+    return f"{state}|{city}"
+
+
+def post_geographies(state, city, zip_code):
+    return [
+        ("all", ""),
+        ("state", state),
+        ("city", city_key(state, city)),
+        ("zip", zip_code),
+    ]
+
+
+def _post_filters(geo_level, geo_key):
+    if geo_level == "state":
+        return [Post.state == geo_key]
+    if geo_level == "city":
+        state, city = geo_key.split("|", 1)
+        return [Post.state == state, Post.city == city]
+    if geo_level == "zip":
+        return [Post.zip_code == geo_key]
+    return []
+
+
+def refresh_board(connection, geo_level, geo_key):
+    # Rewrites one board from the matching (geo..., score, post_id) index:
+    # a LEADERBOARD_SIZE row range read, upserted over the existing ranks.
+    # Meant to be the first thing in its own transaction. The board's rows
+    # are locked before the scores are read, so refreshes of one board run
+    # one at a time and each reads what the ones before it committed; a
+    # snapshot taken earlier in a vote's transaction could undo them.
+    table = LeaderboardEntry.__table__
+    board = (table.c.geo_level == geo_level, table.c.geo_key == geo_key)
+    connection.execute(select(table.c.rank).where(*board).with_for_update())
+    rows = connection.execute(
+        select(Post.post_id, Post.score)
+        .where(*_post_filters(geo_level, geo_key))
+        .order_by(Post.score.desc(), Post.post_id.desc())
+        .limit(LEADERBOARD_SIZE)
+    ).all()
+
+    if rows:
+        stmt = insert(table).values(
+            [
+                {
+                    "geo_level": geo_level,
+                    "geo_key": geo_key,
+                    "rank": rank,
+                    "post_id": r.post_id,
+                    "score": r.score,
+                }
+                for rank, r in enumerate(rows, start=1)
+            ]
+        )
+        connection.execute(
+            stmt.on_duplicate_key_update(
+                post_id=stmt.inserted.post_id, score=stmt.inserted.score
+            )
+        )
+    connection.execute(delete(table).where(*board, table.c.rank > len(rows)))
+
+
+def update_leaderboards(post_id):
+    # Called after post_id's score changed, in the same transaction. A board
+    # is only refreshed when the post is on it, could now enter it, or the
+    # board is not full yet; otherwise the vote cannot change its order.
+    # The refreshes run once the transaction commits, so the vote holds no
+    # board locks and the busy boards ("all" above all) are each locked
+    # only for one short transaction per refresh.
+    post = (
+        db.session.query(Post.state, Post.city, Post.zip_code, Post.score)
+        .filter(Post.post_id == post_id)
+        .one()
+    )
+
+    pending = db.session.info.setdefault(_PENDING, [])
+    for geo_level, geo_key in post_geographies(post.state, post.city, post.zip_code):
+        board = (
+            db.session.query(
+                func.count().label("entries"),
+                func.min(LeaderboardEntry.score).label("min_score"),
+                func.max(
+                    case((LeaderboardEntry.post_id == post_id, 1), else_=0)
+                ).label("listed"),
+            )
+            .filter(
+                LeaderboardEntry.geo_level == geo_level,
+                LeaderboardEntry.geo_key == geo_key,
+            )
+            .one()
+        )
+        if (
+            board.listed
+            or board.entries < LEADERBOARD_SIZE
+            or post.score >= board.min_score
+        ) and (geo_level, geo_key) not in pending:
+            pending.append((geo_level, geo_key))
+
+
+@event.listens_for(Session, "after_commit")
+def _session_committed(session):
+    boards = session.info.pop(_PENDING, None)
+    if not boards:
+        return
+    engine = session.get_bind()
+    for geo_level, geo_key in boards:
+        try:
+            with engine.begin() as conn:
+                refresh_board(conn, geo_level, geo_key)
+        except Exception:
+            # The vote itself is committed; the board catches up on its
+            # next refresh or scripts/rebuild_leaderboards.py.
+            logger.exception("Refreshing leaderboard %s %r failed", geo_level, geo_key)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _session_transaction_ended(session, transaction):
+    # A rolled back vote changed no scores.
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
+
+
+def board_for(state=None, city=None, zip_code=None):
+    # The board answering a State/City/ZIP filter, or None when the
+    # combination has no board of its own (a city without a state).
+    if zip_code:
+        return "zip", zip_code
+    if city:
+        return ("city", city_key(state, city)) if state else None
+    if state:
+        return "state", state
+    return "all", ""
+
+
+def popular_post_ids(state=None, city=None, zip_code=None, limit=20):
+    board = board_for(state, city, zip_code)
+    if board is None:
+        rows = (
+            db.session.query(Post.post_id)
+            .filter(Post.city == city)
+            .order_by(Post.score.desc(), Post.post_id.desc())
+            .limit(limit)
+            .all()
+        )
+        return [r.post_id for r in rows]
+
+    geo_level, geo_key = board
+    rows = (
+        db.session.query(LeaderboardEntry.post_id)
+        .filter(
+            LeaderboardEntry.geo_level == geo_level,
+            LeaderboardEntry.geo_key == geo_key,
+            LeaderboardEntry.rank <= limit,
+        )
+        .order_by(LeaderboardEntry.rank.asc())
+        .all()
+    )
+    return [r.post_id for r in rows]
+
+
+def rebuild_statements(size=LEADERBOARD_SIZE):
+    # One INSERT ... SELECT per level, ranking every geography at once with
+    # ROW_NUMBER().
+    table = LeaderboardEntry.__table__
+    levels = {
+        "all": (literal(""), []),
+        "state": (Post.state, [Post.state]),
+        "city": (Post.state + "|" + Post.city, [Post.state, Post.city]),
+        "zip": (Post.zip_code, [Post.zip_code]),
+    }
+    for geo_level in GEO_LEVELS:
+        geo_key, partition = levels[geo_level]
+        ranked = (
+            db.session.query(
+                literal(geo_level).label("geo_level"),
+                geo_key.label("geo_key"),
+                func.row_number()
+                .over(
+                    partition_by=partition,
+                    order_by=[Post.score.desc(), Post.post_id.desc()],
+                )
+                .label("rank"),
+                Post.post_id,
+                Post.score,
+            )
+            .subquery()
+        )
+        yield insert(table).from_select(
+            ["geo_level", "geo_key", "rank", "post_id", "score"],
+            db.select(ranked).where(ranked.c.rank <= size),
+        )
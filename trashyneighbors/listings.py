@@ -0,0 +1,76 @@
+from sqlalchemy import func, select
+
+from .extensions import db
+from .models import Comment, Post, PostImage, PostName
+
+_POST_COLUMNS = (
+    Post.post_id,
+    Post.title,
+    Post.street_address,
+    Post.city,
+    Post.state,
+    Post.zip_code,
+    Post.like_count,
+    Post.dislike_count,
+    Post.score,
+    Post.content_version,
+    Post.created_at,
+)
+
+
+class ListingCard:
+    # Everything a listing card shows, detached from the session so
+    # templates and the API cannot trigger lazy loads.
+    __slots__ = tuple(c.key for c in _POST_COLUMNS) + (
+        "names",
+        "image_id",
+        "comment_count",
+    )
+
+    def __init__(self, row):
+        for column in _POST_COLUMNS:
+            setattr(self, column.key, getattr(row, column.key))
+        self.names = []
+        self.image_id = None
+        self.comment_count = 0
+
+
+def assemble_listings(post_ids):
+    # Cards for post_ids in the given order. One query per relation no
+    # matter how many posts: the posts, their names, each post's first
+    # image id (the blob column is never read) and comment counts.
+    if not post_ids:
+        return []
+
+    cards = {
+        row.post_id: ListingCard(row)
+        for row in db.session.execute(
+            select(*_POST_COLUMNS).where(Post.post_id.in_(post_ids))
+        )
+    }
+    if not cards:
+        return []
+    ids = list(cards)
+
+    for post_id, name_text in db.session.execute(
+        select(PostName.post_id, PostName.name_text)
+        .where(PostName.post_id.in_(ids))
+        .order_by(PostName.post_name_id.asc())
+    ):
+        cards[post_id].names.append(name_text)
+
+    for post_id, image_id in db.session.execute(
+        select(PostImage.post_id, func.min(PostImage.image_id))
+        .where(PostImage.post_id.in_(ids))
+        .group_by(PostImage.post_id)
+    ):
+        cards[post_id].image_id = image_id
+
+    for post_id, count in db.session.execute(
+        select(Comment.post_id, func.count())
+        .where(Comment.post_id.in_(ids))
+        .group_by(Comment.post_id)
+    ):
+        cards[post_id].comment_count = count
+
+    return [cards[post_id] for post_id in post_ids if post_id in cards]
@@ -2,9 +2,11 @@ import enum
 from datetime import datetime
 
 from flask_login import UserMixin
-from sqlalchemy import BigInteger, Enum, Index, UniqueConstraint
+from sqlalchemy import BigInteger, Enum, Index, UniqueConstraint, event
 
+from .address import address_hash, normalize_address
 from .extensions import db
+from .geo import encode_geohash
 
 
 class UserRole(str, enum.Enum):
@@ -47,12 +49,56 @@ class Post(db.Model):
     story_text = db.Column(db.Text, nullable=False)
 
     street_address = db.Column(db.String(255), nullable=False)
+    address_key = db.Column(db.String(255), nullable=True)
+    address_hash = db.Column(db.String(64), nullable=True, index=True)
     city = db.Column(db.String(128), nullable=False, index=True)
     state = db.Column(db.String(2), nullable=False, index=True)
     zip_code = db.Column(db.String(5), nullable=False, index=True)
 
     latitude = db.Column(db.Numeric(9, 6), nullable=True)
     longitude = db.Column(db.Numeric(9, 6), nullable=True)
+    geohash = db.Column(db.String(12), nullable=True)
+
+    # Maintained by votes.cast_vote in the same transaction as PostVote.
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    dislike_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    score = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # Bumped by fragments.bump_content_version whenever the rendered post
+    # changes (an approved edit request); part of every fragment cache key.
+    content_version = db.Column(
+        db.Integer, nullable=False, default=1, server_default="1"
+    )
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+@event.listens_for(Post, "before_insert")
+@event.listens_for(Post, "before_update")
+def _post_derived_columns(mapper, connection, target):
+    target.address_key = normalize_address(target.street_address)
+    target.address_hash = address_hash(target.address_key)
+
+    if target.latitude is None or target.longitude is None:
+        target.geohash = None
+    else:
+        target.geohash = encode_geohash(float(target.latitude), float(target.longitude))
+
+
+class ImageBlob(db.Model):
+    __tablename__ = "image_blob"
+
+    # Content-addressed: identical bytes are stored once however many
+    # images reference them. Rows are never updated.
+    content_sha256 = db.Column(db.String(64), primary_key=True)
+    content_type = db.Column(db.String(64), nullable=False)
+    byte_size = db.Column(db.Integer, nullable=False)
+    # Deferred: metadata lookups never pull the blob along.
+    image_bytes = db.deferred(
+        db.Column(db.LargeBinary(length=(16 * 1024 * 1024)), nullable=False)
+    )
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
@@ -66,11 +112,70 @@ class PostImage(db.Model):
     )
 
     content_type = db.Column(db.String(64), nullable=False)
-    image_bytes = db.Column(db.LargeBinary(length=(16 * 1024 * 1024)), nullable=False)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    content_sha256 = db.Column(
+        db.String(64), db.ForeignKey("image_blob.content_sha256"), nullable=False
+    )
+    # SHA-256 of the bytes as uploaded, so a repeat upload skips processing.
+    source_sha256 = db.Column(db.String(64), nullable=True, index=True)
+    # 64-bit difference hash (phash.dhash) in two's complement.
+    phash = db.Column(db.BigInteger, nullable=True)
+    # From the upload's Exif/XMP (exif.read_metadata); never in the blob.
+    gps_latitude = db.Column(db.Numeric(9, 6), nullable=True)
+    gps_longitude = db.Column(db.Numeric(9, 6), nullable=True)
+    taken_at = db.Column(db.DateTime, nullable=True)
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 
+class PostImageVariant(db.Model):
+    __tablename__ = "post_image_variant"
+
+    # Narrower renditions of a PostImage (see images.VARIANT_WIDTHS); the
+    # "full" variant is the post_image row itself.
+    image_id = db.Column(
+        db.BigInteger, db.ForeignKey("post_image.image_id"), primary_key=True
+    )
+    variant = db.Column(db.String(16), primary_key=True)
+
+    content_type = db.Column(db.String(64), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    content_sha256 = db.Column(
+        db.String(64), db.ForeignKey("image_blob.content_sha256"), nullable=False
+    )
+
+
+class ReviewStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    SAFE = "SAFE"
+    FLAGGED = "FLAGGED"
+    APPROVED = "APPROVED"
+    BLOCKED = "BLOCKED"
+
+
+class ImageReview(db.Model):
+    __tablename__ = "image_review"
+
+    # One row per uploaded image. PENDING until scripts/nsfw_worker.py
+    # classifies it as SAFE or FLAGGED; a moderator then APPROVES or BLOCKS
+    # flagged images. BLOCKED images are no longer served.
+    image_id = db.Column(
+        db.BigInteger, db.ForeignKey("post_image.image_id"), primary_key=True
+    )
+    status = db.Column(Enum(ReviewStatus), nullable=False, default=ReviewStatus.PENDING)
+    score = db.Column(db.Double, nullable=True)
+    model_name = db.Column(db.String(64), nullable=True)
+
+    enqueued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    classified_at = db.Column(db.DateTime, nullable=True)
+    reviewed_by_user_id = db.Column(
+        db.Integer, db.ForeignKey("user.user_id"), nullable=True
+    )
+    reviewed_at = db.Column(db.DateTime, nullable=True)
+
+
 class PostName(db.Model):
     __tablename__ = "post_name"
 
@@ -124,6 +229,8 @@ class AuditEventType(str, enum.Enum):
     CREATE_POST = "CREATE_POST"
     CREATE_COMMENT = "CREATE_COMMENT"
     VOTE = "VOTE"
+    UPLOAD_IMAGE = "UPLOAD_IMAGE"
+    REVIEW_IMAGE = "REVIEW_IMAGE"
 
 
 class AuditLog(db.Model):
@@ -154,5 +261,89 @@ class ZipCodeLocation(db.Model):
     longitude = db.Column(db.Numeric(9, 6), nullable=True)
 
 
+class PostTrending(db.Model):
+    __tablename__ = "post_trending"
+
+    post_id = db.Column(
+        db.BigInteger, db.ForeignKey("post.post_id"), primary_key=True
+    )
+    city = db.Column(db.String(128), nullable=False)
+    state = db.Column(db.String(2), nullable=False)
+    zip_code = db.Column(db.String(5), nullable=False)
+
+    # ln(sum of event weights * 2^((event_time - TRENDING_EPOCH) / half_life));
+    # see trending.py.
+    log_score = db.Column(db.Double, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class LeaderboardEntry(db.Model):
+    __tablename__ = "leaderboard_entry"
+
+    # geo_level is one of leaderboard.GEO_LEVELS; geo_key is "" for "all",
+    # the state, "state|city" or the ZIP.
+    geo_level = db.Column(db.String(8), primary_key=True)
+    geo_key = db.Column(db.String(140), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+
+    post_id = db.Column(db.BigInteger, db.ForeignKey("post.post_id"), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+
+
+class PostFacetCount(db.Model):
+    __tablename__ = "post_facet_count"
+
+    # Maintained by facets._post_inserted; rebuilt by
+    # scripts/rebuild_facet_counts.py.
+    state = db.Column(db.String(2), primary_key=True)
+    city = db.Column(db.String(128), primary_key=True)
+    zip_code = db.Column(db.String(5), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CacheVersion(db.Model):
+    __tablename__ = "cache_version"
+
+    # Bumped in the same transaction as the data an in-process cache is
+    # built from; workers compare it to decide when to reload.
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ReferenceDataset(db.Model):
+    __tablename__ = "reference_dataset"
+
+    dataset_name = db.Column(db.String(64), primary_key=True)
+    version_hash = db.Column(db.String(64), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    imported_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
 Index("idx_post_score", Post.created_at)
+Index("idx_post_state_created", Post.state, Post.created_at, Post.post_id)
+Index(
+    "idx_post_state_city_created",
+    Post.state,
+    Post.city,
+    Post.created_at,
+    Post.post_id,
+)
+Index("idx_post_zip_created", Post.zip_code, Post.created_at, Post.post_id)
+Index("idx_post_popular", Post.score, Post.post_id)
+Index("idx_post_state_score", Post.state, Post.score, Post.post_id)
+Index("idx_post_state_city_score", Post.state, Post.city, Post.score, Post.post_id)
+Index("idx_post_zip_score", Post.zip_code, Post.score, Post.post_id)
+Index("idx_trending_score", PostTrending.log_score)
+Index("idx_trending_state_score", PostTrending.state, PostTrending.log_score)
+Index(
+    "idx_trending_state_city_score",
+    PostTrending.state,
+    PostTrending.city,
+    PostTrending.log_score,
+)
+Index("idx_trending_zip_score", PostTrending.zip_code, PostTrending.log_score)
+Index("idx_post_geohash", Post.geohash, Post.latitude, Post.longitude)
+Index("idx_post_zip_address", Post.zip_code, Post.address_key)
+Index("ft_post_title_story", Post.title, Post.story_text, mysql_prefix="FULLTEXT")
 Index("idx_audit_created", AuditLog.created_at)
+Index("idx_image_review_status", ImageReview.status, ImageReview.image_id)
@@ -0,0 +1,54 @@
+import math
+
+from sqlalchemy import and_, func, or_, select
+
+from .extensions import db
+from .geo import EARTH_RADIUS_MI, bounding_box, geohash_cover
+from .models import Post
+
+
+def distance_mi(latitude, longitude):
+    # Haversine distance from (latitude, longitude) to the post, in SQL.
+    p1 = math.radians(latitude)
+    p2 = func.radians(Post.latitude)
+    dp = func.sin((p2 - p1) / 2)
+    dl = func.sin(func.radians(Post.longitude - longitude) / 2)
+    a = dp * dp + math.cos(p1) * func.cos(p2) * dl * dl
+    return 2 * EARTH_RADIUS_MI * func.asin(func.sqrt(a))
+
+
+def build_nearby_statement(latitude, longitude, radius_mi, limit, after=None):
+    # Geohash prefix ranges on idx_post_geohash (which also covers
+    # latitude/longitude) narrow the scan to a 3x3 block of cells and the
+    # bounding box trims it further; distance, the cursor and the limit are
+    # applied by the server, so a page returns at most `limit` rows.
+    lat_lo, lat_hi, lon_lo, lon_hi = bounding_box(latitude, longitude, radius_mi)
+    prefixes = geohash_cover(latitude, longitude, radius_mi)
+    distance = distance_mi(latitude, longitude)
+
+    stmt = select(distance.label("distance"), Post.post_id).where(
+        or_(*[Post.geohash.like(f"{prefix}%") for prefix in prefixes]),
+        Post.latitude.between(lat_lo, lat_hi),
+        Post.longitude.between(lon_lo, lon_hi),
+        distance <= radius_mi,
+    )
+    if after is not None:
+        last_distance, last_post_id = after
+        stmt = stmt.where(
+            or_(
+                distance > last_distance,
+                and_(distance == last_distance, Post.post_id > last_post_id),
+            )
+        )
+
+    return stmt.order_by(distance, Post.post_id).limit(limit)
+
+
+def find_posts_near(latitude, longitude, radius_mi, limit, after=None):
+    # Results are (distance_mi, post_id) ordered by distance; `after` is the
+    # last pair of the previous page.
+    stmt = build_nearby_statement(latitude, longitude, radius_mi, limit, after=after)
+    return [
+        (float(distance), post_id)
+        for distance, post_id in db.session.execute(stmt).all()
+    ]
@@ -0,0 +1,265 @@
+import importlib
+import io
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import shared_memory
+
+from flask import current_app
+from PIL import Image, ImageChops, ImageOps
+from sqlalchemy import bindparam, update
+
+from .extensions import db
+from .models import ImageBlob, ImageReview, PostImage, PostImageVariant, ReviewStatus
+
+logger = logging.getLogger(__name__)
+
+# Rendition the classifier reads: already small, so decoding is cheap.
+SOURCE_VARIANT = "card"
+
+_CB_LUT = [255 if 77 <= v <= 127 else 0 for v in range(256)]
+_CR_LUT = [255 if 133 <= v <= 173 else 0 for v in range(256)]
+
+# Per pool process: the model and the attached shared-memory block.
+_models = {}
+_blocks = {}
+
+
+class StubModel:
+    # Deterministic stand-in for a real classifier: the share of
+    # skin-toned pixels under the usual YCbCr box rule. Fast, dependency
+    # free and stable enough for tests; not a content classifier.
+    name = "stub-skin-v1"
+    input_size = 64
+
+    def predict(self, images):
+        # images: one memoryview of input_size * input_size RGB bytes each.
+        # Returns one score in [0, 1] per image.
+        size = (self.input_size, self.input_size)
+        scores = []
+        for pixels in images:
+            img = Image.frombuffer("RGB", size, pixels, "raw", "RGB", 0, 1)
+            _, cb, cr = img.convert("YCbCr").split()
+            mask = ImageChops.multiply(cb.point(_CB_LUT), cr.point(_CR_LUT))
+            scores.append(mask.histogram()[255] / (size[0] * size[1]))
+        return scores
+
+
+def model_class(spec):
+    # spec is "package.module:ClassName". The class takes no arguments, has
+    # name and input_size class attributes and a predict(images) method.
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def load_model(spec):
+    # Instantiated once per pool process; the worker's main process only
+    # reads the class attributes.
+    model = _models.get(spec)
+    if model is None:
+        model = _models[spec] = model_class(spec)()
+    return model
+
+
+def _block(name):
+    block = _blocks.get(name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        _blocks[name] = block
+    return block
+
+
+def preprocess(block_name, slot, size, data):
+    # Runs in a pool process: decodes one image, centre-crops it to a
+    # size x size RGB tile and writes it into its slot of the shared block,
+    # so the tiles reach the model without being pickled. Returns False if
+    # the image does not decode.
+    stride = size * size * 3
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            src.draft("RGB", (size, size))
+            tile = ImageOps.fit(src.convert("RGB"), (size, size))
+    except Exception:
+        # Besides UnidentifiedImageError, DecompressionBombError and OSError,
+        # malformed files surface as ValueError, SyntaxError, struct.error
+        # and the like from the individual decoders.
+        return False
+    _block(block_name).buf[slot * stride : (slot + 1) * stride] = tile.tobytes()
+    return True
+
+
+def classify(spec, block_name, slots):
+    # Runs in a pool process: scores the given slots of the shared block as
+    # one batch.
+    model = load_model(spec)
+    stride = model.input_size * model.input_size * 3
+    buf = _block(block_name).buf
+    views = [buf[s * stride : (s + 1) * stride] for s in slots]
+    try:
+        return [float(score) for score in model.predict(views)]
+    finally:
+        for view in views:
+            view.release()
+
+
+def allocate_block(batch_size, input_size):
+    return shared_memory.SharedMemory(
+        create=True, size=batch_size * input_size * input_size * 3
+    )
+
+
+def pending_image_ids(limit):
+    return [
+        r.image_id
+        for r in db.session.query(ImageReview.image_id)
+        .filter(ImageReview.status == ReviewStatus.PENDING)
+        .order_by(ImageReview.image_id.asc())
+        .limit(limit)
+        .all()
+    ]
+
+
+def _source_bytes(image_ids):
+    # {image_id: bytes} of the small rendition, or the original for images
+    # too narrow to have one.
+    found = dict(
+        db.session.query(PostImageVariant.image_id, ImageBlob.image_bytes)
+        .join(ImageBlob, ImageBlob.content_sha256 == PostImageVariant.content_sha256)
+        .filter(
+            PostImageVariant.image_id.in_(image_ids),
+            PostImageVariant.variant == SOURCE_VARIANT,
+        )
+        .all()
+    )
+    missing = [i for i in image_ids if i not in found]
+    if missing:
+        found.update(
+            db.session.query(PostImage.image_id, ImageBlob.image_bytes)
+            .join(ImageBlob, ImageBlob.content_sha256 == PostImage.content_sha256)
+            .filter(PostImage.image_id.in_(missing))
+            .all()
+        )
+    return found
+
+
+def _preprocess_batch(pool, block, size, image_ids, sources):
+    # [(slot, image_id)] of the images now tiled in the shared block.
+    futures = {
+        i: pool.submit(preprocess, block.name, slot, size, sources[i])
+        for slot, i in enumerate(image_ids)
+        if i in sources
+    }
+    ready = []
+    for slot, i in enumerate(image_ids):
+        if i not in futures:
+            continue
+        try:
+            if futures[i].result():
+                ready.append((slot, i))
+        except BrokenProcessPool:
+            raise
+        except Exception:
+            logger.exception("Preprocessing image %d failed", i)
+    return ready
+
+
+def _score_batch(pool, spec, block, workers, ready, scores):
+    # Scores `ready` in `workers` slices into scores. A slice the model
+    # fails on is scored again one image at a time, so only the image it
+    # chokes on is left without a score.
+    chunk = max(1, -(-len(ready) // workers))
+    parts = [ready[n : n + chunk] for n in range(0, len(ready), chunk)]
+    jobs = [
+        (part, pool.submit(classify, spec, block.name, [slot for slot, _ in part]))
+        for part in parts
+    ]
+    retry = []
+    for part, job in jobs:
+        try:
+            scores.update(zip((i for _, i in part), job.result()))
+        except BrokenProcessPool:
+            raise
+        except Exception:
+            logger.exception("Scoring %d images failed", len(part))
+            if len(part) > 1:
+                retry.extend(part)
+
+    singles = [
+        (i, pool.submit(classify, spec, block.name, [slot])) for slot, i in retry
+    ]
+    for i, job in singles:
+        try:
+            scores[i] = job.result()[0]
+        except BrokenProcessPool:
+            raise
+        except Exception:
+            logger.exception("Scoring image %d failed", i)
+
+
+def classify_pending(pool, block, workers, batch_size):
+    # One batch: preprocess in parallel into the shared block, score it in
+    # `workers` slices, store the verdicts. Returns the number of images
+    # handled. Rows a moderator decided on meanwhile are left alone. Raises
+    # BrokenProcessPool, after storing the batch, if a pool process died;
+    # the pool is unusable from then on.
+    config = current_app.config
+    spec = config["TRASHYNEIGHBORS_NSFW_MODEL"]
+    threshold = config["TRASHYNEIGHBORS_NSFW_THRESHOLD"]
+
+    image_ids = pending_image_ids(batch_size)
+    if not image_ids:
+        return 0
+
+    model = model_class(spec)
+    sources = _source_bytes(image_ids)
+    scores = {}
+    broken = None
+    try:
+        ready = _preprocess_batch(pool, block, model.input_size, image_ids, sources)
+        if ready:
+            _score_batch(pool, spec, block, workers, ready, scores)
+    except BrokenProcessPool as exc:
+        # A decoder crash or the OOM killer. Whatever is unscored goes to
+        # a human rather than back into the queue to crash the next pool.
+        logger.error(
+            "Image pool broke with %d of %d images scored",
+            len(scores),
+            len(image_ids),
+        )
+        broken = exc
+
+    now = datetime.utcnow()
+    rows = []
+    for image_id in image_ids:
+        score = scores.get(image_id)
+        # Anything the model could not see goes to a human.
+        flagged = score is None or score >= threshold
+        rows.append(
+            {
+                "b_image_id": image_id,
+                "b_status": ReviewStatus.FLAGGED if flagged else ReviewStatus.SAFE,
+                "b_score": score,
+                "b_model_name": model.name,
+                "b_classified_at": now,
+            }
+        )
+
+    table = ImageReview.__table__
+    db.session.execute(
+        update(table)
+        .where(
+            table.c.image_id == bindparam("b_image_id"),
+            table.c.status == ReviewStatus.PENDING,
+        )
+        .values(
+            status=bindparam("b_status"),
+            score=bindparam("b_score"),
+            model_name=bindparam("b_model_name"),
+            classified_at=bindparam("b_classified_at"),
+        ),
+        rows,
+    )
+    db.session.commit()
+    if broken is not None:
+        raise broken
+    return len(rows)
@@ -0,0 +1,34 @@
+import base64
+import json
+import math
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    # Returns the cursor's values as a list, or None if it is malformed.
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def decode_ranked_after(values):
+    # (score, post_id) from decoded cursor values, as used by pages ordered
+    # on a float such as distance or relevance; None if invalid.
+    try:
+        score, post_id = float(values[0]), int(values[1])
+    except (TypeError, ValueError, IndexError):
+        return None
+    if not math.isfinite(score):
+        return None
+    return score, post_id
@@ -0,0 +1,212 @@
+import threading
+import time
+from array import array
+from itertools import accumulate, combinations
+
+from flask import current_app
+from PIL import Image
+
+from .extensions import db
+from .models import PostImage
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+CHUNKS = HASH_BITS // CHUNK_BITS
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+_HASH_MASK = (1 << HASH_BITS) - 1
+
+# Pigeonhole: within distance d, some 16-bit chunk differs in at most
+# d // 4 bits, so each query probes the chunk buckets within that radius.
+# Radius 1 (d <= 7) is 17 buckets per chunk and stays under a millisecond
+# at a few million images; radius 2 costs about eight times as much.
+MAX_DISTANCE = 7
+
+
+def _probe_masks(radius):
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            masks.append(sum(1 << b for b in bits))
+    return tuple(masks)
+
+
+_PROBE_MASKS = tuple(_probe_masks(r) for r in range(MAX_DISTANCE // CHUNKS + 1))
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+
+def dhash(img):
+    # Difference hash: one bit per horizontally adjacent pixel pair of a
+    # 9x8 grayscale thumbnail, set where brightness increases. Survives
+    # re-encoding, resizing and small crops or colour shifts.
+    small = img.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    px = small.tobytes()
+    value = 0
+    for row in range(8):
+        base = row * 9
+        for col in range(8):
+            value = (value << 1) | (px[base + col] < px[base + col + 1])
+    return value
+
+
+def to_signed(value):
+    # BIGINT is signed; store the unsigned hash in two's complement.
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+def from_signed(value):
+    return value & _HASH_MASK
+
+
+def _chunk(value, c):
+    return (value >> (c * CHUNK_BITS)) & _CHUNK_MASK
+
+
+class PhashIndex:
+    # Multi-index hashing over four 16-bit chunks. Each chunk keeps a
+    # bucket-sorted array of row numbers plus bucket start offsets (about
+    # 24 bytes per image including the hashes); rows added since the build
+    # go into small per-chunk dicts until the next rebuild.
+    __slots__ = (
+        "hashes",
+        "image_ids",
+        "max_image_id",
+        "built_at",
+        "_base",
+        "_order",
+        "_starts",
+        "_delta",
+    )
+
+    def __init__(self, rows):
+        # rows: (image_id, unsigned phash)
+        self.hashes = array("Q")
+        self.image_ids = array("q")
+        for image_id, value in rows:
+            self.image_ids.append(image_id)
+            self.hashes.append(value)
+        self.max_image_id = max(self.image_ids, default=0)
+        self.built_at = time.monotonic()
+        self._base = len(self.hashes)
+        self._order = []
+        self._starts = []
+        self._delta = [{} for _ in range(CHUNKS)]
+
+        rows_n = range(self._base)
+        for c in range(CHUNKS):
+            keys = array("H", (_chunk(h, c) for h in self.hashes))
+            counts = array("I", bytes(4 * ((1 << CHUNK_BITS) + 1)))
+            for k in keys:
+                counts[k + 1] += 1
+            self._starts.append(array("I", accumulate(counts)))
+            self._order.append(array("I", sorted(rows_n, key=keys.__getitem__)))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def pending(self):
+        return len(self.hashes) - self._base
+
+    def add(self, image_id, value):
+        i = len(self.hashes)
+        self.image_ids.append(image_id)
+        self.hashes.append(value)
+        self.max_image_id = max(self.max_image_id, image_id)
+        for c in range(CHUNKS):
+            self._delta[c].setdefault(_chunk(value, c), []).append(i)
+
+    def query(self, value, max_distance, limit=None):
+        # Returns [(distance, image_id), ...] nearest first.
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise ValueError(f"max_distance must be 0..{MAX_DISTANCE}")
+
+        masks = _PROBE_MASKS[max_distance // CHUNKS]
+        hashes = self.hashes
+        # Rows can turn up under several chunks; the set absorbs repeats,
+        # which is cheaper than tracking every candidate seen.
+        found = set()
+        for c in range(CHUNKS):
+            order = self._order[c]
+            starts = self._starts[c]
+            delta = self._delta[c]
+            key = _chunk(value, c)
+            for mask in masks:
+                k = key ^ mask
+                lo = starts[k]
+                hi = starts[k + 1]
+                if lo != hi:
+                    found.update(
+                        [
+                            i
+                            for i in order[lo:hi]
+                            if (hashes[i] ^ value).bit_count() <= max_distance
+                        ]
+                    )
+                if delta and k in delta:
+                    found.update(
+                        [
+                            i
+                            for i in delta[k]
+                            if (hashes[i] ^ value).bit_count() <= max_distance
+                        ]
+                    )
+
+        image_ids = self.image_ids
+        hits = sorted(((hashes[i] ^ value).bit_count(), image_ids[i]) for i in found)
+        return hits if limit is None else hits[:limit]
+
+
+def _load_rows(after_id=0, batch_size=50000):
+    last_id = after_id
+    while True:
+        rows = (
+            db.session.query(PostImage.image_id, PostImage.phash)
+            .filter(PostImage.image_id > last_id, PostImage.phash.isnot(None))
+            .order_by(PostImage.image_id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        for image_id, value in rows:
+            yield image_id, from_signed(value)
+        last_id = rows[-1][0]
+
+
+def get_phash_index():
+    # Per-worker index. New images are appended every recheck interval;
+    # the whole index is rebuilt on the rebuild interval (picking up
+    # backfilled or re-encoded hashes) or once appended rows pile up.
+    global _index, _checked_at
+
+    config = current_app.config
+    recheck = config["TRASHYNEIGHBORS_PHASH_INDEX_RECHECK_SECONDS"]
+    rebuild = config["TRASHYNEIGHBORS_PHASH_INDEX_REBUILD_SECONDS"]
+
+    index = _index
+    if index is not None and time.monotonic() - _checked_at < recheck:
+        return index
+
+    with _lock:
+        now = time.monotonic()
+        if _index is not None and now - _checked_at < recheck:
+            return _index
+
+        if (
+            _index is None
+            or now - _index.built_at >= rebuild
+            or _index.pending > max(10000, len(_index) // 10)
+        ):
+            _index = PhashIndex(_load_rows())
+        else:
+            for image_id, value in _load_rows(_index.max_image_id):
+                _index.add(image_id, value)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def find_similar(value, max_distance, limit=50):
+    return get_phash_index().query(value, max_distance, limit)
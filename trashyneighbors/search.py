@@ -0,0 +1,96 @@
+import re
+
+from flask import current_app
+from sqlalchemy import and_, or_, select
+from sqlalchemy.dialects.mysql import match
+
+from .cache import TTLCache
+from .extensions import db
+from .models import Post
+
+# InnoDB's default innodb_ft_min_token_size; shorter words never match.
+MIN_TERM_LEN = 3
+MAX_TERMS = 8
+
+# INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD; a required stopword
+# would otherwise match nothing.
+STOPWORDS = frozenset(
+    "a about an are as at be by com de en for from how i in is it la of on "
+    "or that the this to was what when where who will with und www".split()
+)
+
+_WORD_RE = re.compile(r"\w+")
+
+_cache = None
+
+
+def boolean_query(text):
+    # Every word is required and the last one is a prefix, so results
+    # narrow as the user types. User-supplied operators are dropped.
+    words = [
+        w
+        for w in _WORD_RE.findall((text or "").lower())
+        if len(w) >= MIN_TERM_LEN and w not in STOPWORDS
+    ][:MAX_TERMS]
+    if not words:
+        return ""
+    return " ".join([f"+{w}" for w in words[:-1]] + [f"+{words[-1]}*"])
+
+
+def build_search_statement(
+    query, state=None, city=None, zip_code=None, limit=20, after=None
+):
+    relevance = match(Post.title, Post.story_text, against=query).in_boolean_mode()
+
+    stmt = select(Post.post_id, relevance.label("relevance")).where(relevance)
+    if state:
+        stmt = stmt.where(Post.state == state)
+    if city:
+        stmt = stmt.where(Post.city == city)
+    if zip_code:
+        stmt = stmt.where(Post.zip_code == zip_code)
+    if after is not None:
+        last_relevance, last_post_id = after
+        stmt = stmt.where(
+            or_(
+                relevance < last_relevance,
+                and_(relevance == last_relevance, Post.post_id < last_post_id),
+            )
+        )
+
+    return stmt.order_by(relevance.desc(), Post.post_id.desc()).limit(limit)
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(
+            current_app.config["TRASHYNEIGHBORS_SEARCH_CACHE_ENTRIES"],
+            current_app.config["TRASHYNEIGHBORS_SEARCH_CACHE_TTL_SECONDS"],
+        )
+    return _cache
+
+
+def search_posts(text, state=None, city=None, zip_code=None, limit=20, after=None):
+    # Returns ([(post_id, relevance), ...], next_after) where next_after is
+    # the (relevance, post_id) keyset for the following page, or None.
+    query = boolean_query(text)
+    if not query:
+        return [], None
+
+    cache = _get_cache()
+    key = (query, state, city, zip_code, limit, after)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    stmt = build_search_statement(
+        query, state=state, city=city, zip_code=zip_code, limit=limit + 1, after=after
+    )
+    rows = [(post_id, float(rel)) for post_id, rel in db.session.execute(stmt)]
+
+    page = rows[:limit]
+    next_after = (page[-1][1], page[-1][0]) if len(rows) > limit else None
+    result = (page, next_after)
+    cache.set(key, result)
+    return result
@@ -0,0 +1,127 @@
+import math
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import case, event, func, literal, select
+from sqlalchemy.dialects.mysql import insert
+
+from .extensions import db
+from .models import Comment, Post, PostTrending
+
+# Scores are kept as ln(sum(w * 2^((t - epoch) / half_life))). Decay then
+# never touches stored rows: an event's weight relative to older ones grows
+# instead, ordering is the same as with true decay, and a new event is a
+# single log-add-exp onto the row.
+TRENDING_EPOCH = datetime(2024, 1, 1)
+
+EVENT_WEIGHTS = {
+    "like": 1.0,
+    "dislike": 0.5,
+    "comment": 2.0,
+    "view": 0.1,
+}
+
+_LN2 = math.log(2)
+
+_view_lock = threading.Lock()
+_pending_views = {}
+_views_since = time.monotonic()
+
+
+def _half_life_seconds():
+    return current_app.config["TRASHYNEIGHBORS_TRENDING_HALF_LIFE_HOURS"] * 3600.0
+
+
+def log_weight(weight, at, half_life_seconds):
+    elapsed = (at - TRENDING_EPOCH).total_seconds()
+    return math.log(weight) + elapsed / half_life_seconds * _LN2
+
+
+def _upsert_statement(contributions, at):
+    # contributions: {post_id: log_weight}. One INSERT ... SELECT copies the
+    # geography from post and log-add-exps onto existing rows.
+    table = PostTrending.__table__
+    post_ids = list(contributions)
+    if len(post_ids) == 1:
+        value = literal(contributions[post_ids[0]])
+    else:
+        value = case(contributions, value=Post.post_id)
+
+    stmt = insert(table).from_select(
+        ["post_id", "city", "state", "zip_code", "log_score", "updated_at"],
+        select(
+            Post.post_id, Post.city, Post.state, Post.zip_code, value, literal(at)
+        ).where(Post.post_id.in_(post_ids)),
+    )
+    old = table.c.log_score
+    new = stmt.inserted.log_score
+    return stmt.on_duplicate_key_update(
+        log_score=func.greatest(old, new) + func.ln(1 + func.exp(-func.abs(old - new))),
+        updated_at=stmt.inserted.updated_at,
+    )
+
+
+def record_event(post_id, kind, at=None, connection=None):
+    at = at or datetime.utcnow()
+    weight = log_weight(EVENT_WEIGHTS[kind], at, _half_life_seconds())
+    stmt = _upsert_statement({post_id: weight}, at)
+    if connection is not None:
+        connection.execute(stmt)
+    else:
+        db.session.execute(stmt)
+
+
+def record_view(post_id):
+    # Views are too frequent to write one by one; they are summed in
+    # process and folded in by flush_views().
+    with _view_lock:
+        _pending_views[post_id] = _pending_views.get(post_id, 0) + 1
+
+
+def flush_views(force=False):
+    global _pending_views, _views_since
+
+    interval = current_app.config["TRASHYNEIGHBORS_TRENDING_VIEW_FLUSH_SECONDS"]
+    with _view_lock:
+        if not _pending_views:
+            return
+        if not force and time.monotonic() - _views_since < interval:
+            return
+        pending = _pending_views
+        _pending_views = {}
+        _views_since = time.monotonic()
+
+    at = datetime.utcnow()
+    half_life = _half_life_seconds()
+    contributions = {
+        post_id: log_weight(EVENT_WEIGHTS["view"] * count, at, half_life)
+        for post_id, count in pending.items()
+    }
+    db.session.execute(_upsert_statement(contributions, at))
+    db.session.commit()
+
+
+def trending_post_ids(state=None, city=None, zip_code=None, limit=20):
+    q = db.session.query(PostTrending.post_id)
+    if zip_code:
+        q = q.filter(PostTrending.zip_code == zip_code)
+    if state:
+        q = q.filter(PostTrending.state == state)
+    if city:
+        q = q.filter(PostTrending.city == city)
+    rows = q.order_by(PostTrending.log_score.desc()).limit(limit).all()
+    return [r.post_id for r in rows]
+
+
+def current_floor(min_weight, at=None):
+    # Rows below this score weigh less today than one event of min_weight.
+    return log_weight(min_weight, at or datetime.utcnow(), _half_life_seconds())
+
+
+@event.listens_for(Comment, "after_insert")
+def _comment_inserted(mapper, connection, target):
+    record_event(
+        target.post_id, "comment", at=target.created_at, connection=connection
+    )
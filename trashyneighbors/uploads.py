@@ -0,0 +1,97 @@
+import io
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Plain form fields are small; only file parts are spooled. Werkzeug also
+# applies this to the parser's buffer, which takes 64 KiB reads, so it has
+# to stay well above that.
+MAX_FORM_MEMORY_BYTES = 500 * 1024
+
+
+class SpooledUpload:
+    # One uploaded file part. Kept in memory up to spool_bytes, then moved
+    # to a named temporary file, so a pool process can open it by path
+    # instead of being sent the bytes. Writes past max_bytes abort the
+    # request with 413 while the body is still being read.
+    def __init__(self, max_bytes, spool_bytes, tmp_dir=None):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.tmp_dir = tmp_dir
+        self.size = 0
+        self.path = None
+        self._file = io.BytesIO()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(
+                f"Each file must be at most {self.max_bytes} bytes"
+            )
+        if self.path is None and self.size > self.spool_bytes:
+            spooled = tempfile.NamedTemporaryFile(
+                prefix="tn-upload-", dir=self.tmp_dir or None
+            )
+            spooled.write(self._file.getbuffer())
+            self._file = spooled
+            self.path = spooled.name
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # Also removes the temporary file.
+        self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class UploadRequest(Request):
+    # The multipart parser streams each file part, in chunks, into a
+    # SpooledUpload; MAX_CONTENT_LENGTH caps the whole body the same way.
+    max_form_memory_size = MAX_FORM_MEMORY_BYTES
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        config = current_app.config
+        count = getattr(self, "_upload_count", 0) + 1
+        if count > config["TRASHYNEIGHBORS_UPLOAD_MAX_FILES"]:
+            raise RequestEntityTooLarge(
+                f"At most {config['TRASHYNEIGHBORS_UPLOAD_MAX_FILES']} files"
+            )
+        self._upload_count = count
+        return SpooledUpload(
+            config["TRASHYNEIGHBORS_UPLOAD_MAX_FILE_BYTES"],
+            config["TRASHYNEIGHBORS_UPLOAD_SPOOL_BYTES"],
+            config["TRASHYNEIGHBORS_UPLOAD_TMP_DIR"],
+        )
+
+
+def init_app(app):
+    app.request_class = UploadRequest
+    app.config["MAX_CONTENT_LENGTH"] = app.config[
+        "TRASHYNEIGHBORS_UPLOAD_MAX_REQUEST_BYTES"
+    ]
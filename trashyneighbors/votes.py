@@ -0,0 +1,64 @@
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db
+from .leaderboard import update_leaderboards
+from .models import Post, PostVote, VoteValue
+from .trending import record_event
+
+
+def _counter_deltas(old_value, new_value):
+    like = (new_value == VoteValue.LIKE) - (old_value == VoteValue.LIKE)
+    dislike = (new_value == VoteValue.DISLIKE) - (old_value == VoteValue.DISLIKE)
+    return like, dislike
+
+
+def cast_vote(post_id, user_id, value):
+    # Records user_id's vote on post_id and adjusts the Post counters in the
+    # caller's transaction. Returns (old_value, new_value); old_value is None
+    # for a first vote and equals new_value when nothing changed.
+    value = VoteValue(value)
+
+    query = db.session.query(PostVote).filter(
+        PostVote.post_id == post_id, PostVote.user_id == user_id
+    )
+    locked = query.with_for_update().populate_existing()
+
+    # Only an existing vote is locked: a locking read of a missing key takes
+    # a gap lock, and two first votes from one user (a double click) would
+    # then deadlock on each other's INSERT. A first vote relies on the
+    # primary key instead.
+    vote = query.first()
+    if vote is not None:
+        vote = locked.first()
+
+    old_value = None
+    if vote is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(
+                    PostVote(post_id=post_id, user_id=user_id, vote_value=value.value)
+                )
+        except IntegrityError:
+            # A concurrent request inserted the same (post, user) first.
+            vote = locked.one()
+
+    if vote is not None:
+        old_value = VoteValue(vote.vote_value)
+        if old_value == value:
+            return old_value, value
+        vote.vote_value = value.value
+
+    like, dislike = _counter_deltas(old_value, value)
+    db.session.execute(
+        update(Post)
+        .where(Post.post_id == post_id)
+        .values(
+            like_count=Post.like_count + like,
+            dislike_count=Post.dislike_count + dislike,
+            score=Post.score + (like - dislike),
+        )
+    )
+    update_leaderboards(post_id)
+    record_event(post_id, "like" if value == VoteValue.LIKE else "dislike")
+    return old_value, value
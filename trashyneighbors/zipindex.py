@@ -0,0 +1,221 @@
+import hashlib
+import math
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from flask import current_app
+from sqlalchemy import func
+
+from .extensions import db
+from .geo import GeoGrid
+from .models import ReferenceDataset, ZipCodeLocation
+
+ZIP_DATASET_NAME = "zip_code_location"
+
+
+def normalize_zip(zip_code):
+    return (zip_code or "").strip().zfill(5)[:5]
+
+
+class ZipIndex:
+    # Sorted parallel arrays keyed by zip5. A ZIP can map to several
+    # (city, state, county) rows, so lookups return the bisected slice.
+    __slots__ = (
+        "version",
+        "imported_at",
+        "zips",
+        "cities",
+        "states",
+        "counties",
+        "latitudes",
+        "longitudes",
+        "state_city_keys",
+        "state_city_refs",
+        "city_keys",
+        "city_refs",
+        "city_pairs",
+        "state_list",
+        "_grid",
+    )
+
+    def __init__(self, rows, version, imported_at=None):
+        # rows: (zip_code, city, state, county, latitude, longitude)
+        rows = sorted(rows, key=lambda r: (r[0], r[2], r[1], r[3]))
+
+        self.version = version
+        self.imported_at = imported_at
+        self.zips = [sys.intern(r[0]) for r in rows]
+        self.cities = [sys.intern(r[1]) for r in rows]
+        self.states = [sys.intern(r[2]) for r in rows]
+        self.counties = [sys.intern(r[3]) for r in rows]
+        self.latitudes = array(
+            "d", (float(r[4]) if r[4] is not None else math.nan for r in rows)
+        )
+        self.longitudes = array(
+            "d", (float(r[5]) if r[5] is not None else math.nan for r in rows)
+        )
+
+        # Distinct (state, city) pairs, sorted two ways so both
+        # "state + city prefix" and "city prefix anywhere" are a bisect.
+        pairs = sorted({(r[2], r[1]) for r in rows})
+        by_state = sorted(
+            (f"{st}\x00{city.casefold()}", i) for i, (st, city) in enumerate(pairs)
+        )
+        by_city = sorted(
+            (f"{city.casefold()}\x00{st}", i) for i, (st, city) in enumerate(pairs)
+        )
+
+        self.city_pairs = [(sys.intern(st), sys.intern(city)) for st, city in pairs]
+        self.state_city_keys = [k for k, _ in by_state]
+        self.state_city_refs = array("I", (i for _, i in by_state))
+        self.city_keys = [k for k, _ in by_city]
+        self.city_refs = array("I", (i for _, i in by_city))
+        self.state_list = sorted({r[2] for r in rows})
+        self._grid = None
+
+    def __len__(self):
+        return len(self.zips)
+
+    def row(self, i):
+        lat = self.latitudes[i]
+        lon = self.longitudes[i]
+        return {
+            "city": self.cities[i],
+            "state": self.states[i],
+            "county": self.counties[i],
+            "latitude": None if math.isnan(lat) else lat,
+            "longitude": None if math.isnan(lon) else lon,
+        }
+
+    def lookup(self, zip_code):
+        lo = bisect_left(self.zips, zip_code)
+        hi = bisect_right(self.zips, zip_code, lo)
+        return [self.row(i) for i in range(lo, hi)]
+
+    def nearest(self, latitude, longitude, max_mi=100.0):
+        grid = self._grid
+        if grid is None:
+            # Several rows can share one ZIP centroid; index each ZIP once.
+            points = []
+            last_zip = None
+            for i, zip_code in enumerate(self.zips):
+                lat = self.latitudes[i]
+                lon = self.longitudes[i]
+                if zip_code == last_zip or math.isnan(lat) or math.isnan(lon):
+                    continue
+                last_zip = zip_code
+                points.append((lat, lon, i))
+            grid = self._grid = GeoGrid(points)
+
+        hit = grid.nearest(latitude, longitude, max_mi=max_mi)
+        if hit is None:
+            return None
+
+        i, distance = hit
+        result = {"zip_code": self.zips[i], "distance_mi": round(distance, 3)}
+        result.update(self.row(i))
+        return result
+
+    def zip_prefix(self, partial, limit):
+        out = []
+        i = bisect_left(self.zips, partial)
+        n = len(self.zips)
+        while i < n and len(out) < limit and self.zips[i].startswith(partial):
+            out.append(
+                {
+                    "zip_code": self.zips[i],
+                    "city": self.cities[i],
+                    "state": self.states[i],
+                }
+            )
+            i += 1
+        return out
+
+    def city_prefix(self, q, limit, state=None):
+        q = q.casefold()
+        if state:
+            keys, refs = self.state_city_keys, self.state_city_refs
+            prefix = f"{state}\x00{q}"
+        else:
+            keys, refs = self.city_keys, self.city_refs
+            prefix = q
+
+        out = []
+        i = bisect_left(keys, prefix)
+        n = len(keys)
+        while i < n and len(out) < limit and keys[i].startswith(prefix):
+            st, city = self.city_pairs[refs[i]]
+            out.append({"city": city, "state": st})
+            i += 1
+        return out
+
+    def state_prefix(self, q, limit):
+        q = q.upper()
+        out = []
+        i = bisect_left(self.state_list, q)
+        n = len(self.state_list)
+        while i < n and len(out) < limit and self.state_list[i].startswith(q):
+            out.append(self.state_list[i])
+            i += 1
+        return out
+
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+
+def _current_version():
+    row = (
+        db.session.query(ReferenceDataset.version_hash, ReferenceDataset.imported_at)
+        .filter(ReferenceDataset.dataset_name == ZIP_DATASET_NAME)
+        .first()
+    )
+    if row is not None:
+        return row.version_hash, row.imported_at
+
+    # Tables imported before reference_dataset existed carry no stamp.
+    count, max_zip = db.session.query(
+        func.count(), func.max(ZipCodeLocation.zip_code)
+    ).one()
+    stamp = f"{count}:{max_zip or ''}".encode("utf-8")
+    return hashlib.sha256(stamp).hexdigest(), None
+
+
+def _load_index(version, imported_at):
+    rows = db.session.query(
+        ZipCodeLocation.zip_code,
+        ZipCodeLocation.city,
+        ZipCodeLocation.state,
+        ZipCodeLocation.county,
+        ZipCodeLocation.latitude,
+        ZipCodeLocation.longitude,
+    ).all()
+    return ZipIndex(rows, version, imported_at)
+
+
+def get_zip_index():
+    global _index, _checked_at
+
+    recheck = current_app.config["TRASHYNEIGHBORS_ZIP_INDEX_RECHECK_SECONDS"]
+
+    index = _index
+    if index is not None and time.monotonic() - _checked_at < recheck:
+        return index
+
+    with _lock:
+        if _index is not None and time.monotonic() - _checked_at < recheck:
+            return _index
+
+        version, imported_at = _current_version()
+        if _index is None or _index.version != version:
+            _index = _load_index(version, imported_at)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def reverse_geocode(latitude, longitude, max_mi=100.0):
+    return get_zip_index().nearest(latitude, longitude, max_mi=max_mi)
@@ -42803,5 +42803,17 @@ INSERT INTO zip_code_location (zip_code, latitude, longitude, city, state, count
 ('99929', 56.449893, -132.364407, 'Wrangell', 'AK', 'Wrangell Petersburg'),
 ('99950', 55.542007, -131.432682, 'Ketchikan', 'AK', 'Ketchikan Gateway');
 
+CREATE TABLE IF NOT EXISTS reference_dataset (
+  dataset_name VARCHAR(64) NOT NULL,
+  version_hash VARCHAR(64) NOT NULL,
+  row_count INT NOT NULL,
+  imported_at DATETIME NOT NULL,
+  PRIMARY KEY (dataset_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO reference_dataset (dataset_name, version_hash, row_count, imported_at) VALUES
+('zip_code_location', '16fd27a85b2d803530e147074e7d47b64f4d1f392fabc09e6169e85f060488f3', 42741, UTC_TIMESTAMP())
+ON DUPLICATE KEY UPDATE version_hash = VALUES(version_hash), row_count = VALUES(row_count), imported_at = VALUES(imported_at);
+
 COMMIT;
 SET FOREIGN_KEY_CHECKS=1;